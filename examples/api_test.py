@@ -40,15 +40,15 @@ async def main():
     print("battery level:" + str(lvl))
     
     print("LED:")
-    #color = LED_LABEL[await btSmart.get_led()]
-    #print("color", color)
+    color = LED_LABEL[await btSmart.get_led()]
+    print("color", color)
     
     for led in [LEDMode.BLUE, LEDMode.GREEN, LEDMode.YELLOW]:
         print("setting to", LED_LABEL[led], "...")
         await btSmart.set_led(led)
         await asyncio.sleep(0.5)
-        #color = LED_LABEL[await btSmart.get_led()]
-        #print("color", color)
+        color = LED_LABEL[await btSmart.get_led()]
+        print("color", color)
 
     print("Reading inputs...")
     for i in Input.all():
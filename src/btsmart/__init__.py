@@ -4,26 +4,50 @@ __author__ = """Rainer Neumann"""
 __email__ = "rainer.neumann@h-ka.de"
 
 import asyncio
+import os
 
-from .controller import BTSmartController, LEDMode, LED_LABEL, Input, InputMode, INPUT_MODE_LABEL, InputMeasurement, Output
+from .controller import BTSmartController, LEDMode, LED_LABEL, LED_BY_CODE, Input, InputMode, INPUT_MODE_LABEL, INPUT_MODE_BY_CODE, InputMeasurement, InputSample, Output
+from .scheduler import TimerWheel, TimerHandle
+from .waveform import Waveform, Ramp, Sine, PWM, SampleTable, LINEAR, EASE_IN, EASE_OUT, EASE_IN_OUT
 from .parts import ElectronicsPart, InputPart, OutputPart, Button, LightBarrier, Dimmer, MotorXS
 
+from .reconnect import ReconnectSupervisor, ReconnectReport
+from .health import LinkHealthMonitor, HealthEvent
+from .stream import SampleSink, InputStream
+from .timesync import aligned_snapshot, AlignedSnapshot
+from .watchdog import SafetyWatchdog, WatchdogEvent
+from .rules import RuleEngine, Rule, Condition, Above, Below, Between, Rising, Falling, All, Any, Not, SetOutput, SetLED
+from .control import ControlLoop, ControlStats, PID
+
 from .backend_ble import BTSmartController_BLE
 from .backend_usb import BTSmartController_USB
+from .backend_remote import BTSmartController_Remote, REMOTE_ENV
+from .backend_sim import BTSmartController_Sim
+from .capture import Capture, CaptureReader, CaptureRecord
+from .server import ControllerServer
+from .shm import SharedStatePublisher, BTSmartController_SharedView
+from .fleet import ControllerFleet
+from .sync import SyncController, SyncProxy
 
-async def discover_controller(viaUSB: bool = True, viaBLE: bool = True) -> BTSmartController:
-    """Tries to discover an attached BTSmartController either via USB or via BLE
+async def discover_controller(viaUSB: bool = True, viaBLE: bool = True, remote: str = None) -> BTSmartController:
+    """Tries to discover an attached BTSmartController either via a controller server, via USB or via BLE
 
     Args:
         viaUSB (bool, optional): Should USB-Lookup be performed. Defaults to True.
         viaBLE (bool, optional): Should BLE-Lookup be performed. Defaults to True.
+        remote (str, optional): the address of a controller server ("unix:/path" or "host:port") to be tried first.
+            Defaults to the BTSMART_REMOTE environment variable - if neither is set (or remote is ""), no server is looked up.
 
     Returns:
         BTSmartController: the found controller instance or None
     """
     print("searching for BT-Smart Controller...")
     ctrl: BTSmartController = None
-    if viaUSB:
+    if remote is None:
+        remote = os.environ.get(REMOTE_ENV)
+    if remote:
+        ctrl = await BTSmartController_Remote.discover(remote)
+    if (ctrl is None) and viaUSB:
         ctrl = await BTSmartController_USB.discover()
         #print ("USB:", ctrl)
     if (ctrl is None) and viaBLE:
@@ -0,0 +1,44 @@
+"""
+Command line interface of the btsmart package.
+
+    btsmart serve [--usb | --ble] [--address ADDRESS]
+
+"""
+
+import argparse
+import asyncio
+
+from . import discover_controller
+from .backend_remote import DEFAULT_PORT
+from .server import ControllerServer
+
+
+async def _serve(args) -> None:
+    ctrl = await discover_controller(viaUSB=not args.ble, viaBLE=not args.usb, remote="")
+    if ctrl is None:
+        return
+    server = ControllerServer(ctrl, args.address)
+    try:
+        await server.serve_forever()
+    finally:
+        await ctrl.disconnect()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="btsmart", description="Tools for the Fischertechnik BT-Smart Controller")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="own a controller and share it with other processes")
+    transport = serve.add_mutually_exclusive_group()
+    transport.add_argument("--usb", action="store_true", help="only look for a controller attached via USB")
+    transport.add_argument("--ble", action="store_true", help="only look for a controller via BLE")
+    serve.add_argument("--address", default="127.0.0.1:" + str(DEFAULT_PORT), help="'host:port' or 'unix:/path' to listen at (default: %(default)s)")
+    args = parser.parse_args()
+    if args.command == "serve":
+        try:
+            asyncio.run(_serve(args))
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
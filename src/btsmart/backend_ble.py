@@ -1,9 +1,12 @@
 import asyncio
+import heapq
+import time
 
 from enum import Enum
 from bleak import BleakScanner, BleakClient, BleakGATTCharacteristic, BLEDevice, AdvertisementData
 
 from .controller import LEDMode, Input, Output, InputMode, INPUT_MODE_UNIT, InputMeasurement, BTSmartController
+from .capture import GATT_READ, GATT_WRITE, GATT_NOTIFY
 
 
 BT_SMART_GATT_UUIDs = {
@@ -60,9 +63,142 @@ BT_SMART_GATT_UUIDs = {
     }
 }
 
+<<<<<<< HEAD
+_OUTPUT_UUIDS = frozenset(BT_SMART_GATT_UUIDs["output"]["characteristics"].values())
+=======
+_INPUT_BY_UUID = {uuid: input for input, uuid in BT_SMART_GATT_UUIDs["input"]["characteristics"].items()}
+>>>>>>> 42b1a66 ([user-041] Use tuple sample types and lookup tables for wire decoding)
+
+
+PRIORITY_SAFETY = -1
+"""GATT operation priority: safety stop of the outputs (see btsmart.watchdog)"""
+
+PRIORITY_ACTUATOR = 0
+"""GATT operation priority: output writes (e.g. stopping a motor)"""
+
+PRIORITY_MODE = 1
+"""GATT operation priority: input mode configuration"""
+
+PRIORITY_SENSOR = 2
+"""GATT operation priority: reading input values"""
+
+PRIORITY_HOUSEKEEPING = 3
+"""GATT operation priority: battery level, device information, LED"""
+
+
+class _GattOperation:
+    __slots__ = ("uuid", "data", "response", "future", "enqueued", "started")
+
+    def __init__(self, uuid, data, response: bool, future: asyncio.Future) -> None:
+        self.uuid = uuid
+        self.data = data  # None for reads
+        self.response = response
+        self.future = future
+        self.enqueued = time.perf_counter()
+        self.started = False
+
+
+class _GattScheduler:
+    """Queues the GATT operations of a controller by priority and limits the number of operations in flight.
+    Pending reads of the same characteristic are merged into one request."""
+
+    def __init__(self, ctrl, max_in_flight: int) -> None:
+        if max_in_flight < 1:
+            raise Exception("max_in_flight must be at least 1")
+        self._ctrl = ctrl
+        self.max_in_flight = max_in_flight
+        self._queue = []
+        self._seq = 0
+        self._in_flight = 0
+        self._pending_reads = dict()
+        self.wait_stats = {p: [0, 0.0, 0.0] for p in (PRIORITY_SAFETY, PRIORITY_ACTUATOR, PRIORITY_MODE, PRIORITY_SENSOR, PRIORITY_HOUSEKEEPING)}
+
+    def _push(self, priority: int, op: _GattOperation) -> None:
+        self._seq = self._seq + 1
+        heapq.heappush(self._queue, (priority, self._seq, op))
+        self._dispatch()
+
+    def read(self, uuid, priority: int) -> asyncio.Future:
+        op = self._pending_reads.get(uuid)
+        if op is None:
+            op = _GattOperation(uuid, None, True, asyncio.get_running_loop().create_future())
+            self._pending_reads[uuid] = op
+        # a second entry for a merged read lets it move up if the new request has a higher priority
+        self._push(priority, op)
+        return op.future
+
+    def write(self, uuid, data, response: bool, priority: int) -> asyncio.Future:
+        op = _GattOperation(uuid, data, response, asyncio.get_running_loop().create_future())
+        self._push(priority, op)
+        return op.future
+
+    def purge_outputs(self) -> int:
+        """fails all output writes that have not been started yet (used by the safety stop)
+
+        Returns:
+            int: the number of purged writes
+        """
+        purged = 0
+        for priority, _, op in self._queue:
+            if not op.started and op.data is not None and op.uuid in _OUTPUT_UUIDS:
+                op.started = True
+                purged += 1
+                if not op.future.done():
+                    op.future.set_exception(Exception("output write discarded by a safety stop"))
+        return purged
+
+    def _dispatch(self) -> None:
+        while self._in_flight < self.max_in_flight and self._queue:
+            priority, _, op = heapq.heappop(self._queue)
+            if op.started:
+                continue
+            op.started = True
+            if op.data is None and self._pending_reads.get(op.uuid) is op:
+                del self._pending_reads[op.uuid]
+            if op.future.done():
+                # the caller has been cancelled (e.g. a stopped waveform) - a stale write must not be performed
+                continue
+            if op.data is not None and op.uuid in _OUTPUT_UUIDS and any(op.data) and self._ctrl._safety_latched:
+                # queued before the latch was set - must not restart the output after the safety stop
+                op.future.set_exception(Exception("outputs are latched by a safety stop"))
+                continue
+            wait = time.perf_counter() - op.enqueued
+            stats = self.wait_stats[priority]
+            stats[0] = stats[0] + 1
+            stats[1] = stats[1] + wait
+            stats[2] = max(stats[2], wait)
+            self._in_flight = self._in_flight + 1
+            asyncio.get_running_loop().create_task(self._execute(op))
+
+    async def _execute(self, op: _GattOperation) -> None:
+        trace = self._ctrl._trace
+        start = time.monotonic_ns()
+        try:
+            client = self._ctrl.client
+            if op.data is None:
+                res = await client.read_gatt_char(op.uuid)
+                if trace is not None:
+                    trace(GATT_READ, True, start, time.monotonic_ns() - start, op.uuid, b'', bytes(res))
+            else:
+                res = await client.write_gatt_char(op.uuid, op.data, response=op.response)
+                if trace is not None:
+                    trace(GATT_WRITE, True, start, time.monotonic_ns() - start, op.uuid, bytes(op.data), b'')
+            if not op.future.done():
+                op.future.set_result(res)
+        except Exception as ex:
+            if trace is not None:
+                trace(GATT_READ if op.data is None else GATT_WRITE, False, start, time.monotonic_ns() - start, op.uuid, bytes(op.data or b''), b'')
+            if not op.future.done():
+                op.future.set_exception(ex)
+        finally:
+            self._in_flight = self._in_flight - 1
+            self._dispatch()
+
+
+def _log_rule_write(future: asyncio.Future) -> None:
+    if not future.cancelled() and future.exception() is not None:
+        print("error in rule write:", future.exception())
 
-class BTSmartController_BLE(BTSmartController):
-    pass
 
 class BTSmartController_BLE(BTSmartController):
     """This class represents a BTSmart-Controller, connected via BLE"""
@@ -70,11 +206,13 @@ class BTSmartController_BLE(BTSmartController):
     class _BLEScanner:
         def __init__(self):
             self._device = None
+            self._devices = dict()
             self._scanner = None
         
         async def _device_detected(self, device: BLEDevice, adv: AdvertisementData):
             if device.name == 'BT Smart Controller':
                 self._device = device
+                self._devices[device.address] = device
 
         async def _scan(self):
             self.scanner = BleakScanner(self._device_detected)
@@ -86,6 +224,13 @@ class BTSmartController_BLE(BTSmartController):
             await self.scanner.stop()
             return self._device
 
+        async def _scan_all(self, timeout: float):
+            self.scanner = BleakScanner(self._device_detected)
+            await self.scanner.start()
+            await asyncio.sleep(timeout)
+            await self.scanner.stop()
+            return list(self._devices.values())
+
     async def discover() -> BTSmartController:
         """Start discovery of bluetooth devices and try to find a BT-Smart Controller
 
@@ -101,14 +246,33 @@ class BTSmartController_BLE(BTSmartController):
             print("found", btSmartDevice.name, "-", btSmartDevice.address)
             return BTSmartController_BLE(btSmartDevice)
 
-    def __init__(self, device) -> None:
+    async def discover_all(timeout: float = 5.0) -> list:
+        """Scans for bluetooth devices for the given time and collects all BT-Smart Controllers
+
+        Args:
+            timeout (float, optional): the scan duration in seconds. Defaults to 5.0.
+
+        Returns:
+            list: the found controllers (not yet connected)
+        """
+        scanner = BTSmartController_BLE._BLEScanner()
+        devices = await scanner._scan_all(timeout)
+        return [BTSmartController_BLE(device) for device in devices]
+
+    def __init__(self, device, max_in_flight: int = 1) -> None:
         """Initializes the controller instance using the detected device.
 
         Args:
             device (BLEDevice): the device
+            max_in_flight (int, optional): the maximum number of GATT operations that are executed at the same time. Defaults to 1.
         """
         super().__init__()
+        self._gatt = _GattScheduler(self, max_in_flight)
+        self.address = device.address
+        """the address of the device - used to reconnect"""
+        self.id = "ble:" + device.address
         self.client = BleakClient(device, disconnected_callback=self._disconnect_cb)
+        self._subscribed = set()  # inputs with active notifications
 
     async def _handle_input_change(self, characteristic: BleakGATTCharacteristic, data: bytearray) -> None:
         """callback that is called after a notifyable characteristic in the BLE Device changed.
@@ -118,13 +282,14 @@ class BTSmartController_BLE(BTSmartController):
             characteristic (BleakGATTCharacteristic): the changed characteristic
             data (bytearray): the new data of the characteristic
         """
-        value = int.from_bytes(data, 'little', signed=False)
-        #print("i changed", BT_SMART_GATT_UUIDs["input"]["characteristics"].items())
-        for input, uuid in BT_SMART_GATT_UUIDs["input"]["characteristics"].items():
-            #print("checking: ", input, uuid, characteristic.uuid)
-            if characteristic.uuid == uuid:
-                #print("found: ", input)
-                await self._on_input_value_changed(input, value)
+        ts = time.monotonic_ns()
+        if self._trace is not None:
+            self._trace(GATT_NOTIFY, True, ts, 0, characteristic.uuid, b'', bytes(data))
+        input = _INPUT_BY_UUID.get(characteristic.uuid)
+        if input is not None:
+            value = int.from_bytes(data, 'little', signed=False)
+            self._publish_sample(input, value, ts)
+            await self._on_input_value_changed(input, value)
 
     def is_connected(self) -> bool:
         """indicates whether or not the controller is currently connected
@@ -143,25 +308,49 @@ class BTSmartController_BLE(BTSmartController):
         Returns:
             bool: True after the connection has been established
         """
+        self._user_disconnect = False
         if not self.is_connected():
             await self.client.connect()
         if self.is_connected():
             await self.reset()
             for input in Input.all():
-                measureUuid = BT_SMART_GATT_UUIDs["input"]["characteristics"][input]
-                try:
-                    await self.client.start_notify(measureUuid, self._handle_input_change)
-                except:
-                    pass
+                await self._subscribe(input)
             return True
         else:
             raise Exception("unable to connect")
 
+    async def _subscribe(self, input: Input) -> None:
+        """starts the notifications for the given input"""
+        measureUuid = BT_SMART_GATT_UUIDs["input"]["characteristics"][input]
+        try:
+            await self.client.start_notify(measureUuid, self._handle_input_change)
+            self._subscribed.add(input)
+        except:
+            pass
+
     async def disconnect(self) -> None:
         """disconnects the controller from the BLE device"""
+        self._user_disconnect = True
         if self.is_connected():
             await self.client.disconnect()
 
+    async def _reopen(self) -> None:
+        """reconnects to the known address using a fresh client"""
+        if not self.is_connected():
+            self.client = BleakClient(self.address, disconnected_callback=self._disconnect_cb)
+            await self.client.connect()
+        if not self.is_connected():
+            raise Exception("unable to connect")
+
+    def _restore_operations(self) -> list:
+        """besides the device state, the notifications of the previously subscribed inputs are restored"""
+        ops = super()._restore_operations()
+        inputs = self._subscribed.copy()
+        self._subscribed.clear()
+        for input in inputs:
+            ops.append(self._subscribe(input))
+        return ops
+
     async def _autoconnect(self) -> None:
         """convenience-method that checks if we should automatically connect to the device (ad-hoc) and optionally connects"""
         if not self.is_connected():
@@ -170,14 +359,19 @@ class BTSmartController_BLE(BTSmartController):
             else:
                 raise Exception("Device not connected")
 
-    async def _read_gatt_char(self, uuid) -> bytes:
-        res = await self.client.read_gatt_char(uuid)
-        #print("r:", uuid, " -> ", res)
-        return res
+    async def _read_gatt_char(self, uuid, priority: int = PRIORITY_SENSOR) -> bytes:
+        return await asyncio.shield(self._gatt.read(uuid, priority))
+
+    async def _write_gatt_char(self, uuid, bytes, response: bool = True, priority: int = PRIORITY_ACTUATOR):
+        await self._gatt.write(uuid, bytes, response, priority)
 
-    async def _write_gatt_char(self, uuid, bytes, response: bool = True):
-        #print("w:", uuid, " -> ", bytes)
-        await self.client.write_gatt_char(uuid, bytes, response=True)
+    def queue_wait_times(self) -> dict[int, tuple[int, float, float]]:
+        """returns the time GATT operations waited in the queue per priority class
+
+        Returns:
+            dict[int, tuple[int, float, float]]: the number of operations, the mean and the maximum wait time in seconds per priority
+        """
+        return {p: (n, total / n if n > 0 else 0.0, longest) for p, (n, total, longest) in self._gatt.wait_stats.items()}
 
     async def get_device_information(self) -> dict[str, str]:
         """retrieves device information from the attached BT-Smart Controller
@@ -189,7 +383,7 @@ class BTSmartController_BLE(BTSmartController):
         res = dict()
         for key, uuid in BT_SMART_GATT_UUIDs["device_info"]["characteristics"].items():
             try:
-                res[key] = await self._read_gatt_char(uuid)
+                res[key] = await self._read_gatt_char(uuid, PRIORITY_HOUSEKEEPING)
             except:
                 pass
         return res
@@ -202,7 +396,7 @@ class BTSmartController_BLE(BTSmartController):
         """
         await self._autoconnect()
         uuid = BT_SMART_GATT_UUIDs["battery"]["characteristics"]["level"]
-        m_bts = await self._read_gatt_char(uuid)
+        m_bts = await self._read_gatt_char(uuid, PRIORITY_HOUSEKEEPING)
         value = int.from_bytes(m_bts, 'little', signed=False)
         return value
 
@@ -214,7 +408,9 @@ class BTSmartController_BLE(BTSmartController):
         """
         ledUuid = BT_SMART_GATT_UUIDs["led"]["characteristics"]["color"]
         bts = led.value
-        await self._write_gatt_char(ledUuid, bts)
+        await self._write_gatt_char(ledUuid, bts, priority=PRIORITY_HOUSEKEEPING)
+        self._led = led
+        self._state_changed()
 
     async def get_led(self) -> LEDMode:
         """get the currently used LED
@@ -223,7 +419,7 @@ class BTSmartController_BLE(BTSmartController):
             LEDMode: the currently used LED
         """
         ledUuid = BT_SMART_GATT_UUIDs["led"]["characteristics"]["color"]
-        bts = await self._read_gatt_char(ledUuid)
+        bts = await self._read_gatt_char(ledUuid, PRIORITY_HOUSEKEEPING)
         led = LEDMode.from_bytes(bts)
         return led
 
@@ -232,12 +428,14 @@ class BTSmartController_BLE(BTSmartController):
         unitUuid = BT_SMART_GATT_UUIDs["input_mode"]["characteristics"][input]
         u_val: int = unit.value
         u_bts = u_val.to_bytes(1, 'little')
-        await self._write_gatt_char(unitUuid, u_bts)
+        await self._write_gatt_char(unitUuid, u_bts, priority=PRIORITY_MODE)
+        self._input_modes[input] = unit
+        self._state_changed()
 
     async def get_input_mode(self, input: Input) -> InputMode:
         """retrieves the currently set input mode of the given input"""
         unitUuid = BT_SMART_GATT_UUIDs["input_mode"]["characteristics"][input]
-        u_bts = await self._read_gatt_char(unitUuid)
+        u_bts = await self._read_gatt_char(unitUuid, PRIORITY_MODE)
         return InputMode.from_bytes(u_bts)
 
     async def get_input_value(self, input: Input, mode: InputMode = None) -> InputMeasurement:
@@ -269,11 +467,44 @@ class BTSmartController_BLE(BTSmartController):
         Raises:
             Exception: if the value is invalid 
         """
-        if value < int(-100) or value > int(100):
-            raise Exception("output must be in -100..100")
+        self._check_output(value)
         char_uuid = BT_SMART_GATT_UUIDs["output"]["characteristics"][output]
         bts = value.to_bytes(1, 'little', signed=True)
         await self._write_gatt_char(char_uuid, bts)
+        self._output_values[output] = value
+        self._state_changed()
+
+    async def set_output_values(self, values: dict[Output, int]) -> None:
+        """sets several outputs at once - the writes of the different characteristics are issued concurrently
+
+        Args:
+            values (dict[Output, int]): the values to be set per output (must be in the range -100..100)
+
+        Raises:
+            Exception: if one of the values is invalid
+        """
+        await asyncio.gather(*[self.set_output_value(output, value) for output, value in values.items()])
+
+    def _rule_write(self, outputs: dict[Output, int], led: LEDMode) -> None:
+        """queues the writes with actuator priority right from the notification handler"""
+        for output, value in outputs.items():
+            uuid = BT_SMART_GATT_UUIDs["output"]["characteristics"][output]
+            self._gatt.write(uuid, value.to_bytes(1, 'little', signed=True), True, PRIORITY_ACTUATOR).add_done_callback(_log_rule_write)
+        if led is not None:
+            uuid = BT_SMART_GATT_UUIDs["led"]["characteristics"]["color"]
+            self._gatt.write(uuid, led.value, True, PRIORITY_ACTUATOR).add_done_callback(_log_rule_write)
+
+    def _emergency_stop(self, loop: asyncio.AbstractEventLoop, timeout: float) -> None:
+        """queues the stop writes ahead of all other GATT operations - bleak needs the event loop to perform them"""
+        async def stop():
+            # writes queued before the latch was set would be performed after the stop writes
+            self._gatt.purge_outputs()
+            writes = []
+            for output, uuid in BT_SMART_GATT_UUIDs["output"]["characteristics"].items():
+                writes.append(self._write_gatt_char(uuid, b'\x00', priority=PRIORITY_SAFETY))
+                self._output_values[output] = 0
+            await asyncio.gather(*writes)
+        asyncio.run_coroutine_threadsafe(stop(), loop).result(timeout)
 
     async def get_output_value(self, output: Output) -> int:
         """retrieves the current output value
@@ -285,6 +516,6 @@ class BTSmartController_BLE(BTSmartController):
             int: the value that is currently set for the output
         """
         char_uuid = BT_SMART_GATT_UUIDs["output"]["characteristics"][output]
-        bts = await self._read_gatt_char(char_uuid)
+        bts = await self._read_gatt_char(char_uuid, PRIORITY_HOUSEKEEPING)
         value = int.from_bytes(bts, 'little', signed=True)
         return value
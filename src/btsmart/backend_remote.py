@@ -0,0 +1,230 @@
+"""
+This module provides access to a controller that is owned by another process (see btsmart.server).
+
+Client and server talk a compact binary protocol over a local socket (TCP or unix domain socket).
+Each frame consists of a fixed header (kind, operation, request id, payload length) followed by
+the payload. Requests may be pipelined - replies are matched by their request id. Input samples
+of subscribed inputs are pushed by the server as event frames.
+
+"""
+
+import asyncio
+import json
+import os
+import struct
+
+from .controller import LEDMode, Input, Output, InputMode, InputMeasurement, BTSmartController
+
+
+DEFAULT_PORT = 47011
+"""the default TCP port of the controller server"""
+
+REMOTE_ENV = "BTSMART_REMOTE"
+"""environment variable holding the address of a controller server used by discover_controller()"""
+
+_HEADER = struct.Struct('<BBHH')  # kind, operation, request id, payload length
+
+_KIND_REQUEST = 1
+_KIND_REPLY = 2
+_KIND_ERROR = 3
+_KIND_EVENT = 4
+
+_RID_UNSOLICITED = 0  # request id of frames nobody waits for (e.g. pushed samples) - never used by _request
+
+_OP_HELLO = 0
+_OP_SET_LED = 1
+_OP_GET_LED = 2
+_OP_SET_INPUT_MODE = 3
+_OP_GET_INPUT_MODE = 4
+_OP_GET_INPUT_VALUE = 5
+_OP_SET_OUTPUT = 6
+_OP_GET_OUTPUT = 7
+_OP_GET_BATTERY = 8
+_OP_GET_DEVICE_INFO = 9
+_OP_SUBSCRIBE = 10
+_OP_RELEASE_OUTPUT = 11
+_OP_SAMPLE = 12
+
+_U8 = struct.Struct('<B')
+_I8 = struct.Struct('<b')
+_U8U8 = struct.Struct('<BB')
+_U8I8 = struct.Struct('<Bb')
+_MEASUREMENT = struct.Struct('<HB')  # value, mode
+_SAMPLE = struct.Struct('<BHq')  # input, value, timestamp
+
+_NO_MODE = 0xFF
+
+_LEDS = list(LEDMode)
+
+
+def _frame(kind: int, op: int, rid: int, payload: bytes = b'') -> bytes:
+    return _HEADER.pack(kind, op, rid, len(payload)) + payload
+
+
+def _parse_address(address: str) -> tuple:
+    """parses "unix:/path", "host:port" or "host" into ("unix", path) or ("tcp", host, port)"""
+    if address.startswith("unix:"):
+        return ("unix", address[5:])
+    host, _, port = address.rpartition(":")
+    if host == "" or not port.isdigit():
+        return ("tcp", address, DEFAULT_PORT)
+    return ("tcp", host, int(port))
+
+
+async def _open_connection(address: str):
+    parsed = _parse_address(address)
+    if parsed[0] == "unix":
+        return await asyncio.open_unix_connection(parsed[1])
+    return await asyncio.open_connection(parsed[1], parsed[2])
+
+
+class BTSmartController_Remote(BTSmartController):
+    """This class represents a BTSmart-Controller that is owned by a controller server (see btsmart.server)"""
+
+    async def discover(address: str = None) -> BTSmartController:
+        """Checks if a controller server is reachable at the given address
+
+        Args:
+            address (str, optional): "unix:/path", "host:port" or "host". Defaults to the BTSMART_REMOTE environment variable or localhost.
+
+        Returns:
+            BTSmartController: the controller or None
+        """
+        if address is None:
+            address = os.environ.get(REMOTE_ENV, "127.0.0.1:" + str(DEFAULT_PORT))
+        ctrl = BTSmartController_Remote(address)
+        try:
+            await ctrl._reopen()
+        except Exception:
+            return None
+        return ctrl
+
+    def __init__(self, address: str) -> None:
+        """Initializes the controller instance for the given server address
+
+        Args:
+            address (str): "unix:/path", "host:port" or "host"
+        """
+        super().__init__()
+        self.address = address
+        self._reader: asyncio.StreamReader = None
+        self._writer: asyncio.StreamWriter = None
+        self._task: asyncio.Task = None
+        self._pending = dict()
+        self._rid = 0
+
+    def is_connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def connect(self) -> bool:
+        """connects to the server. In contrast to the other backends, the device is not reset since it is shared."""
+        self._user_disconnect = False
+        if not self.is_connected():
+            await self._reopen()
+        await self._resume()
+        return True
+
+    async def _reopen(self) -> None:
+        self._reader, self._writer = await _open_connection(self.address)
+        self._task = asyncio.get_running_loop().create_task(self._read_frames(), name='BTSmartController remote')
+        self.id = (await self._request(_OP_HELLO)).decode('utf-8')
+
+    async def _resume(self) -> None:
+        await self._request(_OP_SUBSCRIBE, _U8.pack(0x0F))
+
+    async def disconnect(self) -> None:
+        self._user_disconnect = True
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    async def _read_frames(self) -> None:
+        reader = self._reader
+        try:
+            while True:
+                kind, op, rid, n = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+                payload = await reader.readexactly(n) if n > 0 else b''
+                if kind == _KIND_EVENT:
+                    input_num, value, ts = _SAMPLE.unpack(payload)
+                    input = Input(input_num)
+                    self._publish_sample(input, value, ts)
+                    asyncio.create_task(self._on_input_value_changed(input, value))
+                    continue
+                future = self._pending.pop(rid, None)
+                if future is None or future.done():
+                    continue
+                if kind == _KIND_REPLY:
+                    future.set_result(payload)
+                else:
+                    future.set_exception(Exception(payload.decode('utf-8')))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(Exception("connection to controller server lost"))
+            self._pending.clear()
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            self._disconnect_cb(None)
+
+    async def _request(self, op: int, payload: bytes = b'') -> bytes:
+        if self._writer is None:
+            raise Exception("Device not connected")
+        self._rid = self._rid % 0xFFFF + 1  # 1..0xFFFF - skips _RID_UNSOLICITED
+        future = asyncio.get_running_loop().create_future()
+        self._pending[self._rid] = future
+        self._writer.write(_frame(_KIND_REQUEST, op, self._rid, payload))
+        return await future
+
+    async def get_device_information(self) -> dict[str, str]:
+        return json.loads(await self._request(_OP_GET_DEVICE_INFO))
+
+    async def get_battery_level(self) -> int:
+        return _U8.unpack(await self._request(_OP_GET_BATTERY))[0]
+
+    async def set_led(self, led: LEDMode) -> None:
+        await self._request(_OP_SET_LED, _U8.pack(_LEDS.index(led)))
+        self._led = led
+        self._state_changed()
+
+    async def get_led(self) -> LEDMode:
+        return _LEDS[_U8.unpack(await self._request(_OP_GET_LED))[0]]
+
+    async def set_input_mode(self, input: Input, mode: InputMode) -> None:
+        await self._request(_OP_SET_INPUT_MODE, _U8U8.pack(input.value, mode.value))
+        self._input_modes[input] = mode
+        self._state_changed()
+
+    async def get_input_mode(self, input: Input) -> InputMode:
+        return InputMode(_U8.unpack(await self._request(_OP_GET_INPUT_MODE, _U8.pack(input.value)))[0])
+
+    async def get_input_value(self, input: Input, mode: InputMode = None) -> InputMeasurement:
+        m = _NO_MODE if mode is None else mode.value
+        value, unit = _MEASUREMENT.unpack(await self._request(_OP_GET_INPUT_VALUE, _U8U8.pack(input.value, m)))
+        return InputMeasurement(value, None if unit == _NO_MODE else InputMode(unit))
+
+    async def set_output_value(self, output: Output, value: int) -> None:
+        """sets the output value. The server grants an output to one client at a time - the output is owned by
+        the first client that sets a non-zero value until it is released (see release_output) or the client disconnects.
+        Setting an output to 0 is always allowed.
+
+        Raises:
+            Exception: if the value is invalid or the output is owned by another client
+        """
+        self._check_output(value)
+        await self._request(_OP_SET_OUTPUT, _U8I8.pack(output.value, value))
+        self._output_values[output] = value
+        self._state_changed()
+
+    async def release_output(self, output: Output) -> None:
+        """releases the ownership of the given output, so other clients are able to set it
+
+        Args:
+            output (Output): the output
+        """
+        await self._request(_OP_RELEASE_OUTPUT, _U8.pack(output.value))
+
+    async def get_output_value(self, output: Output) -> int:
+        return _I8.unpack(await self._request(_OP_GET_OUTPUT, _U8.pack(output.value)))[0]
@@ -0,0 +1,174 @@
+"""
+This module provides a simulated controller that works without a device, e.g. for tests, soak runs
+and offline debugging.
+
+Input values are injected by the application (see inject) or replayed from a capture file (see
+btsmart.capture): the input values of captured USB input frames and BLE notifications are published
+with their original timing (optionally scaled). Output values, input modes and the LED are kept
+in memory.
+
+"""
+
+import asyncio
+import time
+
+from .controller import LEDMode, Input, Output, InputMode, InputMeasurement, BTSmartController
+from .capture import CaptureReader, USB_FRAME, GATT_NOTIFY
+from .backend_ble import BT_SMART_GATT_UUIDs
+from .backend_usb import BTSmartFTDI, _decode_inputs
+
+
+def _replay_events(path: str) -> list:
+    """extracts the input changes (timestamp ns, input, value) of a capture"""
+    get_inputs = BTSmartFTDI._CMD_GET_INPUTS.hex().upper()
+    by_uuid = {uuid: input for input, uuid in BT_SMART_GATT_UUIDs["input"]["characteristics"].items()}
+    last = [None, None, None, None]
+    events = []
+    for r in CaptureReader(path).timeline([USB_FRAME, GATT_NOTIFY]):
+        if not r.ok:
+            continue
+        if r.kind == USB_FRAME and r.key == get_inputs:
+            ts = r.timestamp + r.latency // 2
+            for i, (cfg, value) in enumerate(_decode_inputs(r.response)):
+                if value != last[i]:
+                    last[i] = value
+                    events.append((ts, Input(i), value))
+        elif r.kind == GATT_NOTIFY and r.key in by_uuid:
+            events.append((r.timestamp, by_uuid[r.key], int.from_bytes(r.response, 'little', signed=False)))
+    return events
+
+
+class BTSmartController_Sim(BTSmartController):
+    """This class represents a simulated BTSmart-Controller"""
+
+    MAX_UPDATE_RATE: float = 1000.0
+
+    DIRECT_IO: bool = True
+
+    def __init__(self, capture: str = None, speed: float = 1.0, repeat: bool = False, latency: float = 0.0, id: str = "sim") -> None:
+        """creates the simulated controller
+
+        Args:
+            capture (str, optional): a capture file to be replayed after connect. Defaults to None.
+            speed (float, optional): the replay speed (2.0 replays twice as fast). Defaults to 1.0.
+            repeat (bool, optional): restart the replay at the end of the capture. Defaults to False.
+            latency (float, optional): the simulated duration of an operation in seconds. Defaults to 0.0.
+            id (str, optional): the controller id. Defaults to "sim".
+        """
+        super().__init__()
+        if speed <= 0.0:
+            raise Exception("speed must be greater than 0.0")
+        self.id = id
+        self.capture = capture
+        self.speed = speed
+        self.repeat = repeat
+        self.latency = latency
+        self._events = _replay_events(capture) if capture is not None else []
+        self._values = [0, 0, 0, 0]
+        self._connected = False
+        self._task: asyncio.Task = None
+        self.frames = 0
+        """the number of simulated operations"""
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    async def connect(self) -> bool:
+        self._user_disconnect = False
+        await self._reopen()
+        await self.reset()
+        await self._resume()
+        return True
+
+    async def _reopen(self) -> None:
+        self._connected = True
+
+    async def _resume(self) -> None:
+        self._connected = True
+        if self._events and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self._replay(), name='BTSmartController replay')
+
+    async def disconnect(self) -> None:
+        self._user_disconnect = True
+        self._connected = False
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _operation(self) -> None:
+        if not self._connected:
+            raise Exception("Device not connected")
+        self.frames += 1
+        if self.latency > 0.0:
+            await asyncio.sleep(self.latency)
+
+    async def _replay(self) -> None:
+        while True:
+            start = time.monotonic_ns()
+            first = self._events[0][0]
+            for ts, input, value in self._events:
+                delay = (ts - first) / self.speed * 1e-9 - (time.monotonic_ns() - start) * 1e-9
+                if delay > 0.0:
+                    await asyncio.sleep(delay)
+                self.inject(input, value)
+            if not self.repeat:
+                break
+
+    def inject(self, input: Input, value: int) -> None:
+        """sets an input value as if it was received from the device
+
+        Args:
+            input (Input): the input
+            value (int): the value
+        """
+        if self._values[input.value] == value:
+            return
+        self._values[input.value] = value
+        self._publish_sample(input, value)
+        asyncio.get_running_loop().create_task(self._on_input_value_changed(input, value))
+
+    async def get_device_information(self) -> dict[str, str]:
+        return {"model": "simulation", "capture": self.capture or ""}
+
+    async def get_battery_level(self) -> int:
+        await self._operation()
+        return 100
+
+    async def set_led(self, led: LEDMode) -> None:
+        await self._operation()
+        self._led = led
+        self._state_changed()
+
+    async def get_led(self) -> LEDMode:
+        return self._led
+
+    async def set_input_mode(self, input: Input, mode: InputMode) -> None:
+        await self._operation()
+        self._input_modes[input] = mode
+        self._state_changed()
+
+    async def get_input_mode(self, input: Input) -> InputMode:
+        return self._input_modes[input]
+
+    async def get_input_value(self, input: Input, mode: InputMode = None) -> InputMeasurement:
+        await self._operation()
+        return InputMeasurement(self._values[input.value], mode or self._input_modes[input])
+
+    async def set_output_value(self, output: Output, value: int) -> None:
+        self._check_output(value)
+        await self._operation()
+        self._output_values[output] = value
+        self._state_changed()
+
+    async def get_output_value(self, output: Output) -> int:
+        return self._output_values[output]
+
+    def _direct_read(self) -> list[int]:
+        return list(self._values)
+
+    def _direct_write(self, output: Output, value: int) -> None:
+        self.frames += 1
+
+    def _emergency_stop(self, loop: asyncio.AbstractEventLoop, timeout: float) -> None:
+        for output in Output.all():
+            self._output_values[output] = 0
@@ -1,12 +1,28 @@
 import asyncio
+import struct
+import threading
+import time
 
 from pyftdi.usbtools import UsbTools, UsbDeviceDescriptor
 from pyftdi.ftdi import Ftdi
 
-from .controller import LEDMode, Input, InputMode, INPUT_MODE_UNIT, InputMeasurement, Output, BTSmartController
+from .controller import LEDMode, Input, InputMode, INPUT_MODE_BY_CODE, INPUT_MODE_UNIT, InputMeasurement, Output, BTSmartController
+from .capture import USB_FRAME
 
 
 
+_INPUTS = struct.Struct('<8x' + 'BBH' * 4)  # header, then input number, configuration and value per input
+
+
+def _decode_inputs(response: bytes) -> list:
+    """decodes the response of a get inputs frame into a tuple (configuration, value) per input number"""
+    f = _INPUTS.unpack_from(response)
+    result = [None, None, None, None]
+    for k in range(0, 12, 3):
+        result[f[k]] = (f[k + 1], f[k + 2])
+    return result
+
+
 class BTSmartFTDI:
     
     _SOF = bytes.fromhex('5AA5')
@@ -44,6 +60,15 @@ class BTSmartFTDI:
 
     def __init__(self, ftdi):
         self.ftdi = ftdi
+        self.frames = 0
+        self.frame_errors = 0
+        self._lock = threading.Lock()  # frames might be sent from other threads (e.g. an executor or the safety watchdog)
+        self.last_rtt_ns = 0
+        """the round trip time of the last frame in ns"""
+        self.last_sample_ns = 0
+        """the estimated time (monotonic ns) the last input values were measured by the device"""
+        self.trace = None
+        """a function called for every frame (see btsmart.capture)"""
         self._set_test_mode(True)
         self._set_led(BTSmartFTDI._LED_BLUE)
         #for i in range(0,4):
@@ -52,18 +77,30 @@ class BTSmartFTDI:
         self._get_inputs()
 
     def _send_msg(self, msg: bytes, response_len: int):
+        with self._lock:
+            return self._send_msg_locked(msg, response_len)
+
+    def _send_msg_locked(self, msg: bytes, response_len: int):
         ftdi = self.ftdi
-        #print("msg: ", msg.hex())
+        self.frames += 1
+        sent = time.monotonic_ns()
         l = ftdi.write_data(msg)
         if l != len(msg):
+            self.frame_errors += 1
+            if self.trace is not None:
+                self.trace(USB_FRAME, False, sent, time.monotonic_ns() - sent, msg[2:6], msg, b'')
             raise Exception("could not send all the mesage bytes")
         else:
             resp = ftdi.read_data_bytes(response_len, 4)
-            #print("resp: ", len(resp), " - ", resp.hex())
             if len(resp) != response_len:
-                #print(resp.hex())
+                self.frame_errors += 1
+                if self.trace is not None:
+                    self.trace(USB_FRAME, False, sent, time.monotonic_ns() - sent, msg[2:6], msg, bytes(resp))
                 raise Exception("unexpected response length, expected " + str(response_len) + " but received " + str(len(resp)))
             else:
+                self.last_rtt_ns = time.monotonic_ns() - sent
+                if self.trace is not None:
+                    self.trace(USB_FRAME, True, sent, self.last_rtt_ns, msg[2:6], msg, bytes(resp))
                 return resp
 
     def _set_test_mode(self, on: bool = False) -> bool:
@@ -130,20 +167,20 @@ class BTSmartFTDI:
         #print("Get Inputs")
         msg = b"".join([BTSmartFTDI._SOF, BTSmartFTDI._CMD_GET_INPUTS, bytes(b'\x00\x00')])
         response = self._send_msg(msg, 8+5*4)
-        result = [None, None, None, None]
-        for i in range(0, 4):
-            p = 8+(i*4)
-            n = int(response[p])
-            c = response[p+1]
-            v = int.from_bytes(response[p+2:p+4], 'little', signed=False)
-            result[n] = { 'cfg': c, 'val': v }
-        return result
+        # the device samples the inputs when handling the request - i.e. about half a round trip after sending
+        self.last_sample_ns = time.monotonic_ns() - self.last_rtt_ns // 2
+        return _decode_inputs(response)
 
-    def _set_output(self, output: int, value: int):
+    def _set_output(self, output: int, value: int, check=None):
+        """sets an output - the optional check function is called with the value while the device is locked
+        and raises an exception if the frame must not be sent (see BTSmartController_USB._set_safety_latch)"""
         ftdi = self.ftdi
         #print("Set Output")
         msg = b"".join([BTSmartFTDI._SOF, BTSmartFTDI._CMD_SET_OUTPUT, bytes(b'\x00\x04'), output.to_bytes(1, 'little', signed=False), BTSmartFTDI._CFG_INT8, b'\x00', value.to_bytes(1, 'little', signed=True)])
-        resp = self._send_msg(msg, 9)
+        with self._lock:
+            if check is not None:
+                check(value)
+            resp = self._send_msg_locked(msg, 9)
         if len(resp) == 9:
             err = int.from_bytes(resp[8:9], 'little', signed=False)
             if err != BTSmartFTDI._ERR_NONE:
@@ -159,32 +196,67 @@ class BTSmartController_USB(BTSmartController):
     
     _POLL_INTERVAL: float = 0.05
 
+    DIRECT_IO: bool = True
+
+    MAX_UPDATE_RATE: float = 100.0
+
     async def discover() -> BTSmartController:
         dd = UsbDeviceDescriptor(8733, 5, None, None, None, 0, None)
         try:
             #print("Looking for:", dd)
-            dev = UsbTools.get_device(dd)
-            #print("Found:", dev)
-            if dev is None:
+            btFtdi = BTSmartController_USB._open(dd)
+            if btFtdi is None:
                 return None
-            ftdi = Ftdi()
-            ftdi.open_from_device(dev, 1)
-            ftdi.set_baudrate(115200)
-            btFtdi = BTSmartFTDI(ftdi)
-            #print("FTDI:", ftdi)
-            return BTSmartController_USB(btFtdi)
+            return BTSmartController_USB(btFtdi, dd)
         except:
             return None
-        
 
-    def __init__(self, dev: BTSmartFTDI) -> None:
+    def discover_all() -> list:
+        """looks for all BT-Smart Controllers attached via USB
+
+        Returns:
+            list: the found controllers (not yet connected)
+        """
+        result = []
+        for dd, _ in UsbTools.find_all([(8733, 5)], nocache=True):
+            try:
+                btFtdi = BTSmartController_USB._open(dd)
+                if btFtdi is not None:
+                    result.append(BTSmartController_USB(btFtdi, dd))
+            except Exception as ex:
+                print("unable to open", dd, ":", ex)
+        return result
+
+    def _open(dd: UsbDeviceDescriptor) -> BTSmartFTDI:
+        """opens the FTDI device matching the given descriptor
+
+        Returns:
+            BTSmartFTDI: the opened device or None if there is no such device
+        """
+        dev = UsbTools.get_device(dd)
+        #print("Found:", dev)
+        if dev is None:
+            return None
+        ftdi = Ftdi()
+        ftdi.open_from_device(dev, 1)
+        ftdi.set_baudrate(115200)
+        return BTSmartFTDI(ftdi)
+
+    def __init__(self, dev: BTSmartFTDI, descriptor: UsbDeviceDescriptor = None) -> None:
         super().__init__()
         self._is_polling = False
         self.task : asyncio.Task = None
         self.dev = dev
+        self._descriptor = descriptor
+        if descriptor is not None:
+            if descriptor.sn is not None:
+                self.id = "usb:" + descriptor.sn
+            elif descriptor.bus is not None:
+                self.id = "usb:{}:{}".format(descriptor.bus, descriptor.address)
         self._led = LEDMode.BLUE
-        self._outputs = [0, 0]
         self._inputs = dev._get_inputs()
+        for input in Input.all():
+            self._history[input].append((dev.last_sample_ns, self._inputs[input.value][1]))
 
     def is_connected(self) -> bool:
         return self._is_polling
@@ -193,22 +265,57 @@ class BTSmartController_USB(BTSmartController):
         print("started coroutine")
         self._is_polling = True
         print("polling: ", self._is_polling)
+        loop = asyncio.get_event_loop()
+        planned = loop.time()
         while self._is_polling:
             #print(".")
-            await self._update_inputs()
+            self.poll_lag = max(loop.time() - planned, 0.0)
+            try:
+                await self._update_inputs()
+            except Exception as ex:
+                print("lost connection to controller:", ex)
+                self._is_polling = False
+                self._disconnect_cb(None)
+                break
+            planned = loop.time() + BTSmartController_USB._POLL_INTERVAL
             await asyncio.sleep(BTSmartController_USB._POLL_INTERVAL)
         print("coroutine ended")
             
     async def connect(self) -> bool:
+        self._user_disconnect = False
         await self.reset()
+        await self._resume()
+        return True
+
+    async def _resume(self) -> None:
         self.dev._set_test_mode()
         await asyncio.sleep(0)
         print("started polling")
         loop = asyncio.get_event_loop()
         self.task = loop.create_task(self._poll_state(), name='BTSmartController USB update')
-        return True
+
+    async def _reopen(self) -> None:
+        """reopens the FTDI device using the descriptor it was discovered with"""
+        if self._descriptor is None:
+            raise Exception("unable to reconnect - device descriptor unknown")
+        try:
+            self.dev.ftdi.close()
+        except:
+            pass
+        UsbTools.flush_cache()
+        dd = self._descriptor
+        if dd.sn is not None:
+            # the bus address might have changed if the device has been plugged in again
+            dd = UsbDeviceDescriptor(dd.vid, dd.pid, None, None, dd.sn, dd.index, None)
+        dev = BTSmartController_USB._open(dd)
+        if dev is None:
+            raise Exception("unable to connect")
+        dev.trace = self._trace
+        self.dev = dev
+        self._inputs = dev._get_inputs()
     
     async def disconnect(self) -> None:
+        self._user_disconnect = True
         self._is_polling = False
         print("stopped polling")
         return
@@ -221,60 +328,95 @@ class BTSmartController_USB(BTSmartController):
         # TODO: implement this
         return 100
 
+    async def probe(self) -> float:
+        """reads the device information frame, since the battery level is not read from the device.
+        The frame is sent from an executor thread, so a hung link does not block the event loop."""
+        start = time.perf_counter()
+        await asyncio.get_running_loop().run_in_executor(None, self.dev._get_information)
+        return time.perf_counter() - start
+
+    def _link_counters(self) -> tuple[int, int]:
+        return (self.dev.frames, self.dev.frame_errors)
+
+    def _set_trace(self, trace) -> None:
+        self._trace = trace
+        self.dev.trace = trace
+
     async def set_led(self, led: LEDMode) -> None:
-        self.dev._set_led(led._value_)
+        self.dev._set_led(led.code)
         self._led = led
+        self._state_changed()
 
     async def get_led(self) -> LEDMode:
         return self._led
 
     async def _update_inputs(self):
-        #print("u")
         old_inputs = self._inputs
         self._inputs = self.dev._get_inputs()
+        ts = self.dev.last_sample_ns
         for input in Input.all():
             i = input.value
-            oldI = old_inputs[i]
-            oldV = oldI['val']
-            newI = self._inputs[i]
-            newV = newI['val']
-            if oldV != newV:
-                #print("X", i, newV)
+            newV = self._inputs[i][1]
+            if old_inputs[i][1] != newV:
+                self._publish_sample(input, newV, ts)
                 asyncio.create_task(self._on_input_value_changed(input, newV))
 
     async def set_input_mode(self, input: Input, mode: InputMode) -> None:
         self.dev._config_input(input.value, mode.value)
+        self._input_modes[input] = mode
+        self._state_changed()
         await self._update_inputs()
 
     async def get_input_mode(self, input: Input) -> InputMode:
         if not self._is_polling:
             await self._update_inputs()
-        inp = self._inputs[input.value]
-        if inp['cfg'] == BTSmartFTDI._CFG_IN_VOLT:
-            return InputMode.VOLTAGE
-        else:
-            return InputMode.RESISTANCE
+        return INPUT_MODE_BY_CODE.get(self._inputs[input.value][0], InputMode.RESISTANCE)
 
     async def get_input_value(self, input: Input, mode: InputMode = None) -> InputMeasurement:
-        inp = self._inputs[input.value]
-        if inp['cfg'] == BTSmartFTDI._CFG_IN_VOLT:
-            m = InputMode.VOLTAGE
-        else:
-            m = InputMode.RESISTANCE
+        m = INPUT_MODE_BY_CODE.get(self._inputs[input.value][0], InputMode.RESISTANCE)
         if m != mode:
             print("switching mode to", mode)
         else:
             if not self._is_polling:
                 await self._update_inputs()
-        inp = self._inputs[input.value]
-        return InputMeasurement(inp['val'], mode)
+        return InputMeasurement(self._inputs[input.value][1], mode)
 
     async def set_output_value(self, output: Output, value: int) -> None:
-        if value < int(-100) or value > int(100):
-            raise Exception("motor output must be in -100..100")
-        self.dev._set_output(output.value, value)
-        self._outputs[output.value] = value
+        self._check_output(value)
+        # checked again while the device is locked - the watchdog thread might latch the outputs in between
+        self.dev._set_output(output.value, value, self._check_output)
+        self._output_values[output] = value
+        self._state_changed()
+
+    def _set_safety_latch(self, latched: bool) -> None:
+        """sets the latch while the device is locked - an output frame that passed the check is sent before the stop frames"""
+        with self.dev._lock:
+            self._safety_latched = latched
+
+    def _direct_read(self) -> list[int]:
+        """reads all input values directly from the calling thread (see btsmart.control)"""
+        return [inp[1] for inp in self.dev._get_inputs()]
+
+    def _direct_write(self, output: Output, value: int) -> None:
+        """writes an output directly from the calling thread (see btsmart.control) - refused while the outputs are latched"""
+        self.dev._set_output(output.value, value, self._check_output)
+
+    def _rule_write(self, outputs: dict[Output, int], led: LEDMode) -> None:
+        """writes the frames directly within the poll step"""
+        try:
+            for output, value in outputs.items():
+                self.dev._set_output(output.value, value, self._check_output)
+            if led is not None:
+                self.dev._set_led(led.code)
+        except Exception as ex:
+            print("error in rule write:", ex)
+
+    def _emergency_stop(self, loop: asyncio.AbstractEventLoop, timeout: float) -> None:
+        """writes the stop frames directly from the calling thread - independent of the event loop"""
+        for output in Output.all():
+            self.dev._set_output(output.value, 0)
+            self._output_values[output] = 0
 
     async def get_output_value(self, output: Output) -> int:
-        return self._outputs[output.value]
+        return self._output_values[output]
     
\ No newline at end of file
@@ -0,0 +1,274 @@
+"""
+This module captures the traffic between the library and the device - every USB frame and every GATT
+operation (read, write, notification) - into a compact, append-only binary file.
+
+The backends call a trace function for every operation (see BTSmartController._set_trace). The capture
+packs each record into a buffer and a background thread appends the buffered records to the file, so the
+cost on the hot path is one struct.pack and one append.
+
+File layout (little endian): a header (magic "BTSC", version u16), followed by records of
+
+    kind (u8), ok (u8), key length (u8), timestamp ns (i64), latency ns (i64), request length (u16),
+    response length (u16), key, request, response
+
+The key is the command (USB) or the characteristic UUID (16 bytes, BLE). A CaptureReader reads the file,
+reconstructs the timeline and computes latency statistics. A capture can be replayed by the simulated
+backend (see btsmart.backend_sim).
+
+e.g.
+    capture = Capture(controller, "session.btsc")
+    capture.start()
+    ...
+    capture.stop()
+    print(CaptureReader("session.btsc").latency_stats())
+
+"""
+
+import collections
+import struct
+import threading
+import uuid as uuidlib
+
+from typing import NamedTuple
+
+
+USB_FRAME = 1
+"""record kind: a USB frame (request and response)"""
+
+GATT_READ = 2
+"""record kind: a GATT read (response holds the value)"""
+
+GATT_WRITE = 3
+"""record kind: a GATT write (request holds the value)"""
+
+GATT_NOTIFY = 4
+"""record kind: a GATT notification (response holds the value)"""
+
+KIND_LABEL = {USB_FRAME: "usb", GATT_READ: "read", GATT_WRITE: "write", GATT_NOTIFY: "notify"}
+
+_MAGIC = b'BTSC'
+_VERSION = 1
+_FILE_HEADER = struct.Struct('<4sH')
+_RECORD = struct.Struct('<BBBqqHH')
+
+
+class CaptureRecord(NamedTuple):
+    """One captured operation"""
+
+    kind: int
+    """USB_FRAME, GATT_READ, GATT_WRITE or GATT_NOTIFY"""
+
+    ok: bool
+    """False if the operation failed"""
+
+    timestamp: int
+    """the monotonic time (ns) the operation started"""
+
+    latency: int
+    """the duration of the operation in ns (0 for notifications)"""
+
+    key: str
+    """the command (hex) of a USB frame or the characteristic UUID"""
+
+    request: bytes
+    """the sent bytes"""
+
+    response: bytes
+    """the received bytes"""
+
+
+class Capture:
+    """Records the traffic of a controller into a file (see the module description)"""
+
+    def __init__(self, ctrl, path: str, flush_interval: float = 0.1, max_pending: int = 100000) -> None:
+        """creates the capture - call start() to begin recording
+
+        Args:
+            ctrl (BTSmartController): the controller
+            path (str): the capture file - new records are appended
+            flush_interval (float, optional): the time between two writes of the background thread in seconds. Defaults to 0.1.
+            max_pending (int, optional): the maximum number of buffered records - further records are dropped. Defaults to 100000.
+        """
+        if ctrl is None:
+            raise Exception("cannot capture 'None'")
+        self.controller = ctrl
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.records = 0
+        """the number of captured records"""
+        self.dropped = 0
+        """the number of records dropped because the writer did not keep up"""
+        self._pending = collections.deque()
+        self._keys = dict()
+        self._running = False
+        self._wake = threading.Event()
+        self._thread: threading.Thread = None
+
+    def start(self) -> None:
+        """starts recording"""
+        if self._running:
+            return
+        self._file = open(self.path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(_FILE_HEADER.pack(_MAGIC, _VERSION))
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='BTSmartController capture', daemon=True)
+        self._thread.start()
+        self.controller._set_trace(self._trace)
+
+    def stop(self) -> None:
+        """stops recording and writes all buffered records"""
+        if not self._running:
+            return
+        self.controller._set_trace(None)
+        self._running = False
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+        self._file.close()
+
+    def __enter__(self) -> 'Capture':
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _key(self, key) -> bytes:
+        packed = self._keys.get(key)
+        if packed is None:
+            if isinstance(key, str):
+                packed = uuidlib.UUID(key).bytes
+            else:
+                packed = bytes(key)
+            self._keys[key] = packed
+        return packed
+
+    def _trace(self, kind: int, ok: bool, ts: int, latency: int, key, request: bytes, response: bytes) -> None:
+        """called by the transport for every operation - possibly from another thread"""
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        key = self._key(key)
+        self._pending.append(b"".join((_RECORD.pack(kind, ok, len(key), ts, latency, len(request), len(response)), key, request, response)))
+        self.records += 1
+
+    def _run(self) -> None:
+        pending = self._pending
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            chunks = []
+            while pending:
+                chunks.append(pending.popleft())
+            if chunks:
+                self._file.write(b"".join(chunks))
+                self._file.flush()
+            if not self._running and not pending:
+                break
+
+
+class LatencyStats(NamedTuple):
+    """The latency of one kind of operation"""
+
+    count: int
+    errors: int
+    mean: float
+    """the mean latency in seconds"""
+    p50: float
+    p95: float
+    max: float
+
+
+class CaptureReader:
+    """Reads a capture file"""
+
+    def __init__(self, path: str) -> None:
+        """opens the capture
+
+        Args:
+            path (str): the capture file
+
+        Raises:
+            Exception: if the file is not a capture
+        """
+        with open(path, "rb") as f:
+            self._data = f.read()
+        if len(self._data) < _FILE_HEADER.size:
+            raise Exception("not a btsmart capture: " + path)
+        magic, version = _FILE_HEADER.unpack_from(self._data, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise Exception("not a btsmart capture: " + path)
+        self.path = path
+
+    def __iter__(self):
+        return self.records()
+
+    def records(self):
+        """iterates over the records in the order they were written (a truncated last record is ignored)
+
+        Returns:
+            iterator: the CaptureRecords
+        """
+        data = self._data
+        pos = _FILE_HEADER.size
+        end = len(data)
+        keys = dict()
+        while pos + _RECORD.size <= end:
+            kind, ok, nkey, ts, latency, nreq, nresp = _RECORD.unpack_from(data, pos)
+            pos += _RECORD.size
+            if pos + nkey + nreq + nresp > end:
+                break
+            raw = data[pos:pos + nkey]
+            key = keys.get(raw)
+            if key is None:
+                key = str(uuidlib.UUID(bytes=raw)) if nkey == 16 else raw.hex().upper()
+                keys[raw] = key
+            pos += nkey
+            request = data[pos:pos + nreq]
+            pos += nreq
+            response = data[pos:pos + nresp]
+            pos += nresp
+            yield CaptureRecord(kind, bool(ok), ts, latency, key, request, response)
+
+    def timeline(self, kinds: list = None) -> list:
+        """returns the records ordered by their start time (the writer appends in completion order)
+
+        Args:
+            kinds (list, optional): the record kinds to be included. Defaults to all kinds.
+
+        Returns:
+            list: the CaptureRecords ordered by timestamp
+        """
+        return sorted((r for r in self.records() if kinds is None or r.kind in kinds), key=lambda r: r.timestamp)
+
+    def latency_stats(self) -> dict:
+        """computes the latency statistics per (kind, key) - notifications are not included
+
+        Returns:
+            dict: the LatencyStats per (kind label, key)
+        """
+        latencies = collections.defaultdict(list)
+        errors = collections.defaultdict(int)
+        for r in self.records():
+            if r.kind == GATT_NOTIFY:
+                continue
+            group = (KIND_LABEL.get(r.kind, str(r.kind)), r.key)
+            latencies[group].append(r.latency * 1e-9)
+            if not r.ok:
+                errors[group] += 1
+        result = dict()
+        for group, values in latencies.items():
+            values.sort()
+            n = len(values)
+            result[group] = LatencyStats(n, errors[group], sum(values) / n, values[n // 2], values[min(int(n * 0.95), n - 1)], values[-1])
+        return result
+
+    def duration(self) -> float:
+        """returns the time span covered by the capture in seconds"""
+        first = last = None
+        for r in self.records():
+            first = r.timestamp if first is None else min(first, r.timestamp)
+            last = r.timestamp + r.latency if last is None else max(last, r.timestamp + r.latency)
+        return 0.0 if first is None else (last - first) * 1e-9
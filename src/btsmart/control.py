@@ -0,0 +1,294 @@
+"""
+This module provides fixed-rate closed-loop control: a ControlLoop samples the chosen inputs, computes
+a control law (e.g. a PID controller) and writes the outputs at a fixed period.
+
+With USB the loop runs in a separate thread that reads the inputs and writes the outputs directly on the
+device (see BTSmartController.DIRECT_IO), so its timing does not depend on the event loop. With other
+backends the loop runs as a task on the event loop, uses the last received input values and writes the
+outputs with set_output_values.
+
+The loop measures its period, the jitter and the number of overruns (iterations that did not finish
+within the period - the missed periods are skipped).
+
+"""
+
+import asyncio
+import math
+import threading
+import time
+
+from .controller import BTSmartController
+
+
+class PID:
+    """A PID control law for one input and one output (with output clamping and anti-windup)"""
+
+    def __init__(self, kp: float, ki: float = 0.0, kd: float = 0.0, setpoint: float = 0.0, out_min: float = -100, out_max: float = 100) -> None:
+        """creates the controller
+
+        Args:
+            kp (float): the proportional gain
+            ki (float, optional): the integral gain (per second). Defaults to 0.0.
+            kd (float, optional): the derivative gain (seconds). Defaults to 0.0.
+            setpoint (float, optional): the target input value. Defaults to 0.0.
+            out_min (float, optional): the minimum output value. Defaults to -100.
+            out_max (float, optional): the maximum output value. Defaults to 100.
+        """
+        if out_min > out_max:
+            raise Exception("out_min must not be greater than out_max")
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.setpoint = setpoint
+        """the target input value - might be changed while the loop is running"""
+        self.out_min = out_min
+        self.out_max = out_max
+        self.reset()
+
+    def reset(self) -> None:
+        """clears the integral and derivative state"""
+        self._integral = 0.0
+        self._last_value = None
+
+    def __call__(self, values: list, dt: float) -> float:
+        """computes the output for the given input value(s)
+
+        Args:
+            values (list): the input values (only the first one is used)
+            dt (float): the time since the last iteration in seconds
+
+        Returns:
+            float: the output value
+        """
+        value = values[0]
+        error = self.setpoint - value
+        # derivative on measurement - a setpoint change does not kick the output
+        derivative = 0.0 if self._last_value is None or dt <= 0.0 else (self._last_value - value) / dt
+        self._last_value = value
+        integral = self._integral + error * dt
+        out = self.kp * error + self.ki * integral + self.kd * derivative
+        if out > self.out_max:
+            out = self.out_max
+        elif out < self.out_min:
+            out = self.out_min
+        else:
+            self._integral = integral  # the integral only grows while the output is not saturated
+        return out
+
+
+class ControlStats:
+    """The timing of a control loop"""
+
+    def __init__(self, iterations: int, overruns: int, period: float, jitter: float, max_lateness: float) -> None:
+        self.iterations = iterations
+        """the number of iterations"""
+        self.overruns = overruns
+        """the number of iterations that did not finish within the period"""
+        self.period = period
+        """the mean time between two iterations in seconds"""
+        self.jitter = jitter
+        """the standard deviation of the time between two iterations in seconds"""
+        self.max_lateness = max_lateness
+        """the maximum time an iteration started after its planned time in seconds"""
+
+    def __str__(self):
+        return "{} iterations, {} overruns, period {:.6f}s, jitter {:.6f}s, max lateness {:.6f}s".format(
+            self.iterations, self.overruns, self.period, self.jitter, self.max_lateness)
+
+
+class ControlLoop:
+    """Runs a control law at a fixed period"""
+
+    def __init__(self, ctrl: BTSmartController, inputs: list, outputs: list, law, period: float = 0.01) -> None:
+        """creates the loop - call start() to run it
+
+        e.g. ControlLoop(controller, [Input.I1], [Output.O1], PID(0.5, 0.1, setpoint=500), period=0.01)
+
+        Args:
+            ctrl (BTSmartController): the controller
+            inputs (list): the inputs passed to the law (in this order)
+            outputs (list): the outputs written with the result of the law
+            law (function): a function (values, dt) -> value (or a list of values, one per output) - e.g. a PID
+            period (float, optional): the period in seconds. Defaults to 0.01.
+
+        Raises:
+            Exception: if one of the parameters is invalid
+        """
+        if ctrl is None:
+            raise Exception("cannot control 'None'")
+        if period <= 0.0:
+            raise Exception("period must be greater than 0.0")
+        if not inputs or not outputs:
+            raise Exception("at least one input and one output are required")
+        self.controller = ctrl
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.law = law
+        self.period = period
+        self._running = False
+        self._thread: threading.Thread = None
+        self._task: asyncio.Task = None
+        self._loop: asyncio.AbstractEventLoop = None
+        self._reset_stats()
+
+    def _reset_stats(self) -> None:
+        self._iterations = 0
+        self._overruns = 0
+        self._last_start = None
+        self._sum = 0.0
+        self._sum_sq = 0.0
+        self._intervals = 0
+        self._max_lateness = 0.0
+
+    def stats(self) -> ControlStats:
+        """returns the timing measured since the loop was started
+
+        Returns:
+            ControlStats: the timing
+        """
+        n = self._intervals
+        mean = self._sum / n if n > 0 else 0.0
+        jitter = math.sqrt(max(self._sum_sq / n - mean * mean, 0.0)) if n > 0 else 0.0
+        return ControlStats(self._iterations, self._overruns, mean, jitter, self._max_lateness)
+
+    def is_running(self) -> bool:
+        return self._running
+
+    def start(self) -> None:
+        """starts the loop - in a separate thread if the backend supports direct I/O, as a task otherwise.
+        Must be called from the event loop the controller is used with."""
+        if self._running:
+            return
+        self._reset_stats()
+        if hasattr(self.law, "reset"):
+            self.law.reset()
+        self._running = True
+        self._loop = asyncio.get_running_loop()
+        if self.controller.DIRECT_IO:
+            self._thread = threading.Thread(target=self._run_thread, name='BTSmartController control loop', daemon=True)
+            self._thread.start()
+        else:
+            self._task = self._loop.create_task(self._run_task(), name='BTSmartController control loop')
+
+    async def stop(self, stop_outputs: bool = True) -> None:
+        """stops the loop
+
+        Args:
+            stop_outputs (bool, optional): set the controlled outputs to 0. Defaults to True.
+        """
+        self._running = False
+        if self._thread is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._thread.join)
+            self._thread = None
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if stop_outputs:
+            await self.controller.set_output_values({output: 0 for output in self.outputs})
+
+    def _tick(self, planned: float, now: float) -> float:
+        """records the timing of an iteration that starts now
+
+        Returns:
+            float: the measured time since the start of the previous iteration (0.0 for the first one)
+        """
+        self._iterations += 1
+        self._max_lateness = max(self._max_lateness, now - planned)
+        interval = 0.0
+        if self._last_start is not None:
+            interval = now - self._last_start
+            self._sum += interval
+            self._sum_sq += interval * interval
+            self._intervals += 1
+        self._last_start = now
+        return interval
+
+    def _compute(self, values: list, dt: float) -> list:
+        result = self.law(values, dt)
+        if not isinstance(result, (list, tuple)):
+            result = [result] * len(self.outputs)
+        latched = self.controller._safety_latched
+        return [0 if latched else max(-100, min(100, int(round(v)))) for v in result]
+
+    def _next(self, planned: float, now: float) -> float:
+        """returns the next planned time - missed periods are skipped and counted as overrun"""
+        planned = planned + self.period
+        if now > planned:
+            self._overruns += 1
+            planned = planned + math.ceil((now - planned) / self.period) * self.period
+        return planned
+
+    def _run_thread(self) -> None:
+        ctrl = self.controller
+        indices = [input.value for input in self.inputs]
+        last = {output: None for output in self.outputs}
+        planned = time.perf_counter()
+        while self._running:
+            now = time.perf_counter()
+            dt = self._tick(planned, now)
+            try:
+                values = ctrl._direct_read()
+                result = self._compute([values[i] for i in indices], dt)
+                changed = False
+                for output, value in zip(self.outputs, result):
+                    if value != last[output]:
+                        ctrl._direct_write(output, value)
+                        ctrl._output_values[output] = value
+                        last[output] = value
+                        changed = True
+                if changed:
+                    self._loop.call_soon_threadsafe(ctrl._state_changed)
+            except Exception as ex:
+                print("error in control loop:", ex)
+                self._running = False
+                self._stop_outputs_direct()
+                break
+            planned = self._next(planned, time.perf_counter())
+            delay = planned - time.perf_counter()
+            if delay > 0.0:
+                time.sleep(delay)
+
+    async def _run_task(self) -> None:
+        ctrl = self.controller
+        loop = asyncio.get_running_loop()
+        last = {output: None for output in self.outputs}
+        planned = loop.time()
+        try:
+            while self._running:
+                now = loop.time()
+                dt = self._tick(planned, now)
+                values = []
+                for input in self.inputs:
+                    history = ctrl._history[input]
+                    values.append(history[-1][1] if history else 0)
+                result = self._compute(values, dt)
+                writes = {output: value for output, value in zip(self.outputs, result) if value != last[output]}
+                if writes:
+                    await ctrl.set_output_values(writes)
+                    last.update(writes)
+                planned = self._next(planned, loop.time())
+                await asyncio.sleep(max(planned - loop.time(), 0.0))
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            print("error in control loop:", ex)
+            self._running = False
+            # a crashed loop must not leave the actuators running
+            try:
+                await ctrl.set_output_values({output: 0 for output in self.outputs})
+            except Exception as ex:
+                print("unable to stop the outputs:", ex)
+
+    def _stop_outputs_direct(self) -> None:
+        """sets the controlled outputs to 0 from the loop thread after an error"""
+        ctrl = self.controller
+        for output in self.outputs:
+            try:
+                ctrl._direct_write(output, 0)
+                ctrl._output_values[output] = 0
+            except Exception as ex:
+                print("unable to stop output", output.name, ":", ex)
+        try:
+            self._loop.call_soon_threadsafe(ctrl._state_changed)
+        except RuntimeError:
+            pass  # the loop is already closed
@@ -12,8 +12,13 @@ Todo:
 
 """
 import asyncio
+import collections
+import time
 
 from enum import Enum
+from typing import NamedTuple
+
+from .scheduler import TimerWheel
 
 
 class LEDMode(Enum):
@@ -41,16 +46,15 @@ class LEDMode(Enum):
         Returns:
             LEDMode: the according color or None in case the bytes do not hold a valid represnetation
         """
-        if b[0] == LEDMode.BLUE.value:
-            return LEDMode.BLUE
-        else:
-            if b[0] == LEDMode.YELLOW.value:
-                return LEDMode.YELLOW
-            else:
-                if b[0] == LEDMode.GREEN.value:
-                    return LEDMode.GREEN
-                else:
-                    return None
+        return LED_BY_CODE.get(b[0])
+
+    @property
+    def code(self) -> int:
+        """the wire value of the color as an integer"""
+        return self.value[0]
+
+LED_BY_CODE = {led.value[0]: led for led in LEDMode}
+"""lookup table: wire value -> LEDMode"""
 
 LED_LABEL = {
     LEDMode.BLUE: "Blue",
@@ -96,14 +100,13 @@ class InputMode(Enum):
         Returns:
             InputMode: the according mode or None in case the bytes do not hold a valid represnetation
         """
-        if b[0] == InputMode.VOLTAGE.value:
-            return InputMode.VOLTAGE
-        else:
-            if b[0] == InputMode.RESISTANCE.value:
-                return InputMode.RESISTANCE
-            else:
-                print("unknown input mode", b[0], "  V", InputMode.VOLTAGE.value, " R", InputMode.RESISTANCE.value)
-                return None
+        mode = INPUT_MODE_BY_CODE.get(b[0])
+        if mode is None:
+            print("unknown input mode", b[0], "  V", InputMode.VOLTAGE.value, " R", InputMode.RESISTANCE.value)
+        return mode
+
+INPUT_MODE_BY_CODE = {mode.value: mode for mode in InputMode}
+"""lookup table: wire value (BLE characteristic or USB input configuration) -> InputMode"""
 
 INPUT_MODE_LABEL = {
     InputMode.VOLTAGE: "Voltage",
@@ -115,34 +118,84 @@ INPUT_MODE_UNIT = {
     InputMode.RESISTANCE: u'\u2126'
 }
 
-class InputMeasurement:
-    """Simple object containing a measurement value and unit """
+class InputMeasurement(NamedTuple):
+    """Simple immutable object containing a measurement value and unit """
 
-    def __init__(self, value: int, unit: InputMode) -> InputMeasurement:
-        """creates a measurement with the given value and unit
+    value: int
+    """the measured value"""
 
-        Args:
-            value (int): the measured value
-            unit (InputMode): the unit of measurement
-
-        Returns:
-            InputMeasurement: the compound object
-        """
-        self.value = value
-        self.unit = unit
+    unit: InputMode
+    """the unit of measurement"""
 
     def __str__(self):
         """simple format using readable unit identifiers"""
-        return str(self.value) + " " + INPUT_MODE_UNIT[self.unit]
+        return str(self.value) + " " + INPUT_MODE_UNIT.get(self.unit, "")
+
+
+class InputSample(NamedTuple):
+    """A single input value as delivered by the backend (e.g. via streams)"""
 
+    input: Input
+    """the input the value was measured at"""
+
+    value: int
+    """the raw value"""
+
+    timestamp: int
+    """the monotonic time (ns, see time.monotonic_ns) at which the sample was received"""
+
+    source: str = None
+    """the id of the controller the sample was received from"""
+
+
+
+async def _invoke(callback, *args) -> None:
+    """calls a user callback (a normal or an async function, None is ignored) - errors are printed, not raised"""
+    if callback is None:
+        return
+    try:
+        if asyncio.iscoroutinefunction(callback):
+            await callback(*args)
+        else:
+            callback(*args)
+    except Exception as ex:
+        print("error in callback:", ex)
 
 
 class BTSmartController:
     """Abstract class that represents a BTSmart Controller."""
 
+    MAX_UPDATE_RATE: float = 20.0
+    """the number of output writes per second the backend is able to sustain (used e.g. for playing waveforms)"""
+
+    HISTORY_LENGTH: int = 256
+    """the number of timestamped samples kept per input (used e.g. for aligned snapshots, see btsmart.timesync)"""
+
+    DIRECT_IO: bool = False
+    """True if the backend implements _direct_read and _direct_write, i.e. the device can be accessed from any thread without the event loop"""
+
     def __init__(self) -> None:
+        self.id: str = None
+        """a stable identification of the device (e.g. the BLE address or USB serial number) - None if unknown"""
         self.input_listener = {Input.I1: None, Input.I2: None, Input.I3: None, Input.I4: None}
         self.diconnect_listener = None
+        self.timers = TimerWheel()
+        """the timer wheel used for all delayed actions of parts attached to this controller"""
+        # last known state of the device - used to restore the device after a reconnect
+        self._led: LEDMode = None
+        self._input_modes = {Input.I1: None, Input.I2: None, Input.I3: None, Input.I4: None}
+        self._output_values = {Output.O1: 0, Output.O2: 0}
+        self._user_disconnect = False  # True iff the link was closed on purpose by calling disconnect()
+        self._safety_latched = False  # True after a safety stop - outputs can only be set to 0 until released
+        self._disconnect_hooks = []  # internal listeners (e.g. the reconnect supervisor)
+        self._state_listeners = []  # internal listeners called when LED, input modes or output values change
+        self._last_input_time: float = None  # monotonic time of the last input event
+        self._sinks = []  # the registered sample sinks fed by _publish_sample (see add_sink)
+        self._rules = None  # the active RuleEngine evaluated by _publish_sample (see btsmart.rules)
+        self._trace = None  # called for every frame or GATT operation (see btsmart.capture)
+        self._history = {input: collections.deque(maxlen=self.HISTORY_LENGTH) for input in Input.all()}  # (timestamp, value) per input
+        self.poll_lag: float = 0.0
+        """the time (seconds) the last state update came later than planned - only used by polling backends"""
 
     def _disconnect_cb(self, client) -> None:
         """method is called, when the client is disconnectd"""
@@ -151,6 +204,11 @@ class BTSmartController:
                 self.diconnect_listener()
             except:
                 pass
+        for hook in list(self._disconnect_hooks):
+            try:
+                hook(self)
+            except Exception as ex:
+                print("error in disconnect hook:", ex)
     
     def on_disconnect(self, callback) -> None:
         """registers the given callback function to be called upon client disconnect.
@@ -160,6 +218,40 @@ class BTSmartController:
         """
         self.diconnect_listener = callback
 
+    def _set_trace(self, trace) -> None:
+        """installs a function that is called by the transport for every frame or GATT operation (see btsmart.capture)
+
+        Args:
+            trace (function): (kind, ok, timestamp ns, latency ns, key, request, response) or None
+        """
+        self._trace = trace
+
+    def _state_changed(self) -> None:
+        """called by the backends after the LED, an input mode or an output value has been changed"""
+        for listener in self._state_listeners:
+            listener(self)
+
+    def _publish_sample(self, input: Input, value: int, ts: int = None) -> None:
+        """called synchronously by the backends for every received input value, before any callback is scheduled.
+        The active rules are evaluated, the value is recorded in the input's history and passed to all registered sinks.
+
+        Args:
+            input (Input): the input (I1..I4)
+            value (int): the new value
+            ts (int, optional): the monotonic time (ns) the value was measured, as determined at the transport boundary. Defaults to now.
+        """
+        if ts is None:
+            ts = time.monotonic_ns()
+        self._last_input_time = ts * 1e-9
+        self._history[input].append((ts, value))
+        if self._rules is not None:
+            self._rules._evaluate(input, value)
+        if self._sinks:
+            sample = InputSample(input, value, ts, self.id)
+            for sink in self._sinks:
+                if input in sink.inputs:
+                    sink.push(sample)
+
     async def _on_input_value_changed(self, input: Input, value: int) -> None:
         """callback that is called whenever a certain input value changes. This method is called by the raw input handler above and
         in turn notifies the registered input listener.
@@ -216,6 +308,50 @@ class BTSmartController:
         """
         raise NotImplemented
 
+    async def _reopen(self) -> None:
+        """re-establishes the physical link to the device that has been used before - without resetting the device.
+
+        This method must be implemented in derived classes
+        """
+        raise NotImplemented
+
+    async def _resume(self) -> None:
+        """restarts the backend specific processing (e.g. polling) after the link has been reopened"""
+        pass
+
+    def _restore_operations(self) -> list:
+        """returns the operations (coroutines) needed to bring the device back to the last known state"""
+        ops = []
+        if self._led is not None:
+            ops.append(self.set_led(self._led))
+        for input, mode in self._input_modes.items():
+            if mode is not None:
+                ops.append(self.set_input_mode(input, mode))
+        for output, value in self._output_values.items():
+            ops.append(self.set_output_value(output, value))
+        return ops
+
+    async def restore_state(self) -> None:
+        """restores the last known state of the device (LED, input modes, output values) in one pipelined pass"""
+        await asyncio.gather(*self._restore_operations())
+
+    async def reconnect(self) -> float:
+        """reconnects to the device that has been used before. In contrast to connect(), the device is not reset
+        but the last known state (LED, input modes, output values, notifications) is restored.
+
+        Raises:
+            Exception: if the connection could not be established
+
+        Returns:
+            float: the time in seconds needed to restore the state after the link was reopened
+        """
+        self._user_disconnect = False
+        await self._reopen()
+        start = time.perf_counter()
+        await self.restore_state()
+        await self._resume()
+        return time.perf_counter() - start
+
     async def get_device_information(self) -> dict[str, str]:
         """retrieves information about hthe underlying physical device
 
@@ -226,6 +362,35 @@ class BTSmartController:
         """
         raise NotImplemented
 
+    async def probe(self) -> float:
+        """performs a low-cost round trip to the device (by default the battery level is read)
+
+        Returns:
+            float: the round trip time in seconds
+        """
+        start = time.perf_counter()
+        await self.get_battery_level()
+        return time.perf_counter() - start
+
+    def _link_counters(self) -> tuple[int, int]:
+        """returns the number of transmitted frames and the number of failed frames - only used by frame based backends"""
+        return (0, 0)
+
+    def monitor_health(self, probe_interval: float = 1.0, **thresholds):
+        """creates and starts a LinkHealthMonitor for this controller (see btsmart.health)
+
+        Args:
+            probe_interval (float, optional): the time between two probes in seconds. Defaults to 1.0.
+            thresholds: the thresholds passed to the LinkHealthMonitor
+
+        Returns:
+            LinkHealthMonitor: the started monitor
+        """
+        from .health import LinkHealthMonitor
+        monitor = LinkHealthMonitor(self, probe_interval, **thresholds)
+        monitor.start()
+        return monitor
+
     async def get_battery_level(self) -> int:
         """retrieves the battery level of the device
 
@@ -287,6 +452,56 @@ class BTSmartController:
         """
         self.input_listener[input] = callback
 
+    def sample_history(self, input: Input) -> list:
+        """returns the recently received samples of the given input (at most HISTORY_LENGTH)
+
+        Args:
+            input (Input): the input
+
+        Returns:
+            list: the (timestamp in ns, value) tuples in the order of arrival
+        """
+        return list(self._history[input])
+
+    def stream(self, inputs: list = None, batch: int = 1, max_latency: float = None, maxsize: int = 1024, overflow: str = "drop_oldest", columns: bool = False):
+        """opens a stream of input samples that can be consumed with 'async for'.
+
+        e.g. async for sample in controller.stream(inputs=[Input.I1], batch=10, max_latency=0.1): ...
+
+        Args:
+            inputs (list, optional): the inputs to be streamed. Defaults to all inputs.
+            batch (int, optional): the number of samples delivered at once - if greater than 1, lists of samples are delivered. Defaults to 1.
+            max_latency (float, optional): the maximum time in seconds a sample waits for its batch to be completed. Defaults to None.
+            maxsize (int, optional): the maximum number of queued samples. Defaults to 1024.
+            overflow (str, optional): what happens if the queue is full ("drop_oldest", "drop_newest" or "error"). Defaults to "drop_oldest".
+            columns (bool, optional): deliver batches as a tuple of arrays (inputs, values, timestamps). Defaults to False.
+
+        Returns:
+            InputStream: the stream (see btsmart.stream)
+        """
+        from .stream import InputStream
+        stream = InputStream(inputs, batch, max_latency, maxsize, overflow, columns)
+        stream._attach(self)
+        return stream
+
+    def add_sink(self, sink) -> None:
+        """registers a sink that receives every sample of its inputs (see btsmart.stream.SampleSink)
+
+        Args:
+            sink (SampleSink): the sink to be registered
+        """
+        if sink not in self._sinks:
+            self._sinks.append(sink)
+
+    def remove_sink(self, sink) -> None:
+        """unregisters a sink - unknown sinks are ignored
+
+        Args:
+            sink (SampleSink): the sink to be removed
+        """
+        if sink in self._sinks:
+            self._sinks.remove(sink)
+
     async def set_output_value(self, output: Output, value: int) -> None:
         """sets the output value of the given pin to the given value
 
@@ -299,6 +514,73 @@ class BTSmartController:
         """
         raise NotImplemented
 
+    async def set_output_values(self, values: dict[Output, int]) -> None:
+        """sets several outputs at once. Backends that are able to combine writes override this method,
+        the default implementation simply sets the outputs one after the other.
+
+        Args:
+            values (dict[Output, int]): the values to be set per output (must be in the range -100..100)
+
+        Raises:
+            Exception: if one of the values is invalid
+        """
+        for output, value in values.items():
+            await self.set_output_value(output, value)
+
+    def _check_output(self, value: int) -> None:
+        """validates an output value before it is written
+
+        Raises:
+            Exception: if the value is invalid or the outputs are latched by a safety stop
+        """
+        if value < int(-100) or value > int(100):
+            raise Exception("output must be in -100..100")
+        if self._safety_latched and value != 0:
+            raise Exception("outputs are latched by a safety stop")
+
+    def _set_safety_latch(self, latched: bool) -> None:
+        """latches the outputs after a safety stop (only 0 can be written) or releases them. This method is called
+        from other threads (see btsmart.watchdog) - backends that send frames from several threads override it to set
+        the latch in step with their frames.
+
+        Args:
+            latched (bool): True to latch the outputs, False to release them
+        """
+        self._safety_latched = latched
+    def _rule_write(self, outputs: dict[Output, int], led: LEDMode) -> None:
+        """issues the writes of a fired rule without waiting for them (see btsmart.rules). This method is called
+        synchronously while an input value is processed. Backends that can issue writes without awaiting override
+        this method, the default implementation schedules the writes as a task.
+
+        Args:
+            outputs (dict[Output, int]): the values to be set per output
+            led (LEDMode): the LED to be set or None
+        """
+        async def write():
+            try:
+                if outputs:
+                    await self.set_output_values(outputs)
+                if led is not None:
+                    await self.set_led(led)
+            except Exception as ex:
+                print("error in rule write:", ex)
+        asyncio.get_running_loop().create_task(write())
+
+    def _emergency_stop(self, loop: asyncio.AbstractEventLoop, timeout: float) -> None:
+        """sets all outputs to 0 and blocks until the device confirmed the writes. This method is called from a
+        thread other than the event loop's (see btsmart.watchdog). Backends that can access the device without the
+        event loop override this method, the default implementation runs the writes on the given loop.
+
+        Args:
+            loop (asyncio.AbstractEventLoop): the event loop the controller is used with
+            timeout (float): the maximum time to wait for the confirmation in seconds
+
+        Raises:
+            Exception: if the outputs could not be stopped in time
+        """
+        zero = {output: 0 for output in Output.all()}
+        asyncio.run_coroutine_threadsafe(self.set_output_values(zero), loop).result(timeout)
+
     async def get_output_value(self, output: Output) -> int:
         """retrieves the current output value
 
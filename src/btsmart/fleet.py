@@ -0,0 +1,148 @@
+"""
+This module provides a manager for many controllers that are used at the same time on one event loop.
+
+The fleet discovers all BT-Smart Controllers attached via USB or visible via BLE, connects them
+with bounded concurrency and identifies each controller by a stable id (BLE address or USB serial
+number). Input samples of all controllers can be consumed as one stream - each sample carries the
+id of its controller (InputSample.source).
+
+"""
+
+import asyncio
+
+from .controller import BTSmartController
+from .backend_ble import BTSmartController_BLE
+from .backend_usb import BTSmartController_USB
+from .stream import InputStream, DROP_OLDEST
+
+
+class ControllerFleet:
+    """A set of controllers identified by their id"""
+
+    def __init__(self, concurrency: int = 4) -> None:
+        """creates an empty fleet
+
+        Args:
+            concurrency (int, optional): the maximum number of controllers connected at the same time. Defaults to 4.
+
+        Raises:
+            Exception: if the concurrency is invalid
+        """
+        if concurrency < 1:
+            raise Exception("concurrency must be at least 1")
+        self.concurrency = concurrency
+        self.controllers: dict[str, BTSmartController] = dict()
+        """the controllers of the fleet by id"""
+        self._streams = []
+
+    def __len__(self) -> int:
+        return len(self.controllers)
+
+    def __iter__(self):
+        return iter(self.controllers.values())
+
+    def __getitem__(self, id: str) -> BTSmartController:
+        return self.controllers[id]
+
+    def __contains__(self, id: str) -> bool:
+        return id in self.controllers
+
+    def add(self, ctrl: BTSmartController) -> bool:
+        """adds a controller to the fleet. Open fleet streams are attached to the new controller.
+
+        Args:
+            ctrl (BTSmartController): the controller
+
+        Raises:
+            Exception: if the controller has no id
+
+        Returns:
+            bool: True if the controller has been added, False if a controller with the same id is already part of the fleet
+        """
+        if ctrl.id is None:
+            raise Exception("controller without id cannot be added to a fleet")
+        if ctrl.id in self.controllers:
+            return False
+        self.controllers[ctrl.id] = ctrl
+        for stream in self._streams:
+            stream._attach(ctrl)
+        return True
+
+    def remove(self, id: str) -> BTSmartController:
+        """removes the controller with the given id from the fleet (the controller is not disconnected)
+
+        Args:
+            id (str): the id of the controller
+
+        Returns:
+            BTSmartController: the removed controller or None
+        """
+        ctrl = self.controllers.pop(id, None)
+        if ctrl is not None:
+            for stream in self._streams:
+                stream._detach(ctrl)
+        return ctrl
+
+    async def discover(self, viaUSB: bool = True, viaBLE: bool = True, timeout: float = 5.0) -> list:
+        """looks for all controllers and adds the new ones to the fleet.
+        USB devices are opened in a worker thread, so the event loop stays responsive.
+
+        Args:
+            viaUSB (bool, optional): Should USB-Lookup be performed. Defaults to True.
+            viaBLE (bool, optional): Should BLE-Lookup be performed. Defaults to True.
+            timeout (float, optional): the BLE scan duration in seconds. Defaults to 5.0.
+
+        Returns:
+            list: the ids of the newly added controllers
+        """
+        lookups = []
+        if viaUSB:
+            lookups.append(asyncio.get_running_loop().run_in_executor(None, BTSmartController_USB.discover_all))
+        if viaBLE:
+            lookups.append(BTSmartController_BLE.discover_all(timeout))
+        found = []
+        for res in await asyncio.gather(*lookups, return_exceptions=True):
+            if isinstance(res, Exception):
+                print("discovery failed:", res)
+                continue
+            for ctrl in res:
+                if self.add(ctrl):
+                    found.append(ctrl.id)
+        return found
+
+    async def connect_all(self) -> dict[str, Exception]:
+        """connects all controllers of the fleet that are not yet connected - at most 'concurrency' at the same time
+
+        Returns:
+            dict[str, Exception]: the errors by controller id for all controllers that could not be connected
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        errors = dict()
+
+        async def connect(ctrl: BTSmartController) -> None:
+            async with semaphore:
+                try:
+                    await ctrl.connect()
+                except Exception as ex:
+                    errors[ctrl.id] = ex
+
+        await asyncio.gather(*[connect(ctrl) for ctrl in self.controllers.values() if not ctrl.is_connected()])
+        return errors
+
+    async def disconnect_all(self) -> None:
+        """disconnects all controllers of the fleet"""
+        await asyncio.gather(*[ctrl.disconnect() for ctrl in self.controllers.values()], return_exceptions=True)
+
+    def stream(self, inputs: list = None, batch: int = 1, max_latency: float = None, maxsize: int = 4096, overflow: str = DROP_OLDEST, columns: bool = False) -> InputStream:
+        """opens one stream of the input samples of all controllers of the fleet (see BTSmartController.stream).
+        Controllers that are added later are included automatically, the id of the controller is given by InputSample.source.
+
+        Returns:
+            InputStream: the stream
+        """
+        stream = InputStream(inputs, batch, max_latency, maxsize, overflow, columns)
+        for ctrl in self.controllers.values():
+            stream._attach(ctrl)
+        self._streams.append(stream)
+        stream._closed_cb = self._streams.remove
+        return stream
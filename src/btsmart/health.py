@@ -0,0 +1,187 @@
+"""
+This module provides a background monitor that keeps track of the quality of the link to a controller.
+
+The monitor periodically performs low-cost probes (see BTSmartController.probe) and observes
+the round trip latency, the gaps between input notifications, the frame error rate (USB) and
+the lag of the polling loop (USB). Whenever one of these values crosses its threshold a
+degradation event is raised, and a recovery event once it is back to normal.
+
+"""
+
+import asyncio
+import time
+
+from .controller import BTSmartController, _invoke
+
+
+LATENCY = "latency"
+"""event kind: the (smoothed) probe round trip time exceeds the threshold"""
+
+PROBE_FAILURE = "probe_failure"
+"""event kind: the number of consecutive failed probes exceeds the threshold"""
+
+INPUT_GAP = "input_gap"
+"""event kind: no input event has been received for longer than the threshold"""
+
+ERROR_RATE = "error_rate"
+"""event kind: the rate of failed frames exceeds the threshold"""
+
+POLL_LAG = "poll_lag"
+"""event kind: the polling loop falls behind its schedule by more than the threshold"""
+
+
+class HealthEvent:
+    """Describes a change of the link health"""
+
+    def __init__(self, kind: str, value: float, threshold: float, degraded: bool) -> None:
+        self.kind = kind
+        """the metric that changed (LATENCY, PROBE_FAILURE, INPUT_GAP, ERROR_RATE or POLL_LAG)"""
+        self.value = value
+        """the current value of the metric"""
+        self.threshold = threshold
+        """the configured threshold"""
+        self.degraded = degraded
+        """True if the link degraded, False if it recovered"""
+
+    def __str__(self):
+        return "{} {}: {:.4f} (threshold {:.4f})".format(self.kind, "degraded" if self.degraded else "recovered", self.value, self.threshold)
+
+
+class LinkHealthMonitor:
+    """Monitors the link to a controller in the background and raises events at configurable thresholds.
+    A threshold of None disables the according check."""
+
+    def __init__(self, ctrl: BTSmartController, probe_interval: float = 1.0, latency: float = 0.25, probe_failures: int = 3,
+                 input_gap: float = None, error_rate: float = 0.05, poll_lag: float = 0.05, smoothing: float = 0.3) -> None:
+        """creates the monitor - call start() to activate it
+
+        Args:
+            ctrl (BTSmartController): the controller to be monitored
+            probe_interval (float, optional): the time between two probes in seconds. Defaults to 1.0.
+            latency (float, optional): threshold for the smoothed round trip time in seconds. Defaults to 0.25.
+            probe_failures (int, optional): threshold for consecutive failed probes. Defaults to 3.
+            input_gap (float, optional): threshold for the time without input events in seconds. Defaults to None.
+            error_rate (float, optional): threshold for the rate of failed frames (0..1). Defaults to 0.05.
+            poll_lag (float, optional): threshold for the lag of the polling loop in seconds. Defaults to 0.05.
+            smoothing (float, optional): weight of a new latency sample in the moving average (0..1). Defaults to 0.3.
+
+        Raises:
+            Exception: if one of the parameters is invalid
+        """
+        if ctrl is None:
+            raise Exception("cannot monitor 'None'")
+        if probe_interval <= 0.0:
+            raise Exception("probe interval must be greater than 0.0")
+        if smoothing <= 0.0 or smoothing > 1.0:
+            raise Exception("smoothing must be in 0..1")
+        self.controller = ctrl
+        self.probe_interval = probe_interval
+        self.thresholds = {LATENCY: latency, PROBE_FAILURE: probe_failures, INPUT_GAP: input_gap, ERROR_RATE: error_rate, POLL_LAG: poll_lag}
+        """the thresholds per event kind"""
+        self.smoothing = smoothing
+        self.latency: float = None
+        """the smoothed round trip time in seconds"""
+        self.last_latency: float = None
+        """the round trip time of the last successful probe in seconds"""
+        self.failed_probes = 0
+        """the number of consecutive failed probes"""
+        self.error_rate = 0.0
+        """the rate of failed frames since the last probe"""
+        self._degraded = set()
+        self._degraded_cb = None
+        self._recovered_cb = None
+        self._degraded_hooks = []  # internal listeners (e.g. a safety watchdog), called before the callback
+        self._task: asyncio.Task = None
+        self._counters = (0, 0)
+
+    def on_degraded(self, callback) -> None:
+        """registers a function to be called when the link degrades.
+        The callback might be a normal or an async function and takes the HealthEvent as argument.
+
+        Args:
+            callback (function): the function to be called
+        """
+        self._degraded_cb = callback
+
+    def on_recovered(self, callback) -> None:
+        """registers a function to be called when a metric is back below its threshold.
+        The callback might be a normal or an async function and takes the HealthEvent as argument.
+
+        Args:
+            callback (function): the function to be called
+        """
+        self._recovered_cb = callback
+
+    def is_degraded(self) -> bool:
+        """tells if at least one metric is currently above its threshold"""
+        return len(self._degraded) > 0
+
+    def degraded_metrics(self) -> set:
+        """returns the kinds of all metrics that are currently above their threshold"""
+        return set(self._degraded)
+
+    def start(self) -> None:
+        """starts the monitor in the background"""
+        if self._task is None or self._task.done():
+            self._counters = self.controller._link_counters()
+            self._task = asyncio.get_event_loop().create_task(self._run(), name='BTSmartController health monitor')
+
+    def stop(self) -> None:
+        """stops the monitor"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        next_probe = loop.time()
+        while True:
+            await self.check()
+            next_probe = max(next_probe + self.probe_interval, loop.time())
+            await asyncio.sleep(next_probe - loop.time())
+
+    async def check(self) -> None:
+        """performs one probe and evaluates all metrics - this is called periodically by the background task"""
+        timeout = max(self.probe_interval, 4 * (self.thresholds[LATENCY] or 0.0))
+        try:
+            rtt = await asyncio.wait_for(self.controller.probe(), timeout)
+            self.failed_probes = 0
+            self.last_latency = rtt
+        except Exception:
+            # a failed probe counts as a round trip of the full timeout
+            self.failed_probes = self.failed_probes + 1
+            rtt = timeout
+        if self.latency is None:
+            self.latency = rtt
+        else:
+            self.latency = self.smoothing * rtt + (1.0 - self.smoothing) * self.latency
+        await self._evaluate(PROBE_FAILURE, self.failed_probes)
+        await self._evaluate(LATENCY, self.latency)
+        frames, errors = self.controller._link_counters()
+        sent = frames - self._counters[0]
+        if sent > 0:
+            self.error_rate = (errors - self._counters[1]) / sent
+            await self._evaluate(ERROR_RATE, self.error_rate)
+        self._counters = (frames, errors)
+        await self._evaluate(POLL_LAG, self.controller.poll_lag)
+        if self.controller._last_input_time is not None:
+            await self._evaluate(INPUT_GAP, time.monotonic() - self.controller._last_input_time)
+
+    async def _evaluate(self, kind: str, value: float) -> None:
+        threshold = self.thresholds[kind]
+        if threshold is None:
+            return
+        if value > threshold:
+            if kind not in self._degraded:
+                self._degraded.add(kind)
+                event = HealthEvent(kind, value, threshold, True)
+                for hook in list(self._degraded_hooks):
+                    try:
+                        hook(event)
+                    except Exception as ex:
+                        print("error in degraded hook:", ex)
+                await _invoke(self._degraded_cb, event)
+        elif kind in self._degraded:
+            self._degraded.discard(kind)
+            await _invoke(self._recovered_cb, HealthEvent(kind, value, threshold, False))
+
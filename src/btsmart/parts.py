@@ -14,7 +14,9 @@ Todo:
 """
 
 import asyncio
+import math
 from .controller import BTSmartController, Input, InputMode, Output
+from .waveform import Waveform, Ramp, EASE_IN_OUT, LINEAR
 
 class ElectronicsPart:
     """Simple base class for all representatives of electronical parts that might be attached to a controller.
@@ -64,11 +66,20 @@ class InputPart(ElectronicsPart):
 
 class OutputPart(ElectronicsPart):
     """Represents output parts, i.e. parts attached to the output-connectors."""
-    
+
+    MIN_LEVEL = -100
+    """the minimum output level of the part"""
+
+    MAX_LEVEL = 100
+    """the maximum output level of the part"""
+
     def __init__(self) -> None:
         super().__init__()
         self.lastValue: int = None
         self.outpin = Output.O1
+        self._pending = []  # handles of delayed actions registered with the controller's timer wheel
+        self._player: asyncio.Task = None  # background task playing a waveform
+        self._generation = 0  # incremented whenever a new action supersedes the running ones
 
     def attach(self, ctrl: BTSmartController, output: Output) -> None:
         """attaches the part to the given controller and the specified output port
@@ -85,6 +96,82 @@ class OutputPart(ElectronicsPart):
         self.outpin = output
         self.controller = ctrl
 
+    def _schedule_output(self, value: int, delay: float) -> None:
+        """registers a delayed write of the given value with the controller's timer wheel"""
+        self._pending.append(self.controller.timers.schedule_output(self.controller, self.outpin, value, delay))
+        self._pending.append(self.controller.timers.schedule(delay, setattr, self, "lastValue", value))
+
+    def _cancel_pending(self) -> None:
+        """cancels all delayed actions and waveforms of this part that have not been performed yet"""
+        self._generation += 1
+        for handle in self._pending:
+            handle.cancel()
+        self._pending.clear()
+        if self._player is not None:
+            if self._player is not asyncio.current_task():
+                self._player.cancel()
+            self._player = None
+
+    async def play(self, waveform: Waveform, rate: float = None, min_step: int = 1, wait: bool = True) -> None:
+        """plays the given waveform on the output. The waveform is sampled at the given rate, which is limited to
+        the rate the backend is able to sustain (BTSmartController.MAX_UPDATE_RATE). Samples that do not change
+        the output level by at least min_step are skipped, so the number of writes per second is bounded by the rate.
+        The final level of a waveform with limited duration is always written.
+        Starting another action on the part stops the waveform.
+
+        Args:
+            waveform (Waveform): the waveform to be played (see btsmart.waveform)
+            rate (float, optional): the update rate in writes per second. Defaults to the backend's maximum rate.
+            min_step (int, optional): the minimum level change that is written. Defaults to 1.
+            wait (bool, optional): if False, the waveform is played in the background. Defaults to True.
+
+        Raises:
+            Exception: if the part is not attached or one of the parameters is invalid
+        """
+        if not self.is_attached():
+            raise Exception("Part not attached to controller")
+        max_rate = self.controller.MAX_UPDATE_RATE
+        rate = max_rate if rate is None else min(rate, max_rate)
+        if rate <= 0.0:
+            raise Exception("rate must be greater than 0.0")
+        if min_step < 1:
+            raise Exception("min_step must be at least 1")
+        self._cancel_pending()
+        await self._start_waveform(waveform, rate, min_step, wait)
+
+    async def _start_waveform(self, waveform: Waveform, rate: float, min_step: int, wait: bool) -> None:
+        """plays the waveform as part of the current action (the caller has cancelled the previous ones)"""
+        if wait:
+            await self._play(waveform, rate, min_step, self._generation)
+        else:
+            self._player = asyncio.create_task(self._play(waveform, rate, min_step, self._generation))
+
+    def stop_waveform(self) -> None:
+        """stops a running waveform (and all other delayed actions) - the output keeps its current level"""
+        self._cancel_pending()
+
+    async def _play(self, waveform: Waveform, rate: float, min_step: int, generation: int) -> None:
+        loop = asyncio.get_running_loop()
+        interval = 1.0 / rate
+        start = loop.time()
+        last = self.lastValue
+        t = 0.0
+        while generation == self._generation:
+            done = waveform.duration is not None and t >= waveform.duration
+            if done:
+                t = waveform.duration
+            value = int(round(waveform.level(t)))
+            value = min(max(value, self.MIN_LEVEL), self.MAX_LEVEL)
+            if last is None or abs(value - last) >= min_step or (done and value != last):
+                await self.controller.set_output_value(self.outpin, value)
+                last = value
+                self.lastValue = value
+            if done:
+                break
+            step = math.floor(t / interval) + 1
+            await self.controller.timers.sleep(start + step * interval - loop.time())
+            t = loop.time() - start
+
 
 class Switch(InputPart):
     """Representation of a electrical switch, i.e. an elemnt that is either open or closed. Sitches might be buttons or light barriers"""
@@ -208,7 +295,9 @@ class LightBarrier(Switch):
 
 class Dimmer(OutputPart):
     """represents a dimmable part (e.g. a simple light) attached to an output port"""
-    
+
+    MIN_LEVEL = 0
+
     def __init__(self) -> None:
         super().__init__()
 
@@ -225,15 +314,36 @@ class Dimmer(OutputPart):
             raise Exception("Dimmer not attached to controller")
         if level < 0 or level > 100:
             raise Exception("Invalid dimmer value - must be in 0..100")
+        self._cancel_pending()
         await self.controller.set_output_value(self.outpin, level)
+        self.lastValue = level
 
-    async def blink(self, level: int = 100, time: float = 0.2, count: int = 1) -> None:
-        """makes the attached lamp blink
+    async def fade(self, level: int, time: float, easing=LINEAR, wait: bool = True) -> None:
+        """fades from the current level to the given level
+
+        Args:
+            level (int): the target level (0..100)
+            time (float): the duration of the fade in seconds
+            easing (function, optional): the easing of the ramp (see btsmart.waveform). Defaults to LINEAR.
+            wait (bool, optional): if False, the fade is performed in the background. Defaults to True.
+
+        Raises:
+            Exception: if one of the given values is invalid or the dimmer is not attached to the controller
+        """
+        if level < 0 or level > 100:
+            raise Exception("Invalid dimmer value - must be in 0..100")
+        start = self.lastValue if self.lastValue is not None else 0
+        await self.play(Ramp(start, level, time, easing), wait=wait)
+
+    async def blink(self, level: int = 100, time: float = 0.2, count: int = 1, wait: bool = True) -> None:
+        """makes the attached lamp blink. The switching is done by the controller's timer wheel.
 
         Args:
             level (int, optional): the brightness (see level). Defaults to 100.
             time (float, optional): the interval duration. Defaults to 0.2.
             count (int, optional): the number ob blinks. Defaults to 1.
+            wait (bool, optional): if False, the method returns immediately after the first write and the
+                remaining switching is done in the background. Defaults to True.
 
         Raises:
             Exception: if one of the given values is invalid or the dimmer is not attached to the controller
@@ -246,12 +356,26 @@ class Dimmer(OutputPart):
             raise Exception("Invalid blink time - must be greater than 0.0")
         if count <= 0:
             raise Exception("Invalid count - must be greater than 0")
-        for c in range(count):
-            await self.controller.set_output_value(self.outpin, level)
-            await asyncio.sleep(time)
+        self._cancel_pending()
+        generation = self._generation
+        await self.controller.set_output_value(self.outpin, level)
+        self.lastValue = level
+        for c in range(count - 1):
+            self._schedule_output(0, (2 * c + 1) * time)
+            self._schedule_output(level, (2 * c + 2) * time)
+        if wait:
+            try:
+                await self.controller.timers.sleep((2 * count - 1) * time)
+            except asyncio.CancelledError:
+                self._cancel_pending()
+                raise
+            if generation != self._generation:
+                return  # another action took over the output
+            self._pending.clear()
             await self.controller.set_output_value(self.outpin, 0)
-            if c < count - 1:
-                await asyncio.sleep(time)
+            self.lastValue = 0
+        else:
+            self._schedule_output(0, (2 * count - 1) * time)
 
 
 class MotorXS(OutputPart):
@@ -274,13 +398,17 @@ class MotorXS(OutputPart):
     def _rpm_to_level(self, rpm) -> int:
         return int(rpm / MotorXS.MAX_RPM * 100)
 
-    async def run_at(self, speed: int, direction: bool = FORWARD, time: float = 0.0) -> None:
+    async def run_at(self, speed: int, direction: bool = FORWARD, time: float = 0.0, wait: bool = True, ramp: float = 0.0) -> None:
         """run the motor at the given speed and direction for the given time.
 
         Args:
             speed (int): the speed in RPM (must be in 0..MAX_RPM)
             direction (bool, optional): the direction. Defaults to FORWARD.
             time (float, optional): if specified, the motor is automaticallly stopped after that time. Defaults to 0.0.
+            wait (bool, optional): if False, the method returns immediately and the stop is performed
+                by the controller's timer wheel. Defaults to True.
+            ramp (float, optional): if specified, the motor is softly accelerated to the given speed within that time
+                (the ramp is part of the run time). Defaults to 0.0.
 
         Raises:
             Exception: if one of the parameters is invalid or the motor is not attached to the controller
@@ -291,10 +419,25 @@ class MotorXS(OutputPart):
             raise Exception("Invalid speed value - must be in 0.." + str(MotorXS.MAX_RPM))
         if time < 0.0:
             raise Exception("time must be greater or equal to 0.0")
+        if ramp < 0.0 or (time > 0.0 and ramp > time):
+            raise Exception("ramp must be in 0.0..time")
         level = self._rpm_to_level(speed)
         if direction == MotorXS.BACKWARD:
             level = -level
-        await self.controller.set_output_value(self.outpin, level)
+        self._cancel_pending()
+        generation = self._generation
+        if ramp > 0.0:
+            start = self.lastValue if self.lastValue is not None else 0
+            await self._start_waveform(Ramp(start, level, ramp, EASE_IN_OUT), self.controller.MAX_UPDATE_RATE, 1, wait)
+            time = max(time - ramp, 0.0) if wait else time
+        else:
+            await self.controller.set_output_value(self.outpin, level)
+            self.lastValue = level
         if time > 0.0:
-            await asyncio.sleep(time)
-            await self.controller.set_output_value(self.outpin, 0)
+            if wait:
+                await self.controller.timers.sleep(time)
+                if generation == self._generation:  # not superseded by another action
+                    await self.controller.set_output_value(self.outpin, 0)
+                    self.lastValue = 0
+            else:
+                self._schedule_output(0, time)
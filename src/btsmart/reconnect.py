@@ -0,0 +1,124 @@
+"""
+This module provides a supervisor that automatically reconnects a controller after the link has been lost.
+
+After a reconnect the device is not reset (no LED animation, no input reset) but the last known
+state of the controller (LED, input modes, output values and notifications) is restored.
+
+"""
+
+import asyncio
+import time
+
+from .controller import BTSmartController, _invoke
+
+
+class ReconnectReport:
+    """Describes a successful recovery of a lost link"""
+
+    def __init__(self, outage: float, restore: float, attempts: int) -> None:
+        self.outage = outage
+        """the time in seconds from the loss of the link until the state has been restored"""
+        self.restore = restore
+        """the time in seconds needed to restore the state after the link has been reopened"""
+        self.attempts = attempts
+        """the number of connection attempts"""
+
+    def __str__(self):
+        return "reconnected after {:.3f}s ({} attempts, restore {:.3f}s)".format(self.outage, self.attempts, self.restore)
+
+
+class ReconnectSupervisor:
+    """Watches a controller and reconnects it with exponential backoff whenever the link is lost unexpectedly."""
+
+    def __init__(self, ctrl: BTSmartController, initial_delay: float = 0.2, max_delay: float = 10.0, factor: float = 2.0, max_attempts: int = None) -> None:
+        """creates the supervisor - call start() to activate it
+
+        Args:
+            ctrl (BTSmartController): the controller to be supervised
+            initial_delay (float, optional): the delay before the second attempt in seconds. Defaults to 0.2.
+            max_delay (float, optional): the maximum delay between two attempts in seconds. Defaults to 10.0.
+            factor (float, optional): the factor the delay grows with after each failed attempt. Defaults to 2.0.
+            max_attempts (int, optional): the maximum number of attempts, None means unlimited. Defaults to None.
+
+        Raises:
+            Exception: if one of the parameters is invalid
+        """
+        if ctrl is None:
+            raise Exception("cannot supervise 'None'")
+        if initial_delay < 0.0 or max_delay < initial_delay:
+            raise Exception("invalid delays")
+        if factor < 1.0:
+            raise Exception("factor must be at least 1.0")
+        self.controller = ctrl
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.max_attempts = max_attempts
+        self.last_report: ReconnectReport = None
+        """the report of the last successful reconnect"""
+        self._reconnected = None
+        self._failed = None
+        self._task: asyncio.Task = None
+        self._active = False
+
+    def on_reconnect(self, callback) -> None:
+        """registers a function to be called after the controller has been reconnected.
+        The callback might be a normal or an async function and takes the ReconnectReport as argument.
+
+        Args:
+            callback (function): the function to be called
+        """
+        self._reconnected = callback
+
+    def on_give_up(self, callback) -> None:
+        """registers a function to be called when the maximum number of attempts has been reached.
+        The callback might be a normal or an async function and takes the last exception as argument.
+
+        Args:
+            callback (function): the function to be called
+        """
+        self._failed = callback
+
+    def start(self) -> None:
+        """activates the supervisor"""
+        if not self._active:
+            self._active = True
+            self.controller._disconnect_hooks.append(self._on_disconnect)
+
+    def stop(self) -> None:
+        """deactivates the supervisor and stops a running recovery"""
+        if self._active:
+            self._active = False
+            self.controller._disconnect_hooks.remove(self._on_disconnect)
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def is_recovering(self) -> bool:
+        """tells if the supervisor is currently trying to reconnect"""
+        return self._task is not None and not self._task.done()
+
+    def _on_disconnect(self, ctrl: BTSmartController) -> None:
+        if not self._active or ctrl._user_disconnect or self.is_recovering():
+            return
+        self._task = asyncio.get_event_loop().create_task(self._recover(time.perf_counter()), name='BTSmartController reconnect')
+
+    async def _recover(self, lost: float) -> None:
+        delay = self.initial_delay
+        attempts = 0
+        while self._active and not self.controller._user_disconnect:
+            attempts = attempts + 1
+            try:
+                restore = await self.controller.reconnect()
+            except Exception as ex:
+                print("reconnect attempt", attempts, "failed:", ex)
+                if self.max_attempts is not None and attempts >= self.max_attempts:
+                    await _invoke(self._failed, ex)
+                    return
+                await asyncio.sleep(delay)
+                delay = min(delay * self.factor, self.max_delay)
+                continue
+            self.last_report = ReconnectReport(time.perf_counter() - lost, restore, attempts)
+            await _invoke(self._reconnected, self.last_report)
+            return
+
@@ -0,0 +1,318 @@
+"""
+This module provides declarative rules of the form "when input X crosses Y, set output Z".
+
+Conditions are built from thresholds, edges and ranges and combined with &, | and ~. A rule fires its
+actions when its condition becomes true (and optionally other actions when it becomes false again).
+
+e.g.
+    engine = RuleEngine(controller)
+    engine.add(Rule(Below(Input.I1, 100), then=[SetOutput(Output.O1, 100), SetLED(LEDMode.BLUE)],
+                    otherwise=[SetOutput(Output.O1, 0), SetLED(LEDMode.YELLOW)]))
+    engine.start()
+
+The rules are compiled into a flat table (per input: the rules depending on it, with their predicates and
+pre-merged writes). The table is evaluated synchronously by the backends when an input value arrives - in the
+USB poll step or the BLE notification handler - before any callback task is created. The writes are issued
+right away: USB writes the frames directly, BLE queues the writes with actuator priority. So the reaction
+does not depend on the load of the event loop.
+
+Rule writes bypass the output parts (e.g. running waveforms are not stopped) and honour the safety latch
+of the watchdog: non-zero output values are not written while the outputs are latched.
+
+"""
+
+from .controller import LEDMode, Input, Output, BTSmartController
+
+
+class Condition:
+    """Abstract base class of all conditions. Conditions are combined with & (and), | (or) and ~ (not)."""
+
+    def __init__(self, inputs: frozenset) -> None:
+        self.inputs = inputs
+        """the inputs the condition depends on"""
+
+    def _compile(self):
+        """returns a function (values, input, previous) -> bool, where values holds the current values
+        by input number, input is the number of the input that just changed and previous its former value.
+
+        This method must be implemented in derived classes
+        """
+        raise NotImplemented
+
+    def __and__(self, other: 'Condition') -> 'Condition':
+        return All(self, other)
+
+    def __or__(self, other: 'Condition') -> 'Condition':
+        return Any(self, other)
+
+    def __invert__(self) -> 'Condition':
+        return Not(self)
+
+
+class Above(Condition):
+    """True while the input value is above the level. With hysteresis, the condition only turns false again
+    when the value falls below level - hysteresis."""
+
+    def __init__(self, input: Input, level: int, hysteresis: int = 0) -> None:
+        super().__init__(frozenset([input]))
+        self.input = input
+        self.level = level
+        self.hysteresis = hysteresis
+
+    def _compile(self):
+        i, on, off = self.input.value, self.level, self.level - self.hysteresis
+        if on == off:
+            return lambda values, input, previous: values[i] > on
+        state = [False]
+        def predicate(values, input, previous):
+            state[0] = values[i] > (off if state[0] else on)
+            return state[0]
+        return predicate
+
+
+class Below(Condition):
+    """True while the input value is below the level. With hysteresis, the condition only turns false again
+    when the value rises above level + hysteresis."""
+
+    def __init__(self, input: Input, level: int, hysteresis: int = 0) -> None:
+        super().__init__(frozenset([input]))
+        self.input = input
+        self.level = level
+        self.hysteresis = hysteresis
+
+    def _compile(self):
+        i, on, off = self.input.value, self.level, self.level + self.hysteresis
+        if on == off:
+            return lambda values, input, previous: values[i] < on
+        state = [False]
+        def predicate(values, input, previous):
+            state[0] = values[i] < (off if state[0] else on)
+            return state[0]
+        return predicate
+
+
+class Between(Condition):
+    """True while the input value is in the range low..high (both included)"""
+
+    def __init__(self, input: Input, low: int, high: int) -> None:
+        if low > high:
+            raise Exception("low must not be greater than high")
+        super().__init__(frozenset([input]))
+        self.input = input
+        self.low = low
+        self.high = high
+
+    def _compile(self):
+        i, low, high = self.input.value, self.low, self.high
+        return lambda values, input, previous: low <= values[i] <= high
+
+
+class Rising(Condition):
+    """True for the one sample at which the input value crosses the level upwards"""
+
+    def __init__(self, input: Input, level: int) -> None:
+        super().__init__(frozenset([input]))
+        self.input = input
+        self.level = level
+
+    def _compile(self):
+        i, level = self.input.value, self.level
+        return lambda values, input, previous: input == i and previous <= level < values[i]
+
+
+class Falling(Condition):
+    """True for the one sample at which the input value crosses the level downwards"""
+
+    def __init__(self, input: Input, level: int) -> None:
+        super().__init__(frozenset([input]))
+        self.input = input
+        self.level = level
+
+    def _compile(self):
+        i, level = self.input.value, self.level
+        return lambda values, input, previous: input == i and previous >= level > values[i]
+
+
+class All(Condition):
+    """True if all of the given conditions are true"""
+
+    def __init__(self, *conditions: Condition) -> None:
+        super().__init__(frozenset().union(*[c.inputs for c in conditions]))
+        self.conditions = conditions
+
+    def _compile(self):
+        predicates = [c._compile() for c in self.conditions]
+        # all predicates are evaluated (no short circuit), so stateful conditions (hysteresis) stay up to date
+        return lambda values, input, previous: all([p(values, input, previous) for p in predicates])
+
+
+class Any(Condition):
+    """True if at least one of the given conditions is true"""
+
+    def __init__(self, *conditions: Condition) -> None:
+        super().__init__(frozenset().union(*[c.inputs for c in conditions]))
+        self.conditions = conditions
+
+    def _compile(self):
+        predicates = [c._compile() for c in self.conditions]
+        return lambda values, input, previous: any([p(values, input, previous) for p in predicates])
+
+
+class Not(Condition):
+    """True if the given condition is false"""
+
+    def __init__(self, condition: Condition) -> None:
+        super().__init__(condition.inputs)
+        self.condition = condition
+
+    def _compile(self):
+        predicate = self.condition._compile()
+        return lambda values, input, previous: not predicate(values, input, previous)
+
+
+class SetOutput:
+    """Action: sets an output to a value"""
+
+    def __init__(self, output: Output, value: int) -> None:
+        if value < -100 or value > 100:
+            raise Exception("output must be in -100..100")
+        self.output = output
+        self.value = value
+
+
+class SetLED:
+    """Action: sets the LED"""
+
+    def __init__(self, led: LEDMode) -> None:
+        self.led = led
+
+
+class Rule:
+    """Fires the 'then' actions when the condition becomes true and the 'otherwise' actions when it becomes false"""
+
+    def __init__(self, when: Condition, then: list = None, otherwise: list = None, name: str = None) -> None:
+        """creates the rule
+
+        Args:
+            when (Condition): the condition
+            then (list, optional): the actions (SetOutput, SetLED) fired when the condition becomes true. Defaults to None.
+            otherwise (list, optional): the actions fired when the condition becomes false. Defaults to None.
+            name (str, optional): a name for diagnostics. Defaults to None.
+        """
+        self.when = when
+        self.then = then or []
+        self.otherwise = otherwise or []
+        self.name = name
+        self.fired = 0
+        """the number of times the rule fired (then or otherwise)"""
+
+    def _writes(self, actions: list):
+        """merges the actions into (output values, LED) - later actions win"""
+        if not actions:
+            return None
+        outputs = dict()
+        led = None
+        for action in actions:
+            if isinstance(action, SetOutput):
+                outputs[action.output] = action.value
+            elif isinstance(action, SetLED):
+                led = action.led
+            else:
+                raise Exception("unknown action: " + str(action))
+        return (outputs, led)
+
+
+class RuleEngine:
+    """Evaluates rules inline when input values arrive (see the module description)"""
+
+    def __init__(self, ctrl: BTSmartController) -> None:
+        """creates the engine - call start() to activate the rules
+
+        Args:
+            ctrl (BTSmartController): the controller
+        """
+        if ctrl is None:
+            raise Exception("cannot run rules on 'None'")
+        self.controller = ctrl
+        self.rules = []
+        """the rules in evaluation order"""
+        self._table = {input.value: () for input in Input.all()}
+        self._states = []
+        self._compiled = []  # the rules the states belong to
+        self._values = [0, 0, 0, 0]
+
+    def add(self, rule: Rule) -> Rule:
+        """adds a rule - the rules are recompiled
+
+        Args:
+            rule (Rule): the rule
+
+        Returns:
+            Rule: the rule
+        """
+        self.rules.append(rule)
+        self._compile()
+        return rule
+
+    def remove(self, rule: Rule) -> None:
+        """removes a rule - the rules are recompiled
+
+        Args:
+            rule (Rule): the rule
+        """
+        self.rules.remove(rule)
+        self._compile()
+
+    def start(self) -> None:
+        """activates the rules - only one engine is active per controller"""
+        self._compile()
+        self.controller._rules = self
+
+    def stop(self) -> None:
+        """deactivates the rules"""
+        if self.controller._rules is self:
+            self.controller._rules = None
+
+    def _compile(self) -> None:
+        for input in Input.all():
+            history = self.controller._history[input]
+            self._values[input.value] = history[-1][1] if history else 0
+        entries = []
+        for index, rule in enumerate(self.rules):
+            entries.append((index, rule.when, rule.when._compile(), rule._writes(rule.then), rule._writes(rule.otherwise)))
+        self._table = {input.value: tuple((index, predicate, on, off) for index, when, predicate, on, off in entries if input in when.inputs) for input in Input.all()}
+        # rules that are currently true must not fire again because another rule was added or removed
+        previous = {id(rule): state for rule, state in zip(self._compiled, self._states)}
+        self._states = [previous.get(id(rule), False) for rule in self.rules]
+        self._compiled = list(self.rules)
+
+    def _evaluate(self, input: Input, value: int) -> None:
+        """called synchronously by the controller for every received input value"""
+        i = input.value
+        values = self._values
+        previous = values[i]
+        values[i] = value
+        states = self._states
+        for index, predicate, on, off in self._table[i]:
+            try:
+                state = predicate(values, i, previous)
+                if state == states[index]:
+                    continue
+                states[index] = state
+                writes = on if state else off
+                self.rules[index].fired += 1
+                if writes is not None:
+                    self._write(*writes)
+            except Exception as ex:
+                print("error in rule", self.rules[index].name or index, ":", ex)
+
+    def _write(self, outputs: dict, led: LEDMode) -> None:
+        ctrl = self.controller
+        if ctrl._safety_latched:
+            outputs = {output: value for output, value in outputs.items() if value == 0}
+        ctrl._rule_write(outputs, led)
+        for output, value in outputs.items():
+            ctrl._output_values[output] = value
+        if led is not None:
+            ctrl._led = led
+        ctrl._state_changed()
@@ -0,0 +1,225 @@
+"""
+This module provides a hashed timer wheel that is used to schedule delayed actions
+(e.g. switching off an output after a blink interval) for all parts attached to a controller.
+
+Instead of running one coroutine with its own sleeps per delayed action, all actions are
+registered with a single wheel that is driven by one task. Actions that become due within
+the same tick are processed together and output writes to the same controller are combined
+into one call of BTSmartController.set_output_values().
+
+"""
+
+import asyncio
+import math
+
+
+class TimerHandle:
+    """Handle of an action that has been registered with a TimerWheel. The handle can be used to cancel the action."""
+
+    __slots__ = ("_wheel", "_slot", "_rounds", "_callback", "_args", "_cancelled", "deadline")
+
+    def __init__(self, wheel, slot: int, rounds: int, deadline: float, callback, args) -> None:
+        self._wheel = wheel
+        self._slot = slot
+        self._rounds = rounds
+        self._callback = callback
+        self._args = args
+        self._cancelled = False
+        self.deadline = deadline
+        """the (loop-)time at which the action is due"""
+
+    def cancel(self) -> None:
+        """cancels the action - cancelling an action that already fired has no effect"""
+        if not self._cancelled:
+            self._cancelled = True
+            self._wheel._remove(self)
+
+    def cancelled(self) -> bool:
+        """tells if the action has been cancelled"""
+        return self._cancelled
+
+
+class _OutputAction:
+    """marker callback for output writes - these are collected per tick and combined per controller"""
+
+    __slots__ = ("controller", "output", "value")
+
+    def __init__(self, controller, output, value: int) -> None:
+        self.controller = controller
+        self.output = output
+        self.value = value
+
+
+class TimerWheel:
+    """A hashed timer wheel with O(1) insertion and cancellation.
+
+    The wheel consists of a fixed number of slots, each covering one tick of the given resolution.
+    Actions that lie further in the future than one revolution are kept in their slot with a round counter.
+    The wheel is driven by a single task that only runs while actions are pending.
+    """
+
+    def __init__(self, resolution: float = 0.01, slots: int = 256) -> None:
+        """creates a new timer wheel
+
+        Args:
+            resolution (float, optional): the duration of one tick in seconds. Defaults to 0.01.
+            slots (int, optional): the number of slots of the wheel. Defaults to 256.
+
+        Raises:
+            Exception: if one of the parameters is invalid
+        """
+        if resolution <= 0.0:
+            raise Exception("resolution must be greater than 0.0")
+        if slots <= 0:
+            raise Exception("number of slots must be greater than 0")
+        self.resolution = resolution
+        self._slots = [dict() for _ in range(slots)]
+        self._count = 0
+        self._tick = 0
+        self._epoch = 0.0
+        self._task: asyncio.Task = None
+        self.tasks = set()
+        """the running tasks started by fired actions (async callbacks and output writes)"""
+
+    def __len__(self) -> int:
+        """returns the number of pending actions"""
+        return self._count
+
+    def schedule(self, delay: float, callback, *args) -> TimerHandle:
+        """registers a callback to be called after the given delay.
+        The callback might be a normal function or an async function, async functions are run as a task.
+
+        Args:
+            delay (float): the delay in seconds
+            callback (function): the function to be called
+            args: the arguments passed to the callback
+
+        Returns:
+            TimerHandle: the handle that can be used to cancel the action
+        """
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if self._count == 0 and (self._task is None or self._task.done()):
+            self._epoch = now
+            self._tick = 0
+        target = max(self._tick + 1, math.ceil((now + max(delay, 0.0) - self._epoch) / self.resolution))
+        n = len(self._slots)
+        slot = target % n
+        rounds = (target - self._tick - 1) // n
+        handle = TimerHandle(self, slot, rounds, self._epoch + target * self.resolution, callback, args)
+        self._slots[slot][handle] = None
+        self._count += 1
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run(), name='BTSmart timer wheel')
+        return handle
+
+    def schedule_output(self, controller, output, value: int, delay: float) -> TimerHandle:
+        """registers an output write to be performed after the given delay.
+        All writes of a controller that become due within the same tick are combined into one call
+        of set_output_values(). If several writes for the same output are due, the last registered one wins.
+
+        Args:
+            controller (BTSmartController): the controller to write to
+            output (Output): the output (O1 or O2)
+            value (int): the value to be set
+            delay (float): the delay in seconds
+
+        Returns:
+            TimerHandle: the handle that can be used to cancel the action
+        """
+        return self.schedule(delay, _OutputAction(controller, output, value))
+
+    async def sleep(self, delay: float) -> None:
+        """suspends the caller for the given time using the wheel instead of a separate timer
+
+        Args:
+            delay (float): the time to sleep in seconds
+
+        Raises:
+            asyncio.CancelledError: if the sleep has been cancelled by cancel_all()
+        """
+        future = asyncio.get_running_loop().create_future()
+        handle = self.schedule(delay, _wake, future, asyncio.current_task())
+        try:
+            await future
+        finally:
+            handle.cancel()
+
+    def cancel_all(self) -> list:
+        """cancels all pending actions - callers suspended in sleep() receive a CancelledError
+
+        Returns:
+            list: the tasks whose sleep has been cancelled
+        """
+        sleepers = []
+        for slot in self._slots:
+            for handle in list(slot):
+                handle.cancel()
+                if handle._callback is _wake:
+                    future, task = handle._args
+                    if future.cancel() and task is not None:
+                        sleepers.append(task)
+        return sleepers
+
+    def _start(self, coro) -> None:
+        """runs a coroutine of a fired action as a task - the wheel keeps the running tasks (see tasks)"""
+        task = asyncio.get_running_loop().create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def _remove(self, handle: TimerHandle) -> None:
+        slot = self._slots[handle._slot]
+        if handle in slot:
+            del slot[handle]
+            self._count -= 1
+
+    async def _run(self) -> None:
+        """the driver task - advances the wheel tick by tick as long as actions are pending"""
+        loop = asyncio.get_running_loop()
+        while self._count > 0:
+            delay = self._epoch + (self._tick + 1) * self.resolution - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._tick += 1
+            self._advance(self._slots[self._tick % len(self._slots)])
+
+    def _advance(self, slot: dict) -> None:
+        """processes all actions of the current slot that are due"""
+        due = []
+        for handle in list(slot):
+            if handle._rounds > 0:
+                handle._rounds -= 1
+            else:
+                del slot[handle]
+                self._count -= 1
+                handle._cancelled = True
+                due.append(handle)
+        if not due:
+            return
+        writes = {}
+        for handle in due:
+            action = handle._callback
+            if isinstance(action, _OutputAction):
+                writes.setdefault(action.controller, {})[action.output] = action.value
+        for controller, values in writes.items():
+            self._start(_write_outputs(controller, values))
+        for handle in due:
+            if not isinstance(handle._callback, _OutputAction):
+                try:
+                    res = handle._callback(*handle._args)
+                    if asyncio.iscoroutine(res):
+                        self._start(res)
+                except Exception as ex:
+                    print("error in timer callback:", ex)
+
+
+def _wake(future: asyncio.Future, task: asyncio.Task = None) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+async def _write_outputs(controller, values: dict) -> None:
+    try:
+        await controller.set_output_values(values)
+    except Exception as ex:
+        print("error in timed output write:", ex)
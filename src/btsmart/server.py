@@ -0,0 +1,193 @@
+"""
+This module provides a server that owns a controller and shares it with other processes
+(see btsmart.backend_remote for the client side and the protocol).
+
+The server fans out the input samples to all subscribed clients and arbitrates the outputs:
+an output is owned by the first client that sets a non-zero value until that client releases it
+or disconnects. Setting an output to 0 is always allowed, so every client is able to stop an output.
+
+Start the server from the command line with 'btsmart serve' (see 'btsmart serve --help').
+
+"""
+
+import asyncio
+import json
+import os
+
+from .controller import Input, Output, InputMode, BTSmartController, InputSample
+from .stream import SampleSink
+from .backend_remote import (DEFAULT_PORT, _HEADER, _frame, _parse_address, _LEDS, _NO_MODE,
+                             _KIND_REQUEST, _KIND_REPLY, _KIND_ERROR, _KIND_EVENT, _RID_UNSOLICITED,
+                             _OP_HELLO, _OP_SET_LED, _OP_GET_LED, _OP_SET_INPUT_MODE, _OP_GET_INPUT_MODE,
+                             _OP_GET_INPUT_VALUE, _OP_SET_OUTPUT, _OP_GET_OUTPUT, _OP_GET_BATTERY,
+                             _OP_GET_DEVICE_INFO, _OP_SUBSCRIBE, _OP_RELEASE_OUTPUT, _OP_SAMPLE,
+                             _U8, _I8, _U8U8, _U8I8, _MEASUREMENT, _SAMPLE)
+
+
+class _Client:
+    __slots__ = ("writer", "inputs", "dropped")
+
+    def __init__(self, writer: asyncio.StreamWriter) -> None:
+        self.writer = writer
+        self.inputs = frozenset()  # subscribed inputs
+        self.dropped = 0  # events dropped because the client did not keep up
+
+
+class ControllerServer(SampleSink):
+    """Shares one controller with many clients over a local socket"""
+
+    MAX_CLIENT_BUFFER = 64 * 1024
+    """events are dropped for clients whose send buffer exceeds this size (in bytes)"""
+
+    def __init__(self, ctrl: BTSmartController, address: str = "127.0.0.1:" + str(DEFAULT_PORT)) -> None:
+        """creates the server - call start() to accept clients
+
+        Args:
+            ctrl (BTSmartController): the (connected) controller to be shared
+            address (str, optional): "unix:/path", "host:port" or "host". Defaults to localhost and DEFAULT_PORT.
+        """
+        if ctrl is None:
+            raise Exception("cannot serve 'None'")
+        super().__init__()
+        self.controller = ctrl
+        self.address = address
+        self._server: asyncio.AbstractServer = None
+        self._clients = set()
+        self._owners = {Output.O1: None, Output.O2: None}
+        self._handlers = {
+            _OP_HELLO: self._hello,
+            _OP_SET_LED: self._set_led,
+            _OP_GET_LED: self._get_led,
+            _OP_SET_INPUT_MODE: self._set_input_mode,
+            _OP_GET_INPUT_MODE: self._get_input_mode,
+            _OP_GET_INPUT_VALUE: self._get_input_value,
+            _OP_SET_OUTPUT: self._set_output,
+            _OP_GET_OUTPUT: self._get_output,
+            _OP_GET_BATTERY: self._get_battery,
+            _OP_GET_DEVICE_INFO: self._get_device_information,
+            _OP_SUBSCRIBE: self._subscribe,
+            _OP_RELEASE_OUTPUT: self._release_output,
+        }
+
+    async def start(self) -> None:
+        """starts accepting clients"""
+        parsed = _parse_address(self.address)
+        if parsed[0] == "unix":
+            if os.path.exists(parsed[1]):
+                os.remove(parsed[1])
+            self._server = await asyncio.start_unix_server(self._handle, parsed[1])
+        else:
+            self._server = await asyncio.start_server(self._handle, parsed[1], parsed[2])
+        self.controller.add_sink(self)
+        print("serving", self.controller.id, "at", self.address)
+
+    async def serve_forever(self) -> None:
+        """starts the server (if not yet started) and serves until the task is cancelled"""
+        if self._server is None:
+            await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self) -> None:
+        """stops the server and disconnects all clients"""
+        self.controller.remove_sink(self)
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        for client in list(self._clients):
+            client.writer.close()
+
+    def push(self, sample: InputSample) -> None:
+        """fans the sample out to all subscribed clients"""
+        frame = None
+        for client in self._clients:
+            if sample.input in client.inputs:
+                transport = client.writer.transport
+                if transport.get_write_buffer_size() > self.MAX_CLIENT_BUFFER:
+                    client.dropped += 1
+                    continue
+                if frame is None:
+                    frame = _frame(_KIND_EVENT, _OP_SAMPLE, _RID_UNSOLICITED, _SAMPLE.pack(sample.input.value, sample.value, sample.timestamp))
+                transport.write(frame)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        client = _Client(writer)
+        self._clients.add(client)
+        try:
+            while True:
+                kind, op, rid, n = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+                payload = await reader.readexactly(n) if n > 0 else b''
+                if kind != _KIND_REQUEST:
+                    continue
+                try:
+                    handler = self._handlers.get(op)
+                    if handler is None:
+                        raise Exception("unknown operation " + str(op))
+                    writer.write(_frame(_KIND_REPLY, op, rid, await handler(client, payload)))
+                except Exception as ex:
+                    writer.write(_frame(_KIND_ERROR, op, rid, str(ex).encode('utf-8')))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._clients.discard(client)
+            for output, owner in self._owners.items():
+                if owner is client:
+                    self._owners[output] = None
+            writer.close()
+
+    async def _hello(self, client: _Client, payload: bytes) -> bytes:
+        return (self.controller.id or "").encode('utf-8')
+
+    async def _set_led(self, client: _Client, payload: bytes) -> bytes:
+        await self.controller.set_led(_LEDS[_U8.unpack(payload)[0]])
+        return b''
+
+    async def _get_led(self, client: _Client, payload: bytes) -> bytes:
+        return _U8.pack(_LEDS.index(await self.controller.get_led()))
+
+    async def _set_input_mode(self, client: _Client, payload: bytes) -> bytes:
+        input, mode = _U8U8.unpack(payload)
+        await self.controller.set_input_mode(Input(input), InputMode(mode))
+        return b''
+
+    async def _get_input_mode(self, client: _Client, payload: bytes) -> bytes:
+        return _U8.pack((await self.controller.get_input_mode(Input(_U8.unpack(payload)[0]))).value)
+
+    async def _get_input_value(self, client: _Client, payload: bytes) -> bytes:
+        input, mode = _U8U8.unpack(payload)
+        m = await self.controller.get_input_value(Input(input), None if mode == _NO_MODE else InputMode(mode))
+        return _MEASUREMENT.pack(m.value, _NO_MODE if m.unit is None else m.unit.value)
+
+    async def _set_output(self, client: _Client, payload: bytes) -> bytes:
+        num, value = _U8I8.unpack(payload)
+        output = Output(num)
+        owner = self._owners[output]
+        if value != 0:
+            if owner is not None and owner is not client:
+                raise Exception("output " + output.name + " is owned by another client")
+            self._owners[output] = client
+        await self.controller.set_output_value(output, value)
+        return b''
+
+    async def _release_output(self, client: _Client, payload: bytes) -> bytes:
+        output = Output(_U8.unpack(payload)[0])
+        if self._owners[output] is client:
+            self._owners[output] = None
+        return b''
+
+    async def _get_output(self, client: _Client, payload: bytes) -> bytes:
+        return _I8.pack(await self.controller.get_output_value(Output(_U8.unpack(payload)[0])))
+
+    async def _get_battery(self, client: _Client, payload: bytes) -> bytes:
+        return _U8.pack(await self.controller.get_battery_level())
+
+    async def _get_device_information(self, client: _Client, payload: bytes) -> bytes:
+        info = await self.controller.get_device_information()
+        return json.dumps({key: bytes(value).decode('utf-8', 'replace') if isinstance(value, (bytes, bytearray)) else str(value) for key, value in info.items()}).encode('utf-8')
+
+    async def _subscribe(self, client: _Client, payload: bytes) -> bytes:
+        mask = _U8.unpack(payload)[0]
+        client.inputs = frozenset(input for input in Input.all() if mask & (1 << input.value))
+        return b''
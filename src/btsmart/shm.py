@@ -0,0 +1,267 @@
+"""
+This module publishes the state of a controller into a memory-mapped file, so any number of local
+read-only processes (dashboards, loggers, ...) can read it without asking the owning process.
+
+The region uses a seqlock: the single writer increments the sequence counter before and after
+each update, so the counter is odd while an update is in progress. A reader copies the state and
+retries if the counter was odd or changed in between. Reading a snapshot needs no system call.
+A reader gives up after a bounded number of retries (e.g. if the publisher died during an update).
+
+Note that Python offers no memory barriers: the counter and the state are plain stores into the
+mapping. This is sound on CPUs that keep the order of stores and loads (e.g. x86), on weakly ordered
+CPUs (e.g. ARM) a reader might in rare cases accept a snapshot that mixes two updates.
+
+Layout (little endian):
+
+    offset  0: magic "BTSM", version (u16), reserved (u16)
+    offset  8: sequence counter (u64)
+    offset 16: controller id (64 bytes, utf-8, zero padded)
+    offset 80: LED (u8), 4 x [mode (u8), reserved (u8), value (u16), timestamp ns (i64)], 2 x output (i8)
+
+"""
+
+import asyncio
+import mmap
+import os
+import re
+import struct
+import tempfile
+
+<<<<<<< HEAD
+from .controller import LEDMode, Input, Output, InputMode, InputMeasurement, BTSmartController
+from .stream import SampleSink
+=======
+from .controller import LEDMode, LED_BY_CODE, Input, Output, InputMode, InputMeasurement, BTSmartController
+>>>>>>> 42b1a66 ([user-041] Use tuple sample types and lookup tables for wire decoding)
+
+
+_MAGIC = b'BTSM'
+_VERSION = 1
+_HEADER = struct.Struct('<4sHH')
+_SEQ = struct.Struct('<Q')
+_SEQ_OFFSET = 8
+_ID_OFFSET = 16
+_ID_SIZE = 64
+_BODY_OFFSET = 80
+_BODY = struct.Struct('<B' + 'BxHq' * 4 + 'bb')
+_SIZE = _BODY_OFFSET + _BODY.size
+
+_NONE = 0xFF
+
+
+def default_path(id: str) -> str:
+    """returns the default location of the shared state of the controller with the given id
+
+    Args:
+        id (str): the controller id (see BTSmartController.id)
+
+    Returns:
+        str: a path in /dev/shm (if available) or the temp directory
+    """
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, "btsmart-" + re.sub(r'[^A-Za-z0-9_.-]', '_', id or "default"))
+
+
+class SharedSnapshot:
+    """A consistent copy of the published controller state"""
+
+    __slots__ = ("seq", "led", "modes", "values", "timestamps", "outputs")
+
+    def __init__(self, seq: int, fields: tuple) -> None:
+        self.seq = seq
+        """the sequence counter of the snapshot - it grows with every update"""
+        self.led: LEDMode = LED_BY_CODE.get(fields[0])
+        """the LED"""
+        self.modes = [None if fields[1 + 3 * i] == _NONE else InputMode(fields[1 + 3 * i]) for i in range(4)]
+        """the input modes by input number"""
+        self.values = [fields[2 + 3 * i] for i in range(4)]
+        """the last input values by input number"""
+        self.timestamps = [fields[3 + 3 * i] for i in range(4)]
+        """the times (monotonic ns) of the last input values by input number - 0 if unknown"""
+        self.outputs = [fields[13], fields[14]]
+        """the output values by output number"""
+
+
+class SharedStatePublisher(SampleSink):
+    """Publishes the state of a controller into a memory-mapped file (single writer)"""
+
+    def __init__(self, ctrl: BTSmartController, path: str = None) -> None:
+        """creates the region and starts publishing
+
+        Args:
+            ctrl (BTSmartController): the controller
+            path (str, optional): the file backing the region. Defaults to default_path(ctrl.id).
+        """
+        if ctrl is None:
+            raise Exception("cannot publish 'None'")
+        super().__init__()
+        self.controller = ctrl
+        self.path = path if path is not None else default_path(ctrl.id)
+        """the file backing the region"""
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, _SIZE)
+            self._mm = mmap.mmap(fd, _SIZE)
+        finally:
+            os.close(fd)
+        self._seq = 0
+        _HEADER.pack_into(self._mm, 0, _MAGIC, _VERSION, 0)
+        self._mm[_ID_OFFSET:_ID_OFFSET + _ID_SIZE] = (ctrl.id or "").encode('utf-8')[:_ID_SIZE].ljust(_ID_SIZE, b'\x00')
+        self._publish()
+        ctrl.add_sink(self)
+        ctrl._state_listeners.append(self._on_state_changed)
+
+    def push(self, sample) -> None:
+        self._publish()
+
+    def _on_state_changed(self, ctrl: BTSmartController) -> None:
+        self._publish()
+
+    def _publish(self) -> None:
+        ctrl = self.controller
+        fields = [_NONE if ctrl._led is None else ctrl._led.code]
+        for input in Input.all():
+            mode = ctrl._input_modes[input]
+            history = ctrl._history[input]
+            ts, value = history[-1] if history else (0, 0)
+            fields.extend((_NONE if mode is None else mode.value, value, ts))
+        fields.append(ctrl._output_values[Output.O1])
+        fields.append(ctrl._output_values[Output.O2])
+        mm = self._mm
+        self._seq = self._seq + 1
+        _SEQ.pack_into(mm, _SEQ_OFFSET, self._seq)
+        _BODY.pack_into(mm, _BODY_OFFSET, *fields)
+        self._seq = self._seq + 1
+        _SEQ.pack_into(mm, _SEQ_OFFSET, self._seq)
+
+    def close(self, remove: bool = True) -> None:
+        """stops publishing
+
+        Args:
+            remove (bool, optional): remove the backing file. Defaults to True.
+        """
+        ctrl = self.controller
+        ctrl.remove_sink(self)
+        if self._on_state_changed in ctrl._state_listeners:
+            ctrl._state_listeners.remove(self._on_state_changed)
+        self._mm.close()
+        if remove:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+class BTSmartController_SharedView(BTSmartController):
+    """A read-only controller that reads the state published by a SharedStatePublisher in another process.
+    All getters read a consistent snapshot from shared memory, all setters fail.
+    While connected, the view checks the sequence counter periodically and raises input change events."""
+
+    POLL_INTERVAL: float = 0.01
+    """the interval in seconds the view checks for new input values while connected"""
+
+    MAX_RETRIES: int = 10000
+    """the number of attempts to read a consistent snapshot before giving up"""
+
+    def __init__(self, path: str) -> None:
+        """opens the shared region
+
+        Args:
+            path (str): the file backing the region (see default_path)
+
+        Raises:
+            Exception: if the file does not contain a published controller state
+        """
+        super().__init__()
+        self.path = path
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            self._mm = mmap.mmap(fd, _SIZE, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        magic, version, _ = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC or version != _VERSION:
+            self._mm.close()
+            raise Exception("not a shared btsmart state: " + path)
+        self.id = bytes(self._mm[_ID_OFFSET:_ID_OFFSET + _ID_SIZE]).rstrip(b'\x00').decode('utf-8') or None
+        self._task: asyncio.Task = None
+
+    def snapshot(self) -> SharedSnapshot:
+        """reads a consistent copy of the published state
+
+        Raises:
+            Exception: if no consistent copy could be read within MAX_RETRIES attempts
+
+        Returns:
+            SharedSnapshot: the state
+        """
+        mm = self._mm
+        for _ in range(self.MAX_RETRIES):
+            seq = _SEQ.unpack_from(mm, _SEQ_OFFSET)[0]
+            if seq & 1:
+                continue
+            fields = _BODY.unpack_from(mm, _BODY_OFFSET)
+            if _SEQ.unpack_from(mm, _SEQ_OFFSET)[0] == seq:
+                return SharedSnapshot(seq, fields)
+        raise Exception("no consistent snapshot of the shared state - the publisher might have died during an update")
+
+    def is_connected(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def connect(self) -> bool:
+        """starts watching the shared state for input changes"""
+        if not self.is_connected():
+            self._task = asyncio.get_running_loop().create_task(self._watch(self.snapshot()), name='BTSmartController shared view')
+        return True
+
+    async def disconnect(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _watch(self, last: SharedSnapshot) -> None:
+        while True:
+            await asyncio.sleep(self.POLL_INTERVAL)
+            if _SEQ.unpack_from(self._mm, _SEQ_OFFSET)[0] == last.seq:
+                continue
+            try:
+                snap = self.snapshot()
+            except Exception as ex:
+                print("lost shared state:", ex)
+                self._disconnect_cb(None)
+                return
+            for input in Input.all():
+                i = input.value
+                if snap.timestamps[i] != last.timestamps[i]:
+                    self._publish_sample(input, snap.values[i], snap.timestamps[i])
+                    asyncio.create_task(self._on_input_value_changed(input, snap.values[i]))
+            last = snap
+
+    async def get_device_information(self) -> dict[str, str]:
+        return {"id": self.id}
+
+    async def get_led(self) -> LEDMode:
+        return self.snapshot().led
+
+    async def get_input_mode(self, input: Input) -> InputMode:
+        return self.snapshot().modes[input.value]
+
+    async def get_input_value(self, input: Input, mode: InputMode = None) -> InputMeasurement:
+        snap = self.snapshot()
+        if mode is not None and mode != snap.modes[input.value]:
+            raise Exception("the input mode of a shared view cannot be changed")
+        return InputMeasurement(snap.values[input.value], snap.modes[input.value])
+
+    async def get_output_value(self, output: Output) -> int:
+        return self.snapshot().outputs[output.value]
+
+    async def get_battery_level(self) -> int:
+        raise Exception("the battery level is not published to shared views")
+
+    async def _read_only(self, *args) -> None:
+        raise Exception("shared view is read-only")
+
+    set_led = _read_only
+    set_input_mode = _read_only
+    set_output_value = _read_only
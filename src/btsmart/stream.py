@@ -0,0 +1,180 @@
+"""
+This module provides streams of input samples that can be consumed with 'async for'
+(see BTSmartController.stream).
+
+A stream is fed synchronously by the backend (BLE notification handler or USB poll loop) and
+buffers the samples in a bounded queue. If the consumer does not keep up, the configured overflow
+policy decides which samples are dropped. Samples can be delivered one by one or in batches.
+
+Streams are sample sinks - other consumers of samples derive from SampleSink and are registered
+with BTSmartController.add_sink().
+
+"""
+
+import asyncio
+import collections
+import time
+
+from array import array
+
+from .controller import Input, InputSample
+
+
+DROP_OLDEST = "drop_oldest"
+"""overflow policy: the oldest queued sample is dropped"""
+
+DROP_NEWEST = "drop_newest"
+"""overflow policy: the new sample is dropped"""
+
+ERROR = "error"
+"""overflow policy: the stream fails - the consumer receives an exception"""
+
+
+class SampleSink:
+    """Base class of all consumers of input samples (streams, recorders, ...).
+    A sink is registered with BTSmartController.add_sink() and receives every sample of its inputs."""
+
+    def __init__(self, inputs: list = None) -> None:
+        """
+        Args:
+            inputs (list, optional): the inputs whose samples are delivered to the sink. Defaults to all inputs.
+        """
+        self.inputs = frozenset(Input.all() if inputs is None else inputs)
+        """the inputs whose samples are delivered to the sink"""
+
+    def push(self, sample: InputSample) -> None:
+        """called synchronously by the controller for each received sample of the sink's inputs - must not block
+
+        This method must be implemented in derived classes
+
+        Args:
+            sample (InputSample): the sample
+        """
+        raise NotImplemented
+
+
+class InputStream(SampleSink):
+    """An asynchronous iterator of input samples backed by a bounded queue"""
+
+    def __init__(self, inputs: list = None, batch: int = 1, max_latency: float = None, maxsize: int = 1024, overflow: str = DROP_OLDEST, columns: bool = False) -> None:
+        """creates a stream - use BTSmartController.stream() to open a stream on a controller
+
+        Args:
+            inputs (list, optional): the inputs to be streamed. Defaults to all inputs.
+            batch (int, optional): the number of samples delivered at once - if greater than 1, lists of samples are delivered. Defaults to 1.
+            max_latency (float, optional): the maximum time in seconds a sample waits for its batch to be completed. Defaults to None.
+            maxsize (int, optional): the maximum number of queued samples. Defaults to 1024.
+            overflow (str, optional): the overflow policy (DROP_OLDEST, DROP_NEWEST or ERROR). Defaults to DROP_OLDEST.
+            columns (bool, optional): deliver batches as a tuple of arrays (inputs, values, timestamps). Defaults to False.
+
+        Raises:
+            Exception: if one of the parameters is invalid
+        """
+        if batch < 1:
+            raise Exception("batch must be at least 1")
+        if maxsize < batch:
+            raise Exception("maxsize must not be smaller than batch")
+        if max_latency is not None and max_latency <= 0.0:
+            raise Exception("max_latency must be greater than 0.0")
+        if overflow not in (DROP_OLDEST, DROP_NEWEST, ERROR):
+            raise Exception("unknown overflow policy: " + str(overflow))
+        super().__init__(inputs)
+        self.batch = batch
+        self.max_latency = max_latency
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.columns = columns
+        self.dropped = 0
+        """the number of samples dropped due to overflow"""
+        self._queue = collections.deque()
+        self._waiter: asyncio.Future = None
+        self._error: Exception = None
+        self._closed = False
+        self._sources = []
+        self._closed_cb = None  # called with the stream when it is closed (e.g. by a fleet)
+
+    def _attach(self, ctrl) -> None:
+        """connects the stream to the given controller"""
+        ctrl.add_sink(self)
+        self._sources.append(ctrl)
+
+    def _detach(self, ctrl) -> None:
+        """disconnects the stream from the given controller"""
+        ctrl.remove_sink(self)
+        if ctrl in self._sources:
+            self._sources.remove(ctrl)
+
+    def push(self, sample: InputSample) -> None:
+        if self._closed:
+            return
+        queue = self._queue
+        if len(queue) >= self.maxsize:
+            self.dropped += 1
+            if self.overflow == DROP_NEWEST:
+                return
+            if self.overflow == ERROR:
+                self._error = Exception("input stream overflow")
+                self._wake()
+                return
+            queue.popleft()
+        queue.append(sample)
+        if len(queue) >= self.batch:
+            self._wake()
+
+    def _wake(self) -> None:
+        waiter = self._waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def close(self) -> None:
+        """closes the stream - a waiting consumer terminates its loop"""
+        self._closed = True
+        for ctrl in list(self._sources):
+            self._detach(ctrl)
+        if self._closed_cb is not None:
+            self._closed_cb(self)
+            self._closed_cb = None
+        self._wake()
+
+    def qsize(self) -> int:
+        """returns the number of queued samples"""
+        return len(self._queue)
+
+    def __aiter__(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    async def __anext__(self):
+        loop = asyncio.get_running_loop()
+        queue = self._queue
+        while True:
+            if self._error is not None:
+                raise self._error
+            if len(queue) >= self.batch:
+                break
+            if self._closed:
+                if len(queue) > 0:
+                    break
+                raise StopAsyncIteration
+            timeout = None
+            if self.max_latency is not None and len(queue) > 0:
+                timeout = queue[0].timestamp * 1e-9 + self.max_latency - time.monotonic()
+                if timeout <= 0.0:
+                    break
+            self._waiter = loop.create_future()
+            try:
+                await asyncio.wait((self._waiter,), timeout=timeout)
+            finally:
+                self._waiter = None
+        if self.batch == 1:
+            return queue.popleft()
+        n = min(self.batch, len(queue))
+        samples = [queue.popleft() for _ in range(n)]
+        if self.columns:
+            return (array('B', [s.input.value for s in samples]), array('H', [s.value for s in samples]), array('q', [s.timestamp for s in samples]))
+        return samples
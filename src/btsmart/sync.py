@@ -0,0 +1,225 @@
+"""
+This module provides a blocking facade for plain threaded code.
+
+A SyncController runs one persistent event loop in a background thread. The controller (and all parts
+wrapped with SyncController.part) live on that loop, and every method is available as a thread-safe
+blocking call that waits for the result. Since the loop is never torn down, BLE connections stay valid
+between calls and a call only costs the hand-over to the loop thread.
+
+e.g.
+    with SyncController.discover() as ctrl:
+        ctrl.set_output_value(Output.O1, 50)
+        print(ctrl.get_input_value(Input.I1))
+        ctrl.on_input_change(Input.I1, lambda input, value: print(input, value))
+
+Callbacks registered through the facade (all methods named on_...) are delivered on a thread pool,
+so a slow callback neither blocks the event loop nor other callbacks.
+
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+
+from .controller import BTSmartController
+
+
+class SyncProxy:
+    """Exposes the methods of an object living on the loop of a SyncController as blocking, thread-safe calls.
+    Coroutine methods are awaited on the loop, plain methods are called on the loop thread. Other attributes are read directly."""
+
+    def __init__(self, target, owner: 'SyncController') -> None:
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_owner", owner)
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._target, name)
+        if not callable(attr) or isinstance(attr, type):
+            return attr
+        owner = self._owner
+        if asyncio.iscoroutinefunction(attr):
+            def blocking(*args, **kwargs):
+                return owner._run(attr(*owner._unwrap(args), **owner._unwrap(kwargs)))
+        elif name.startswith("on_"):
+            def blocking(*args, **kwargs):
+                return owner._call(attr, *owner._unwrap(owner._wrap_callbacks(args)), **owner._unwrap(owner._wrap_callbacks(kwargs)))
+        else:
+            def blocking(*args, **kwargs):
+                return owner._call(attr, *owner._unwrap(args), **owner._unwrap(kwargs))
+        blocking.__name__ = name
+        blocking.__doc__ = attr.__doc__
+        object.__setattr__(self, name, blocking)  # cache the wrapper - the next lookup does not reach __getattr__
+        return blocking
+
+    def __setattr__(self, name: str, value) -> None:
+        setattr(self._target, name, value)
+
+    def bulk(self, calls: list, return_exceptions: bool = False) -> list:
+        """performs several calls concurrently with a single hand-over to the loop thread
+
+        e.g. ctrl.bulk([("set_output_value", Output.O1, 50), ("get_input_value", Input.I1)])
+
+        Args:
+            calls (list): tuples of a method name followed by its arguments
+            return_exceptions (bool, optional): return exceptions as results instead of raising the first one. Defaults to False.
+
+        Returns:
+            list: the results in the order of the calls
+        """
+        target = self._target
+        owner = self._owner
+        async def run():
+            coros = []
+            for call in calls:
+                method = getattr(target, call[0])
+                args = owner._unwrap(call[1:])
+                if asyncio.iscoroutinefunction(method):
+                    coros.append(method(*args))
+                else:
+                    coros.append(_as_coroutine(method, args))
+            return await asyncio.gather(*coros, return_exceptions=return_exceptions)
+        return owner._run(run())
+
+
+async def _as_coroutine(method, args):
+    return method(*args)
+
+
+class SyncController(SyncProxy):
+    """A blocking facade of a BTSmartController backed by an event loop in a background thread"""
+
+    def discover(viaUSB: bool = True, viaBLE: bool = True, remote: str = None, workers: int = 4, timeout: float = None) -> 'SyncController':
+        """discovers and connects a controller on a new background loop (see btsmart.discover_controller)
+
+        Args:
+            viaUSB (bool, optional): Should USB-Lookup be performed. Defaults to True.
+            viaBLE (bool, optional): Should BLE-Lookup be performed. Defaults to True.
+            remote (str, optional): the address of a controller server to be tried first. Defaults to None.
+            workers (int, optional): the number of threads delivering callbacks. Defaults to 4.
+            timeout (float, optional): the maximum time a blocking call waits in seconds. Defaults to None (no limit).
+
+        Returns:
+            SyncController: the connected controller or None
+        """
+        from . import discover_controller
+        sync = SyncController(None, workers, timeout)
+        ctrl = sync._run(discover_controller(viaUSB, viaBLE, remote))
+        if ctrl is None:
+            sync.close()
+            return None
+        object.__setattr__(sync, "_target", ctrl)
+        return sync
+
+    def __init__(self, ctrl: BTSmartController, workers: int = 4, timeout: float = None) -> None:
+        """starts the background loop. The controller must not be used on another loop.
+
+        Args:
+            ctrl (BTSmartController): the controller
+            workers (int, optional): the number of threads delivering callbacks. Defaults to 4.
+            timeout (float, optional): the maximum time a blocking call waits in seconds. Defaults to None (no limit).
+        """
+        super().__init__(ctrl, self)
+        object.__setattr__(self, "timeout", timeout)
+        object.__setattr__(self, "_executor", concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix='BTSmartController callback'))
+        loop = asyncio.new_event_loop()
+        object.__setattr__(self, "loop", loop)
+        started = threading.Event()
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.call_soon(started.set)
+            loop.run_forever()
+        thread = threading.Thread(target=run, name='BTSmartController loop', daemon=True)
+        object.__setattr__(self, "_thread", thread)
+        thread.start()
+        started.wait()
+
+    @property
+    def controller(self) -> BTSmartController:
+        """the wrapped controller - to be used only on the background loop"""
+        return self._target
+
+    def part(self, part) -> SyncProxy:
+        """wraps a part (e.g. a Button or a MotorXS) so its methods can be called from any thread
+
+        e.g. motor = ctrl.part(MotorXS()); motor.attach(ctrl, Output.O1); motor.run_at(100, time=1.0)
+
+        Args:
+            part (ElectronicsPart): the part
+
+        Returns:
+            SyncProxy: the blocking facade of the part
+        """
+        return SyncProxy(part, self)
+
+    def close(self, timeout: float = 1.0) -> None:
+        """stops the background loop and the callback threads - the controller is not disconnected
+
+        Args:
+            timeout (float, optional): the maximum time to wait for the loop thread in seconds. Defaults to 1.0.
+        """
+        loop = self.loop
+        if loop.is_closed():
+            return
+        if loop.is_running():
+            loop.call_soon_threadsafe(loop.stop)
+            self._thread.join(timeout)
+        if not loop.is_running():
+            loop.close()
+        self._executor.shutdown(wait=False)
+
+    def __enter__(self) -> 'SyncController':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self._target is not None:
+            try:
+                self.disconnect()
+            except Exception as ex:
+                print("unable to disconnect:", ex)
+        self.close()
+
+    def _run(self, coro):
+        """runs a coroutine on the loop and waits for its result"""
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise Exception("blocking calls must not be made from the loop thread (e.g. in an async callback)")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(self.timeout)
+
+    def _call(self, function, *args, **kwargs):
+        """calls a plain function on the loop thread and waits for its result"""
+        if threading.current_thread() is self._thread:
+            return function(*args, **kwargs)
+        future = concurrent.futures.Future()
+        def call():
+            try:
+                future.set_result(function(*args, **kwargs))
+            except BaseException as ex:
+                future.set_exception(ex)
+        self.loop.call_soon_threadsafe(call)
+        return future.result(self.timeout)
+
+    def _unwrap(self, values):
+        """replaces proxies by their targets, e.g. part.attach(sync_controller, Input.I1)"""
+        if isinstance(values, dict):
+            return {key: value._target if isinstance(value, SyncProxy) else value for key, value in values.items()}
+        return tuple(value._target if isinstance(value, SyncProxy) else value for value in values)
+
+    def _wrap_callbacks(self, values):
+        """makes plain callback functions run on the thread pool (coroutine functions run on the loop)"""
+        def wrap(value):
+            if not callable(value) or isinstance(value, SyncProxy) or asyncio.iscoroutinefunction(value):
+                return value
+            executor = self._executor
+            def dispatch(*args):
+                executor.submit(_deliver, value, args)
+            return dispatch
+        if isinstance(values, dict):
+            return {key: wrap(value) for key, value in values.items()}
+        return tuple(wrap(value) for value in values)
+
+
+def _deliver(callback, args) -> None:
+    try:
+        callback(*args)
+    except Exception as ex:
+        print("error in callback:", ex)
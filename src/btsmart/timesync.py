@@ -0,0 +1,94 @@
+"""
+This module provides time-aligned views on the inputs of several controllers.
+
+Every sample is stamped with a monotonic time (ns) at the transport boundary: BLE samples
+when the notification arrives, USB samples at the time the device measured them (the time the
+request was sent plus half of the measured round trip). Since all controllers of a process share
+the same monotonic clock, the sample histories can be resampled onto a common time grid.
+
+The backends only report changed values, so an input is known to hold its last value until the
+next sample arrives. Resampling therefore holds the last value - interpolating between two samples
+would invent a ramp for a change that happened at an unknown time in between.
+
+"""
+
+import bisect
+import time
+
+from .controller import Input
+
+
+class AlignedSnapshot:
+    """The inputs of several controllers resampled onto a common time grid"""
+
+    def __init__(self, times: list, values: dict) -> None:
+        self.times = times
+        """the grid times (monotonic ns)"""
+        self.values = values
+        """the resampled values per (controller id, input) - one value per grid time, None before the first sample"""
+
+    def at(self, index: int) -> dict:
+        """returns the values of all (controller id, input) pairs at the given grid position
+
+        Args:
+            index (int): the index of the grid time
+
+        Returns:
+            dict: the values per (controller id, input)
+        """
+        return {key: column[index] for key, column in self.values.items()}
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+
+def resample(samples: list, times: list) -> list:
+    """resamples a list of (timestamp, value) tuples (ordered by time) onto the given grid - each grid time
+    gets the last value received up to that time
+
+    Args:
+        samples (list): the (timestamp in ns, value) tuples
+        times (list): the grid times in ns (ascending)
+
+    Returns:
+        list: one value per grid time - None if there is no sample before the grid time
+    """
+    stamps = [s[0] for s in samples]
+    result = []
+    for t in times:
+        i = bisect.bisect_right(stamps, t)
+        result.append(samples[i - 1][1] if i > 0 else None)
+    return result
+
+
+def aligned_snapshot(controllers: list, step: float, duration: float, end: int = None, inputs: list = None) -> AlignedSnapshot:
+    """resamples the recent input history of the given controllers onto a common time grid
+
+    Args:
+        controllers (list): the controllers (e.g. a ControllerFleet)
+        step (float): the grid spacing in seconds
+        duration (float): the covered time span in seconds (limited by BTSmartController.HISTORY_LENGTH)
+        end (int, optional): the last grid time (monotonic ns). Defaults to now.
+        inputs (list, optional): the inputs to be included. Defaults to all inputs.
+
+    Raises:
+        Exception: if one of the parameters is invalid
+
+    Returns:
+        AlignedSnapshot: the resampled values
+    """
+    step_ns = int(step * 1e9)
+    if step_ns <= 0 or duration < 0.0:
+        raise Exception("step must be at least 1ns and duration must not be negative")
+    if end is None:
+        end = time.monotonic_ns()
+    count = int(duration * 1e9) // step_ns + 1
+    times = [end - (count - 1 - k) * step_ns for k in range(count)]
+    if inputs is None:
+        inputs = Input.all()
+    values = dict()
+    for n, ctrl in enumerate(controllers):
+        key = ctrl.id if ctrl.id is not None else n
+        for input in inputs:
+            values[(key, input)] = resample(ctrl.sample_history(input), times)
+    return AlignedSnapshot(times, values)
@@ -0,0 +1,179 @@
+"""
+This module provides a safety watchdog that stops all outputs of a controller if the application stalls.
+
+The application arms the watchdog and calls heartbeat() regularly. If the heartbeat deadline is
+missed (or trip() is called, e.g. by a LinkHealthMonitor the watchdog is wired to), the watchdog thread
+sets all outputs to 0 and latches them - further non-zero writes fail until the watchdog is armed again.
+
+The stop path runs in a separate thread: with USB the stop frames are written directly from that
+thread, independent of the event loop's backlog. With BLE the writes are queued ahead of all other
+GATT operations (bleak needs the event loop to perform them, so a completely blocked loop delays the stop).
+
+"""
+
+import asyncio
+import atexit
+import threading
+import time
+
+from .controller import BTSmartController, _invoke
+from .health import LinkHealthMonitor
+
+
+class WatchdogEvent:
+    """Describes a safety stop"""
+
+    def __init__(self, reason: str, latency: float, error: Exception = None) -> None:
+        self.reason = reason
+        """the reason of the stop ("deadline" or the reason given to trip())"""
+        self.latency = latency
+        """the time in seconds from the missed deadline (or trip) to the confirmed output stop"""
+        self.error = error
+        """the exception if the stop could not be confirmed, None otherwise"""
+
+    def __str__(self):
+        if self.error is not None:
+            return "safety stop ({}) failed after {:.4f}s: {}".format(self.reason, self.latency, self.error)
+        return "safety stop ({}) confirmed after {:.4f}s".format(self.reason, self.latency)
+
+
+class SafetyWatchdog:
+    """Stops all outputs of a controller if no heartbeat is received in time"""
+
+    def __init__(self, ctrl: BTSmartController, timeout: float = 0.5, stop_timeout: float = 1.0, monitor: LinkHealthMonitor = None) -> None:
+        """creates the watchdog - call arm() to activate it
+
+        Args:
+            ctrl (BTSmartController): the controller to be guarded
+            timeout (float, optional): the maximum time between two heartbeats in seconds. Defaults to 0.5.
+            stop_timeout (float, optional): the maximum time to wait for the confirmation of the stop in seconds. Defaults to 1.0.
+            monitor (LinkHealthMonitor, optional): if given, the watchdog trips whenever the monitored link degrades
+                (the reason is the kind of the HealthEvent). Defaults to None.
+
+        Raises:
+            Exception: if one of the parameters is invalid
+        """
+        if ctrl is None:
+            raise Exception("cannot guard 'None'")
+        if timeout <= 0.0 or stop_timeout <= 0.0:
+            raise Exception("timeouts must be greater than 0.0")
+        self.controller = ctrl
+        self.timeout = timeout
+        self.stop_timeout = stop_timeout
+        self.last_event: WatchdogEvent = None
+        """the event of the last safety stop"""
+        self._deadline = 0.0
+        self._trip_reason: str = None
+        self._trip_time = 0.0
+        self._armed = False
+        self._tripped = False
+        self._wake = threading.Event()
+        self._thread: threading.Thread = None
+        self._loop: asyncio.AbstractEventLoop = None
+        self._callback = None
+        if monitor is not None:
+            monitor._degraded_hooks.append(self._on_degraded)
+
+    def on_trip(self, callback) -> None:
+        """registers a function to be called after a safety stop. The callback might be a normal or an async function,
+        it is called on the event loop and takes the WatchdogEvent as argument.
+
+        Args:
+            callback (function): the function to be called
+        """
+        self._callback = callback
+
+    def arm(self) -> None:
+        """activates the watchdog and releases latched outputs. Must be called from the event loop the controller is used with."""
+        self._loop = asyncio.get_running_loop()
+        self._deadline = time.monotonic() + self.timeout
+        self._trip_reason = None
+        self._tripped = False
+        self.controller._set_safety_latch(False)
+        if not self._armed:
+            self._armed = True
+            self._wake.clear()
+            self._thread = threading.Thread(target=self._run, name='BTSmartController watchdog', daemon=True)
+            self._thread.start()
+            atexit.register(self._stop_at_exit)
+        else:
+            self._wake.set()
+
+    def heartbeat(self) -> None:
+        """signals that the application is alive - moves the deadline. This method is thread-safe."""
+        self._deadline = time.monotonic() + self.timeout
+
+    def trip(self, reason: str = "tripped") -> None:
+        """forces a safety stop, e.g. when the link degrades. This method is thread-safe.
+
+        Args:
+            reason (str, optional): the reason reported in the WatchdogEvent. Defaults to "tripped".
+        """
+        self._trip_time = time.monotonic()
+        self._trip_reason = reason
+        self._wake.set()
+
+    def _on_degraded(self, event) -> None:
+        if self._armed:
+            self.trip(event.kind)
+
+    def disarm(self) -> None:
+        """deactivates the watchdog - latched outputs stay latched until the watchdog is armed again"""
+        if self._armed:
+            self._armed = False
+            self._wake.set()
+            atexit.unregister(self._stop_at_exit)
+            if self._thread is not None and self._thread is not threading.current_thread():
+                self._thread.join(self.stop_timeout)
+            self._thread = None
+
+    def is_tripped(self) -> bool:
+        """tells if the watchdog stopped the outputs since it was armed"""
+        return self._tripped
+
+    def _run(self) -> None:
+        while self._armed:
+            if self._tripped:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            now = time.monotonic()
+            if self._trip_reason is not None:
+                self._stop(self._trip_reason, self._trip_time)
+            elif now >= self._deadline:
+                self._stop("deadline", self._deadline)
+            else:
+                self._wake.wait(self._deadline - now)
+                self._wake.clear()
+
+    def _stop(self, reason: str, since: float) -> None:
+        self._tripped = True
+        self.controller._set_safety_latch(True)
+        error = None
+        try:
+            self.controller._emergency_stop(self._loop, self.stop_timeout)
+        except Exception as ex:
+            error = ex
+        event = WatchdogEvent(reason, time.monotonic() - since, error)
+        self.last_event = event
+        if error is not None:
+            print(event)
+        try:
+            self._loop.call_soon_threadsafe(self._notify, event)
+            self._loop.call_soon_threadsafe(self.controller.timers.cancel_all)
+            self._loop.call_soon_threadsafe(self.controller._state_changed)
+        except RuntimeError:
+            pass  # the loop is already closed
+
+    def _notify(self, event: WatchdogEvent) -> None:
+        if self._callback is not None:
+            asyncio.get_running_loop().create_task(_invoke(self._callback, event))
+
+    def _stop_at_exit(self) -> None:
+        """stops the outputs if the process exits while the watchdog is armed"""
+        if self._armed and not self._tripped:
+            self._armed = False
+            try:
+                self.controller._emergency_stop(self._loop, self.stop_timeout)
+            except Exception as ex:
+                print("unable to stop outputs at exit:", ex)
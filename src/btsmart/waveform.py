@@ -0,0 +1,173 @@
+"""
+This module provides waveforms that can be played on output parts (see OutputPart.play).
+
+A waveform simply maps the time since its start to an output level. The player samples the
+waveform at a rate the backend is able to sustain and skips all writes that would not change
+the (integer) output level, so a waveform costs at most a known number of writes per second.
+
+"""
+
+import math
+
+
+def LINEAR(x: float) -> float:
+    """linear easing - constant speed"""
+    return x
+
+def EASE_IN(x: float) -> float:
+    """quadratic easing - slow start"""
+    return x * x
+
+def EASE_OUT(x: float) -> float:
+    """quadratic easing - slow end"""
+    return x * (2.0 - x)
+
+def EASE_IN_OUT(x: float) -> float:
+    """sinusoidal easing - slow start and slow end (e.g. for motor soft start)"""
+    return 0.5 - 0.5 * math.cos(math.pi * x)
+
+
+class Waveform:
+    """Base class of all waveforms. A waveform maps the time since start (in seconds) to an output level."""
+
+    def __init__(self, duration: float = None) -> None:
+        """
+        Args:
+            duration (float, optional): the duration in seconds - None means the waveform runs until it is stopped. Defaults to None.
+
+        Raises:
+            Exception: if the duration is invalid
+        """
+        if duration is not None and duration < 0.0:
+            raise Exception("duration must be greater or equal to 0.0")
+        self.duration = duration
+
+    def level(self, t: float) -> float:
+        """computes the output level at the given time
+
+        This method must be implemented in derived classes
+
+        Args:
+            t (float): the time since start in seconds
+
+        Returns:
+            float: the output level
+        """
+        raise NotImplemented
+
+
+class Ramp(Waveform):
+    """a ramp from one level to another, optionally eased (see LINEAR, EASE_IN, EASE_OUT, EASE_IN_OUT)"""
+
+    def __init__(self, start: float, end: float, duration: float, easing=LINEAR) -> None:
+        """
+        Args:
+            start (float): the level at the beginning
+            end (float): the level at the end
+            duration (float): the duration of the ramp in seconds
+            easing (function, optional): maps the relative time 0..1 to the relative level 0..1. Defaults to LINEAR.
+        """
+        super().__init__(duration)
+        self.start = start
+        self.end = end
+        self.easing = easing
+
+    def level(self, t: float) -> float:
+        if self.duration <= 0.0 or t >= self.duration:
+            return self.end
+        return self.start + (self.end - self.start) * self.easing(max(t, 0.0) / self.duration)
+
+
+class Sine(Waveform):
+    """a sine wave oscillating around the given center level"""
+
+    def __init__(self, center: float, amplitude: float, period: float, duration: float = None) -> None:
+        """
+        Args:
+            center (float): the mean level
+            amplitude (float): the amplitude
+            period (float): the period in seconds
+            duration (float, optional): the duration in seconds. Defaults to None.
+
+        Raises:
+            Exception: if the period is invalid
+        """
+        super().__init__(duration)
+        if period <= 0.0:
+            raise Exception("period must be greater than 0.0")
+        self.center = center
+        self.amplitude = amplitude
+        self.period = period
+
+    def level(self, t: float) -> float:
+        return self.center + self.amplitude * math.sin(2.0 * math.pi * t / self.period)
+
+
+class PWM(Waveform):
+    """a rectangular duty pattern switching between two levels. Note that the period should be
+    a multiple of the update interval of the backend, otherwise edges are shifted to the next update."""
+
+    def __init__(self, high: float, period: float, duty: float = 0.5, low: float = 0, duration: float = None) -> None:
+        """
+        Args:
+            high (float): the level during the 'on' phase
+            period (float): the period in seconds
+            duty (float, optional): the relative length of the 'on' phase (0..1). Defaults to 0.5.
+            low (float, optional): the level during the 'off' phase. Defaults to 0.
+            duration (float, optional): the duration in seconds. Defaults to None.
+
+        Raises:
+            Exception: if one of the parameters is invalid
+        """
+        super().__init__(duration)
+        if period <= 0.0:
+            raise Exception("period must be greater than 0.0")
+        if duty < 0.0 or duty > 1.0:
+            raise Exception("duty must be in 0..1")
+        self.high = high
+        self.low = low
+        self.period = period
+        self.duty = duty
+
+    def level(self, t: float) -> float:
+        if math.fmod(t, self.period) < self.duty * self.period:
+            return self.high
+        return self.low
+
+
+class SampleTable(Waveform):
+    """a waveform given by a table of equidistant samples"""
+
+    def __init__(self, samples: list, interval: float, loop: bool = False, interpolate: bool = True) -> None:
+        """
+        Args:
+            samples (list): the levels
+            interval (float): the time between two samples in seconds
+            loop (bool, optional): if True, the table is repeated until the waveform is stopped. Defaults to False.
+            interpolate (bool, optional): interpolate linearly between samples, otherwise each sample is held. Defaults to True.
+
+        Raises:
+            Exception: if one of the parameters is invalid
+        """
+        if len(samples) == 0:
+            raise Exception("sample table must not be empty")
+        if interval <= 0.0:
+            raise Exception("interval must be greater than 0.0")
+        super().__init__(None if loop else (len(samples) - 1) * interval)
+        self.samples = list(samples)
+        self.interval = interval
+        self.loop = loop
+        self.interpolate = interpolate
+
+    def level(self, t: float) -> float:
+        n = len(self.samples)
+        pos = max(t, 0.0) / self.interval
+        if self.loop:
+            pos = math.fmod(pos, n)
+        elif pos >= n - 1:
+            return self.samples[-1]
+        i = int(pos)
+        if not self.interpolate:
+            return self.samples[i]
+        nxt = self.samples[(i + 1) % n]
+        return self.samples[i] + (nxt - self.samples[i]) * (pos - i)
@@ -0,0 +1,121 @@
+"""shared fixtures - the tests run against an in-memory controller, no device is needed"""
+
+import asyncio
+
+import pytest
+
+from btsmart import BTSmartController, Input, InputMode, InputMeasurement, Output
+
+
+class FakeController(BTSmartController):
+    """an in-memory controller - output writes are recorded, input values are injected by the test"""
+
+    def __init__(self, id: str = "fake:test") -> None:
+        super().__init__()
+        self.id = id
+        self.connected = False
+        self.values = [0, 0, 0, 0]
+        self.writes = []
+        """the performed output writes (output, value) in order"""
+        self.reopen_failures = 0
+        """the number of the following reopen attempts that fail"""
+        self.latency = 0.0
+        """the simulated round trip time of a read in seconds"""
+        self.connects = 0
+        """the number of currently running connect() calls"""
+
+    @property
+    def outputs(self) -> dict:
+        return self._output_values
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    async def connect(self) -> bool:
+        self._user_disconnect = False
+        self.connects += 1
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.connects -= 1
+        self.connected = True
+        return True
+
+    async def disconnect(self) -> None:
+        self._user_disconnect = True
+        self.connected = False
+
+    async def _reopen(self) -> None:
+        if self.reopen_failures > 0:
+            self.reopen_failures -= 1
+            raise Exception("unable to connect")
+        self.connected = True
+
+    def drop(self) -> None:
+        """simulates a lost link"""
+        self.connected = False
+        self._disconnect_cb(None)
+
+    async def get_device_information(self) -> dict:
+        return {"name": "fake"}
+
+    async def get_battery_level(self) -> int:
+        if not self.connected:
+            raise Exception("Device not connected")
+        await asyncio.sleep(self.latency)
+        return 100
+
+    async def set_led(self, led) -> None:
+        self._led = led
+        self._state_changed()
+
+    async def get_led(self):
+        return self._led
+
+    async def set_input_mode(self, input: Input, mode: InputMode) -> None:
+        self._input_modes[input] = mode
+        self._state_changed()
+
+    async def get_input_mode(self, input: Input) -> InputMode:
+        return self._input_modes[input] or InputMode.RESISTANCE
+
+    async def get_input_value(self, input: Input, mode: InputMode = None) -> InputMeasurement:
+        if mode is not None:
+            self._input_modes[input] = mode
+        return InputMeasurement(self.values[input.value], await self.get_input_mode(input))
+
+    async def set_output_value(self, output: Output, value: int) -> None:
+        if not self.connected:
+            raise Exception("Device not connected")
+        self._check_output(value)
+        self._output_values[output] = value
+        self.writes.append((output, value))
+        self._state_changed()
+
+    async def get_output_value(self, output: Output) -> int:
+        return self._output_values[output]
+
+    def inject(self, input: Input, value: int) -> None:
+        """simulates a changed input value"""
+        self.values[input.value] = value
+        self._publish_sample(input, value)
+        asyncio.get_running_loop().create_task(self._on_input_value_changed(input, value))
+
+
+@pytest.fixture
+def ctrl() -> FakeController:
+    return FakeController()
+
+
+@pytest.fixture
+def run(ctrl):
+    """runs an async test function with the connected controller on a fresh event loop and returns its result"""
+    def run(test):
+        async def main():
+            await ctrl.connect()
+            try:
+                return await test(ctrl)
+            finally:
+                await ctrl.disconnect()
+        return asyncio.run(main())
+    return run
@@ -0,0 +1,63 @@
+import asyncio
+import struct
+
+from btsmart import BTSmartController_Sim, Capture, CaptureReader, Input
+from btsmart.backend_ble import BT_SMART_GATT_UUIDs
+from btsmart.backend_usb import BTSmartFTDI
+from btsmart.capture import USB_FRAME, GATT_NOTIFY, GATT_WRITE
+
+from conftest import FakeController
+
+
+def _inputs_response(values: list) -> bytes:
+    return bytes(8) + b"".join(struct.pack('<BBH', i, 0, v) for i, v in enumerate(values))
+
+
+def _write_capture(path: str) -> None:
+    capture = Capture(FakeController(), path, flush_interval=0.01)
+    with capture:
+        ms = 1000000
+        capture._trace(USB_FRAME, True, 0, 2 * ms, BTSmartFTDI._CMD_GET_INPUTS, b'', _inputs_response([10, 0, 0, 0]))
+        capture._trace(USB_FRAME, True, 5 * ms, 4 * ms, BTSmartFTDI._CMD_GET_INPUTS, b'', _inputs_response([10, 20, 0, 0]))
+        capture._trace(USB_FRAME, False, 8 * ms, 1 * ms, BTSmartFTDI._CMD_GET_INPUTS, b'', b'')
+        uuid = BT_SMART_GATT_UUIDs["input"]["characteristics"][Input.I3]
+        capture._trace(GATT_NOTIFY, True, 10 * ms, 0, uuid, b'', (300).to_bytes(2, 'little'))
+    assert capture.records == 4
+
+
+def test_reader(tmp_path):
+    path = str(tmp_path / "session.btsc")
+    _write_capture(path)
+    reader = CaptureReader(path)
+    records = list(reader)
+    assert [r.kind for r in records] == [USB_FRAME, USB_FRAME, USB_FRAME, GATT_NOTIFY]
+    assert records[0].key == BTSmartFTDI._CMD_GET_INPUTS.hex().upper()
+    assert records[3].key == BT_SMART_GATT_UUIDs["input"]["characteristics"][Input.I3]
+    stats = reader.latency_stats()[("usb", records[0].key)]
+    assert (stats.count, stats.errors) == (3, 1)
+    assert stats.max == 0.004
+    assert reader.duration() == 0.01
+
+
+def test_truncated_record_is_ignored(tmp_path):
+    path = str(tmp_path / "session.btsc")
+    _write_capture(path)
+    with open(path, "r+b") as f:
+        f.truncate(f.seek(0, 2) - 1)
+    assert len(list(CaptureReader(path))) == 3
+
+
+def test_replay(tmp_path):
+    path = str(tmp_path / "session.btsc")
+    _write_capture(path)
+    sim = BTSmartController_Sim(path, speed=10.0, id="sim:test")
+    received = []
+    async def main():
+        for input in Input.all():
+            sim.on_input_change(input, lambda input, value: received.append((input, value)))
+        await sim.connect()
+        await asyncio.sleep(0.05)
+        await sim.disconnect()
+    asyncio.run(main())
+    assert received == [(Input.I1, 10), (Input.I2, 20), (Input.I3, 300)]
+    assert sim._direct_read() == [10, 20, 300, 0]
@@ -0,0 +1,91 @@
+import asyncio
+import time
+
+import pytest
+
+from btsmart import ControlLoop, Input, Output, PID
+
+from conftest import FakeController
+
+
+class _DirectController(FakeController):
+    """a fake controller that is accessed from the control loop thread"""
+
+    DIRECT_IO = True
+
+    def _direct_read(self) -> list:
+        return list(self.values)
+
+    def _direct_write(self, output: Output, value: int) -> None:
+        self._check_output(value)
+        self.writes.append((output, value))
+
+
+def test_pid():
+    pid = PID(2.0, ki=1.0, kd=0.5, setpoint=10, out_min=-50, out_max=50)
+    assert pid([10], 0.0) == 0.0
+    assert pid([8], 0.1) == pytest.approx(2.0 * 2 + 1.0 * 0.2 + 0.5 * 20)
+    assert pid([-100], 0.1) == 50
+    pid.reset()
+    assert pid._integral == 0.0 and pid._last_value is None
+
+
+def test_task_loop_follows_the_inputs(run):
+    async def scenario(ctrl):
+        loop = ControlLoop(ctrl, [Input.I1], [Output.O1], lambda values, dt: values[0] // 10, period=0.005)
+        loop.start()
+        ctrl.inject(Input.I1, 300)
+        await asyncio.sleep(0.05)
+        running = ctrl.outputs[Output.O1]
+        await loop.stop()
+        return running, ctrl.outputs[Output.O1], loop.stats().iterations > 5
+
+    assert run(scenario) == (30, 0, True)
+
+
+def test_failing_law_stops_outputs(run):
+    dts = []
+
+    def law(values, dt):
+        dts.append(dt)
+        if len(dts) == 5:
+            time.sleep(0.03)  # a late tick
+        if len(dts) > 8:
+            raise ValueError("broken sensor")
+        return 50
+
+    async def scenario(ctrl):
+        loop = ControlLoop(ctrl, [Input.I1], [Output.O1], law, period=0.01)
+        loop.start()
+        await asyncio.sleep(0.3)
+        running = loop.is_running()
+        await loop.stop(stop_outputs=False)
+        return running, ctrl.outputs[Output.O1]
+
+    assert run(scenario) == (False, 0)
+    assert dts[0] == 0.0
+    # the tick after the late one gets the measured interval, not the nominal period
+    assert dts[5] >= 0.03
+
+
+def test_thread_loop_stops_outputs_after_an_error():
+    calls = []
+
+    def law(values, dt):
+        calls.append(values[0])
+        if len(calls) > 3:
+            raise ValueError("broken sensor")
+        return 40
+
+    async def scenario():
+        ctrl = _DirectController()
+        await ctrl.connect()
+        ctrl.values[Input.I2.value] = 7
+        loop = ControlLoop(ctrl, [Input.I2], [Output.O2], law, period=0.005)
+        loop.start()
+        await asyncio.sleep(0.1)
+        running = loop.is_running()
+        await loop.stop(stop_outputs=False)
+        return running, ctrl.writes, ctrl.outputs[Output.O2], calls[0]
+
+    assert asyncio.run(scenario()) == (False, [(Output.O2, 40), (Output.O2, 0)], 0, 7)
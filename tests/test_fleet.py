@@ -0,0 +1,74 @@
+import asyncio
+
+from btsmart import ControllerFleet, Input
+from btsmart.backend_ble import BTSmartController_BLE
+from btsmart.backend_usb import BTSmartController_USB
+
+from conftest import FakeController
+
+
+def _fleet(n: int, concurrency: int = 4) -> ControllerFleet:
+    fleet = ControllerFleet(concurrency)
+    for i in range(n):
+        fleet.add(FakeController("fake:" + str(i)))
+    return fleet
+
+
+def test_controllers_are_identified_by_id():
+    fleet = _fleet(2)
+    assert not fleet.add(FakeController("fake:1"))
+    assert len(fleet) == 2 and "fake:0" in fleet and fleet["fake:1"].id == "fake:1"
+    assert fleet.remove("fake:0").id == "fake:0" and fleet.remove("fake:0") is None
+
+
+def test_connect_all_is_bounded():
+    async def scenario():
+        fleet = _fleet(6, concurrency=2)
+        peak = 0
+
+        async def observe():
+            nonlocal peak
+            while True:
+                peak = max(peak, sum(ctrl.connects for ctrl in fleet))
+                await asyncio.sleep(0.001)
+
+        for ctrl in fleet:
+            ctrl.latency = 0.01
+        observer = asyncio.get_running_loop().create_task(observe())
+        errors = await fleet.connect_all()
+        observer.cancel()
+        return errors, all(ctrl.is_connected() for ctrl in fleet), peak
+
+    assert asyncio.run(scenario()) == ({}, True, 2)
+
+
+def test_one_stream_for_all_controllers():
+    async def scenario():
+        fleet = _fleet(2)
+        await fleet.connect_all()
+        stream = fleet.stream(inputs=[Input.I1])
+        fleet.add(FakeController("fake:new"))
+        for ctrl in fleet:
+            ctrl.inject(Input.I1, 7)
+        fleet.remove("fake:0").inject(Input.I1, 8)
+        samples = [await stream.__anext__() for _ in range(3)]
+        stream.close()
+        return sorted(s.source for s in samples), stream.qsize(), fleet._streams
+
+    assert asyncio.run(scenario()) == (["fake:0", "fake:1", "fake:new"], 0, [])
+
+
+def test_discover_adds_new_controllers(monkeypatch):
+    monkeypatch.setattr(BTSmartController_USB, "discover_all", lambda: [FakeController("usb:1"), FakeController("usb:2")])
+
+    async def scan(timeout):
+        raise Exception("no adapter")
+
+    monkeypatch.setattr(BTSmartController_BLE, "discover_all", scan)
+
+    async def scenario():
+        fleet = _fleet(0)
+        fleet.add(FakeController("usb:1"))
+        return await fleet.discover(), len(fleet)
+
+    assert asyncio.run(scenario()) == (["usb:2"], 2)
@@ -0,0 +1,100 @@
+import asyncio
+
+from btsmart import Output
+from btsmart.backend_ble import _GattScheduler, BT_SMART_GATT_UUIDs, PRIORITY_SAFETY, PRIORITY_ACTUATOR, PRIORITY_SENSOR, PRIORITY_HOUSEKEEPING
+
+
+class _FakeClient:
+    def __init__(self) -> None:
+        self.writes = []
+        self.reads = []
+        self.in_flight = 0
+        self.peak = 0
+
+    async def _transfer(self) -> None:
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+
+    async def write_gatt_char(self, uuid, data, response=True):
+        await self._transfer()
+        self.writes.append((uuid, bytes(data)))
+
+    async def read_gatt_char(self, uuid):
+        await self._transfer()
+        self.reads.append(uuid)
+        return b'\x2a'
+
+
+class _FakeController:
+    def __init__(self) -> None:
+        self.client = _FakeClient()
+        self._safety_latched = False
+
+
+OUT1 = BT_SMART_GATT_UUIDs["output"]["characteristics"][Output.O1]
+OUT2 = BT_SMART_GATT_UUIDs["output"]["characteristics"][Output.O2]
+BATTERY = "battery"
+
+
+def test_operations_are_performed_by_priority():
+    async def main():
+        ctrl = _FakeController()
+        gatt = _GattScheduler(ctrl, 1)
+        ops = [gatt.write(OUT1, b'\x01', True, PRIORITY_ACTUATOR),
+               gatt.read(BATTERY, PRIORITY_HOUSEKEEPING),
+               gatt.write(OUT2, b'\x02', True, PRIORITY_ACTUATOR)]
+        await asyncio.gather(*ops)
+        return ctrl.client.writes, ctrl.client.reads, ctrl.client.peak
+
+    writes, reads, peak = asyncio.run(main())
+    assert writes == [(OUT1, b'\x01'), (OUT2, b'\x02')]
+    assert reads == [BATTERY] and peak == 1
+
+
+def test_concurrent_reads_are_merged():
+    async def main():
+        ctrl = _FakeController()
+        gatt = _GattScheduler(ctrl, 2)
+        blocker = gatt.write(OUT1, b'\x01', True, PRIORITY_ACTUATOR)
+        blocker2 = gatt.write(OUT2, b'\x01', True, PRIORITY_ACTUATOR)
+        first = gatt.read(BATTERY, PRIORITY_HOUSEKEEPING)
+        second = gatt.read(BATTERY, PRIORITY_SENSOR)
+        results = await asyncio.gather(blocker, blocker2, first, second)
+        return results[2:], ctrl.client.reads, ctrl.client.peak
+
+    assert asyncio.run(main()) == ([b'\x2a', b'\x2a'], [BATTERY], 2)
+
+
+def test_cancelled_write_is_not_performed():
+    async def main():
+        ctrl = _FakeController()
+        gatt = _GattScheduler(ctrl, 1)
+        first = gatt.write(OUT1, b'\x10', True, PRIORITY_ACTUATOR)
+        stale = gatt.write(OUT1, b'\x20', True, PRIORITY_ACTUATOR)
+        stale.cancel()
+        await first
+        await asyncio.sleep(0.05)
+        return ctrl.client.writes
+
+    assert asyncio.run(main()) == [(OUT1, b'\x10')]
+
+
+def test_safety_stop_purges_queued_output_writes():
+    async def main():
+        ctrl = _FakeController()
+        gatt = _GattScheduler(ctrl, 1)
+        first = gatt.write(OUT1, b'\x10', True, PRIORITY_ACTUATOR)
+        queued = gatt.write(OUT1, b'\x20', True, PRIORITY_ACTUATOR)
+        ctrl._safety_latched = True
+        purged = gatt.purge_outputs()
+        stop = gatt.write(OUT1, b'\x00', True, PRIORITY_SAFETY)
+        late = gatt.write(OUT1, b'\x30', True, PRIORITY_ACTUATOR)
+        results = await asyncio.gather(first, queued, stop, late, return_exceptions=True)
+        return purged, results, ctrl.client.writes
+
+    purged, results, writes = asyncio.run(main())
+    assert purged == 1
+    assert isinstance(results[1], Exception) and isinstance(results[3], Exception)
+    assert writes == [(OUT1, b'\x10'), (OUT1, b'\x00')]
@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+from btsmart import LinkHealthMonitor
+from btsmart.health import INPUT_GAP, LATENCY, PROBE_FAILURE
+
+
+def test_latency_degrades_and_recovers(run):
+    async def scenario(ctrl):
+        monitor = LinkHealthMonitor(ctrl, probe_interval=0.01, latency=0.02, smoothing=1.0)
+        events = []
+        monitor.on_degraded(events.append)
+        monitor.on_recovered(events.append)
+        await monitor.check()
+        ctrl.latency = 0.03
+        await monitor.check()
+        await monitor.check()
+        ctrl.latency = 0.0
+        await monitor.check()
+        return [(e.kind, e.degraded) for e in events], monitor.is_degraded()
+
+    assert run(scenario) == ([(LATENCY, True), (LATENCY, False)], False)
+
+
+def test_failed_probes_are_counted(run):
+    async def scenario(ctrl):
+        monitor = LinkHealthMonitor(ctrl, probe_interval=0.01, latency=None, probe_failures=2)
+        events = []
+
+        async def degraded(event):
+            events.append(event)
+
+        monitor.on_degraded(degraded)
+        ctrl.connected = False
+        for i in range(3):
+            await monitor.check()
+        failed = monitor.failed_probes
+        ctrl.connected = True
+        await monitor.check()
+        return [e.kind for e in events], failed, monitor.failed_probes
+
+    assert run(scenario) == ([PROBE_FAILURE], 3, 0)
+
+
+def test_input_gap(run):
+    async def scenario(ctrl):
+        monitor = LinkHealthMonitor(ctrl, probe_interval=0.01, input_gap=0.5)
+        ctrl._last_input_time = time.monotonic() - 1.0
+        await monitor.check()
+        return monitor.degraded_metrics()
+
+    assert run(scenario) == {INPUT_GAP}
+
+
+def test_background_probing(run):
+    async def scenario(ctrl):
+        monitor = ctrl.monitor_health(probe_interval=0.01)
+        await asyncio.sleep(0.05)
+        monitor.stop()
+        return monitor.last_latency is not None, monitor.is_degraded()
+
+    assert run(scenario) == (True, False)
@@ -0,0 +1,66 @@
+import asyncio
+
+from btsmart import Input, InputMode, LEDMode, Output, ReconnectSupervisor
+
+
+def test_reconnect_restores_the_last_known_state(run):
+    async def scenario(ctrl):
+        await ctrl.set_led(LEDMode.YELLOW)
+        await ctrl.set_input_mode(Input.I2, InputMode.VOLTAGE)
+        await ctrl.set_output_value(Output.O1, 40)
+        ctrl.connected = False
+        ctrl.writes.clear()
+        await ctrl.reconnect()
+        return ctrl.is_connected(), await ctrl.get_led(), await ctrl.get_input_mode(Input.I2), sorted(ctrl.writes, key=lambda w: w[0].value)
+
+    connected, led, mode, writes = run(scenario)
+    assert connected and led == LEDMode.YELLOW and mode == InputMode.VOLTAGE
+    assert writes == [(Output.O1, 40), (Output.O2, 0)]
+
+
+def test_supervisor_recovers_with_backoff(run):
+    async def scenario(ctrl):
+        supervisor = ReconnectSupervisor(ctrl, initial_delay=0.01, max_delay=0.02)
+        reports = []
+        supervisor.on_reconnect(reports.append)
+        supervisor.start()
+        await ctrl.set_output_value(Output.O2, -30)
+        ctrl.reopen_failures = 2
+        ctrl.drop()
+        await asyncio.sleep(0.2)
+        supervisor.stop()
+        return ctrl.is_connected(), ctrl.outputs[Output.O2], [r.attempts for r in reports]
+
+    assert run(scenario) == (True, -30, [3])
+
+
+def test_supervisor_gives_up(run):
+    async def scenario(ctrl):
+        supervisor = ReconnectSupervisor(ctrl, initial_delay=0.01, max_attempts=2)
+        failures = []
+
+        async def give_up(ex):
+            failures.append(str(ex))
+
+        supervisor.on_give_up(give_up)
+        supervisor.start()
+        ctrl.reopen_failures = 5
+        ctrl.drop()
+        await asyncio.sleep(0.1)
+        supervisor.stop()
+        return ctrl.is_connected(), failures
+
+    assert run(scenario) == (False, ["unable to connect"])
+
+
+def test_user_disconnect_is_not_recovered(run):
+    async def scenario(ctrl):
+        supervisor = ReconnectSupervisor(ctrl, initial_delay=0.01)
+        supervisor.start()
+        await ctrl.disconnect()
+        ctrl._disconnect_cb(None)
+        recovering = supervisor.is_recovering()
+        supervisor.stop()
+        return recovering
+
+    assert run(scenario) is False
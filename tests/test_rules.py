@@ -0,0 +1,76 @@
+import asyncio
+
+from btsmart import Above, Below, Between, Falling, Input, LEDMode, Output, Rising, Rule, RuleEngine, SetLED, SetOutput
+
+
+def test_rule_fires_on_state_changes(run):
+    async def scenario(ctrl):
+        engine = RuleEngine(ctrl)
+        rule = engine.add(Rule(Below(Input.I1, 100), then=[SetOutput(Output.O1, 100), SetLED(LEDMode.BLUE)],
+                               otherwise=[SetOutput(Output.O1, 0), SetLED(LEDMode.YELLOW)]))
+        engine.start()
+        states = []
+        for value in (50, 60, 200, 30):
+            ctrl.inject(Input.I1, value)
+            await asyncio.sleep(0.01)
+            states.append((ctrl.outputs[Output.O1], ctrl._led))
+        engine.stop()
+        ctrl.inject(Input.I1, 500)
+        await asyncio.sleep(0.01)
+        return states, rule.fired, ctrl.outputs[Output.O1]
+
+    states, fired, after = run(scenario)
+    assert states == [(100, LEDMode.BLUE), (100, LEDMode.BLUE), (0, LEDMode.YELLOW), (100, LEDMode.BLUE)]
+    assert fired == 3 and after == 100
+
+
+def test_conditions():
+    values = [0, 0, 0, 0]
+
+    def evaluate(condition, samples):
+        predicate = condition._compile()
+        result = []
+        previous = 0
+        for value in samples:
+            values[0] = value
+            result.append(predicate(values, 0, previous))
+            previous = value
+        return result
+
+    assert evaluate(Above(Input.I1, 10, hysteresis=5), [11, 8, 4, 12]) == [True, True, False, True]
+    assert evaluate(Between(Input.I1, 5, 10), [4, 5, 10, 11]) == [False, True, True, False]
+    assert evaluate(Rising(Input.I1, 10), [5, 11, 12, 9, 20]) == [False, True, False, False, True]
+    assert evaluate(Falling(Input.I1, 10), [20, 5, 4]) == [False, True, False]
+    assert evaluate(Above(Input.I1, 10) & ~Above(Input.I1, 20), [5, 15, 25]) == [False, True, False]
+    assert evaluate(Below(Input.I1, 5) | Above(Input.I1, 20), [3, 10, 25]) == [True, False, True]
+
+
+def test_adding_a_rule_does_not_refire_active_rules(run):
+    async def scenario(ctrl):
+        engine = RuleEngine(ctrl)
+        hot = engine.add(Rule(Above(Input.I1, 500), then=[SetOutput(Output.O1, 50)], otherwise=[SetOutput(Output.O1, 0)]))
+        engine.start()
+        ctrl.inject(Input.I1, 800)
+        await asyncio.sleep(0.01)
+        fired = hot.fired
+        engine.add(Rule(Above(Input.I2, 500), then=[SetOutput(Output.O2, 50)]))
+        ctrl.inject(Input.I1, 900)
+        await asyncio.sleep(0.01)
+        engine.stop()
+        return fired, hot.fired
+
+    assert run(scenario) == (1, 1)
+
+
+def test_rules_honour_the_safety_latch(run):
+    async def scenario(ctrl):
+        engine = RuleEngine(ctrl)
+        engine.add(Rule(Above(Input.I1, 500), then=[SetOutput(Output.O1, 50)]))
+        engine.start()
+        ctrl._set_safety_latch(True)
+        ctrl.inject(Input.I1, 800)
+        await asyncio.sleep(0.01)
+        engine.stop()
+        return ctrl.outputs[Output.O1]
+
+    assert run(scenario) == 0
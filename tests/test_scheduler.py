@@ -0,0 +1,113 @@
+import asyncio
+
+from btsmart import Dimmer, MotorXS, Output, TimerWheel
+
+
+def test_actions_fire_in_order(run):
+    async def scenario(ctrl):
+        wheel = TimerWheel(resolution=0.005)
+        fired = []
+        wheel.schedule(0.03, fired.append, "late")
+        wheel.schedule(0.01, fired.append, "early")
+        await asyncio.sleep(0.06)
+        return fired, len(wheel)
+
+    assert run(scenario) == (["early", "late"], 0)
+
+
+def test_cancelled_action_does_not_fire(run):
+    async def scenario(ctrl):
+        wheel = TimerWheel(resolution=0.005)
+        fired = []
+        handle = wheel.schedule(0.01, fired.append, 1)
+        handle.cancel()
+        await asyncio.sleep(0.03)
+        return fired, handle.cancelled()
+
+    assert run(scenario) == ([], True)
+
+
+def test_async_callbacks_are_kept_until_done(run):
+    async def scenario(ctrl):
+        wheel = TimerWheel(resolution=0.005)
+        done = []
+
+        async def action():
+            await asyncio.sleep(0.02)
+            done.append(True)
+
+        wheel.schedule(0.005, action)
+        await asyncio.sleep(0.02)
+        running = len(wheel.tasks)
+        await asyncio.sleep(0.05)
+        return running, len(wheel.tasks), done
+
+    assert run(scenario) == (1, 0, [True])
+
+
+def test_writes_of_one_tick_are_combined(run):
+    async def scenario(ctrl):
+        wheel = ctrl.timers
+        wheel.schedule_output(ctrl, Output.O1, 10, 0.01)
+        wheel.schedule_output(ctrl, Output.O1, 20, 0.01)
+        wheel.schedule_output(ctrl, Output.O2, 30, 0.01)
+        await asyncio.sleep(0.05)
+        return ctrl.writes
+
+    assert sorted(run(scenario), key=lambda w: w[0].value) == [(Output.O1, 20), (Output.O2, 30)]
+
+
+def test_sleep(run):
+    async def scenario(ctrl):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await ctrl.timers.sleep(0.02)
+        return loop.time() - start
+
+    assert run(scenario) >= 0.015
+
+
+def test_cancel_all_wakes_sleepers(run):
+    async def scenario(ctrl):
+        sleeper = asyncio.get_running_loop().create_task(ctrl.timers.sleep(10.0))
+        await asyncio.sleep(0.01)
+        sleepers = ctrl.timers.cancel_all()
+        await asyncio.wait_for(asyncio.wait([sleeper]), 0.5)
+        return sleepers == [sleeper], sleeper.cancelled(), len(ctrl.timers)
+
+    assert run(scenario) == (True, True, 0)
+
+
+def test_blink_switches_via_the_wheel(run):
+    async def scenario(ctrl):
+        dimmer = Dimmer()
+        dimmer.attach(ctrl, Output.O1)
+        await dimmer.blink(80, 0.02, count=2)
+        return ctrl.writes
+
+    assert run(scenario) == [(Output.O1, 80), (Output.O1, 0), (Output.O1, 80), (Output.O1, 0)]
+
+
+def test_blink_does_not_switch_off_a_new_level(run):
+    async def scenario(ctrl):
+        dimmer = Dimmer()
+        dimmer.attach(ctrl, Output.O1)
+        blink = asyncio.get_running_loop().create_task(dimmer.blink(100, 0.1))
+        await asyncio.sleep(0.02)
+        await dimmer.set_level(50)
+        await blink
+        return ctrl.outputs[Output.O1]
+
+    assert run(scenario) == 50
+
+
+def test_timed_motor_run_stops(run):
+    async def scenario(ctrl):
+        motor = MotorXS()
+        motor.attach(ctrl, Output.O2)
+        await motor.run_at(2500, time=0.05, wait=False)
+        running = ctrl.outputs[Output.O2]
+        await asyncio.sleep(0.1)
+        return running, ctrl.outputs[Output.O2]
+
+    assert run(scenario) == (50, 0)
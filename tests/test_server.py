@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from btsmart import BTSmartController_Remote, ControllerServer, Input, InputMode, LEDMode, Output
+from btsmart.backend_remote import _HEADER
+
+
+def test_remote_round_trip(run, tmp_path):
+    address = "unix:" + str(tmp_path / "btsmart.sock")
+
+    async def scenario(ctrl):
+        server = ControllerServer(ctrl, address)
+        await server.start()
+        remote = BTSmartController_Remote(address)
+        try:
+            await remote.connect()
+            await remote.set_led(LEDMode.GREEN)
+            await remote.set_input_mode(Input.I2, InputMode.VOLTAGE)
+            await remote.set_output_value(Output.O1, -40)
+            ctrl.values[Input.I2.value] = 1234
+            state = (remote.id, await remote.get_led(), await remote.get_input_mode(Input.I2),
+                     (await remote.get_input_value(Input.I2)).value, await remote.get_output_value(Output.O1),
+                     await remote.get_battery_level(), await remote.get_device_information())
+            stream = remote.stream(inputs=[Input.I3])
+            ctrl.inject(Input.I3, 77)
+            sample = await asyncio.wait_for(stream.__anext__(), 1.0)
+            stream.close()
+            return state, (sample.input, sample.value), ctrl.outputs[Output.O1]
+        finally:
+            await remote.disconnect()
+            await server.close()
+
+    state, sample, output = run(scenario)
+    assert state == ("fake:test", LEDMode.GREEN, InputMode.VOLTAGE, 1234, -40, 100, {"name": "fake"})
+    assert sample == (Input.I3, 77)
+    assert output == -40
+
+
+def test_outputs_are_owned_by_one_client(run, tmp_path):
+    address = "unix:" + str(tmp_path / "btsmart.sock")
+
+    async def scenario(ctrl):
+        server = ControllerServer(ctrl, address)
+        await server.start()
+        first = BTSmartController_Remote(address)
+        second = BTSmartController_Remote(address)
+        try:
+            await first.connect()
+            await second.connect()
+            await first.set_output_value(Output.O2, 60)
+            with pytest.raises(Exception):
+                await second.set_output_value(Output.O2, 30)
+            await second.set_output_value(Output.O2, 0)
+            await first.release_output(Output.O2)
+            await second.set_output_value(Output.O2, 30)
+            return ctrl.outputs[Output.O2]
+        finally:
+            await first.disconnect()
+            await second.disconnect()
+            await server.close()
+
+    assert run(scenario) == 30
+
+
+class _Writer:
+    def __init__(self) -> None:
+        self.frames = []
+
+    def write(self, frame) -> None:
+        self.frames.append(frame)
+
+
+def test_request_ids_skip_the_unsolicited_id():
+    async def scenario():
+        remote = BTSmartController_Remote("unix:/nonexistent")
+        remote._writer = _Writer()
+        remote._rid = 0xFFFE
+        requests = [asyncio.get_running_loop().create_task(remote.get_battery_level()) for _ in range(3)]
+        await asyncio.sleep(0)
+        for request in requests:
+            request.cancel()
+        return [_HEADER.unpack_from(frame)[2] for frame in remote._writer.frames]
+
+    assert asyncio.run(scenario()) == [0xFFFF, 1, 2]
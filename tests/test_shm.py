@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from btsmart import Input, InputMode, LEDMode, Output
+from btsmart.shm import _SEQ, _SEQ_OFFSET, BTSmartController_SharedView, SharedStatePublisher
+
+
+def test_view_reads_the_published_state(run, tmp_path):
+    path = str(tmp_path / "state")
+
+    async def scenario(ctrl):
+        publisher = SharedStatePublisher(ctrl, path)
+        view = BTSmartController_SharedView(path)
+        await ctrl.set_led(LEDMode.GREEN)
+        await ctrl.set_input_mode(Input.I1, InputMode.VOLTAGE)
+        await ctrl.set_output_value(Output.O2, -25)
+        ctrl.inject(Input.I1, 4711)
+        snap = view.snapshot()
+        state = (view.id, await view.get_led(), await view.get_input_mode(Input.I1),
+                 (await view.get_input_value(Input.I1)).value, await view.get_output_value(Output.O2))
+        with pytest.raises(Exception):
+            await view.set_output_value(Output.O2, 0)
+        with pytest.raises(Exception):
+            await view.get_battery_level()
+        publisher.close()
+        return state, snap.seq % 2, snap.timestamps[Input.I1.value] > 0
+
+    assert run(scenario) == (("fake:test", LEDMode.GREEN, InputMode.VOLTAGE, 4711, -25), 0, True)
+
+
+def test_view_raises_input_events(run, tmp_path):
+    path = str(tmp_path / "state")
+
+    async def scenario(ctrl):
+        publisher = SharedStatePublisher(ctrl, path)
+        view = BTSmartController_SharedView(path)
+        view.POLL_INTERVAL = 0.001
+        await view.connect()
+        stream = view.stream(inputs=[Input.I4])
+        ctrl.inject(Input.I4, 99)
+        sample = await asyncio.wait_for(stream.__anext__(), 1.0)
+        await view.disconnect()
+        publisher.close()
+        return sample.value, view.is_connected(), ctrl._sinks
+
+    assert run(scenario) == (99, False, [])
+
+
+def test_snapshot_gives_up_during_an_endless_update(run, tmp_path):
+    path = str(tmp_path / "state")
+
+    async def scenario(ctrl):
+        publisher = SharedStatePublisher(ctrl, path)
+        view = BTSmartController_SharedView(path)
+        view.MAX_RETRIES = 100
+        seq = view.snapshot().seq
+        # the publisher stopped in the middle of an update
+        _SEQ.pack_into(publisher._mm, _SEQ_OFFSET, seq + 1)
+        with pytest.raises(Exception):
+            view.snapshot()
+        _SEQ.pack_into(publisher._mm, _SEQ_OFFSET, seq + 2)
+        recovered = view.snapshot().seq
+        publisher.close()
+        return recovered - seq
+
+    assert run(scenario) == 2
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from btsmart import Input, SampleSink
+from btsmart.stream import DROP_NEWEST, ERROR
+
+
+def test_samples_are_streamed_in_order(run):
+    async def scenario(ctrl):
+        received = []
+        async with ctrl.stream(inputs=[Input.I1]) as stream:
+            for value in (10, 20, 30):
+                ctrl.inject(Input.I1, value)
+                ctrl.inject(Input.I2, value)
+            async for sample in stream:
+                received.append((sample.input, sample.value))
+                if len(received) == 3:
+                    break
+        return received, ctrl._sinks
+
+    assert run(scenario) == ([(Input.I1, 10), (Input.I1, 20), (Input.I1, 30)], [])
+
+
+def test_batches_and_columns(run):
+    async def scenario(ctrl):
+        stream = ctrl.stream(batch=3, columns=True)
+        for value in range(5):
+            ctrl.inject(Input.I3, value)
+        inputs, values, timestamps = await stream.__anext__()
+        stream.close()
+        rest = await stream.__anext__()
+        return list(inputs), list(values), list(timestamps) == sorted(timestamps), list(rest[1])
+
+    assert run(scenario) == ([2, 2, 2], [0, 1, 2], True, [3, 4])
+
+
+def test_partial_batch_after_max_latency(run):
+    async def scenario(ctrl):
+        stream = ctrl.stream(batch=10, max_latency=0.02)
+        ctrl.inject(Input.I1, 5)
+        batch = await asyncio.wait_for(stream.__anext__(), 0.5)
+        stream.close()
+        return [s.value for s in batch]
+
+    assert run(scenario) == [5]
+
+
+def test_overflow_policies(run):
+    async def scenario(ctrl):
+        newest = ctrl.stream(maxsize=2, overflow=DROP_NEWEST)
+        failing = ctrl.stream(maxsize=2, overflow=ERROR)
+        for value in range(3):
+            ctrl.inject(Input.I1, value)
+        kept = [(await newest.__anext__()).value for _ in range(2)]
+        with pytest.raises(Exception):
+            await failing.__anext__()
+        return kept, newest.dropped
+
+    assert run(scenario) == ([0, 1], 1)
+
+
+def test_custom_sink(run):
+    class Collector(SampleSink):
+        def __init__(self):
+            super().__init__([Input.I4])
+            self.samples = []
+
+        def push(self, sample):
+            self.samples.append(sample.value)
+
+    async def scenario(ctrl):
+        sink = Collector()
+        ctrl.add_sink(sink)
+        ctrl.add_sink(sink)
+        ctrl.inject(Input.I4, 1)
+        ctrl.inject(Input.I1, 2)
+        ctrl.remove_sink(sink)
+        ctrl.inject(Input.I4, 3)
+        return sink.samples
+
+    assert run(scenario) == [1]
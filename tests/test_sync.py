@@ -0,0 +1,64 @@
+import threading
+
+import pytest
+
+from btsmart import Input, Output, SyncController
+
+from conftest import FakeController
+
+
+@pytest.fixture
+def sync():
+    sync = SyncController(FakeController(), timeout=2.0)
+    sync.connect()
+    yield sync
+    sync.close()
+
+
+def test_blocking_calls(sync):
+    sync.set_output_value(Output.O1, 50)
+    assert sync.controller.writes == [(Output.O1, 50)]
+    sync.controller.values[Input.I2.value] = 123
+    assert sync.get_input_value(Input.I2).value == 123
+    assert sync.bulk([("set_output_value", Output.O2, -20), ("get_input_value", Input.I2)])[1].value == 123
+    assert sync.controller.outputs[Output.O2] == -20
+    with pytest.raises(Exception):
+        sync.set_output_value(Output.O1, 1000)
+
+
+def test_callbacks_on_thread_pool(sync):
+    received = []
+    done = threading.Event()
+    def changed(input, value):
+        received.append((input, value, threading.current_thread().name))
+        done.set()
+    sync.on_input_change(Input.I1, changed)
+    sync.inject(Input.I1, 42)
+    assert done.wait(2.0)
+    input, value, thread = received[0]
+    assert (input, value) == (Input.I1, 42)
+    assert thread.startswith("BTSmartController callback")
+
+
+def test_no_blocking_call_on_loop_thread(sync):
+    async def nested(input, value):
+        try:
+            sync.get_battery_level()
+        except Exception as ex:
+            errors.append(ex)
+        done.set()
+    errors = []
+    done = threading.Event()
+    sync.on_input_change(Input.I1, nested)
+    sync.inject(Input.I1, 1)
+    assert done.wait(2.0)
+    assert "loop thread" in str(errors[0])
+
+
+def test_context_manager_disconnects():
+    ctrl = FakeController()
+    with SyncController(ctrl, timeout=2.0) as sync:
+        sync.connect()
+        assert ctrl.is_connected()
+    assert not ctrl.is_connected()
+    assert sync.loop.is_closed()
@@ -0,0 +1,33 @@
+import pytest
+
+from btsmart import Input, aligned_snapshot
+from btsmart.timesync import resample
+
+from conftest import FakeController
+
+
+def test_resample_holds_the_last_value():
+    samples = [(100, 1), (200, 5), (400, 9)]
+    assert resample(samples, [50, 100, 150, 300, 399, 400, 1000]) == [None, 1, 1, 5, 5, 9, 9]
+    assert resample([], [0, 1]) == [None, None]
+
+
+def test_aligned_snapshot_of_several_controllers():
+    a = FakeController("fake:a")
+    b = FakeController("fake:b")
+    a._publish_sample(Input.I1, 10, 1_000_000)
+    a._publish_sample(Input.I1, 20, 25_000_000)
+    b._publish_sample(Input.I1, 30, 12_000_000)
+    snapshot = aligned_snapshot([a, b], 0.01, 0.03, end=30_000_000, inputs=[Input.I1])
+    assert snapshot.times == [0, 10_000_000, 20_000_000, 30_000_000]
+    assert snapshot.values[("fake:a", Input.I1)] == [None, 10, 10, 20]
+    assert snapshot.values[("fake:b", Input.I1)] == [None, None, 30, 30]
+    assert snapshot.at(3) == {("fake:a", Input.I1): 20, ("fake:b", Input.I1): 30}
+    assert len(snapshot) == 4
+
+
+def test_invalid_grid():
+    with pytest.raises(Exception):
+        aligned_snapshot([], 1e-12, 1.0)
+    with pytest.raises(Exception):
+        aligned_snapshot([], 0.1, -1.0)
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from btsmart import LinkHealthMonitor, MotorXS, Output, SafetyWatchdog
+from btsmart.backend_usb import BTSmartFTDI, BTSmartController_USB
+from btsmart.health import LATENCY
+
+
+def test_missed_heartbeat_latches_outputs(run):
+    async def scenario(ctrl):
+        motor = MotorXS()
+        motor.attach(ctrl, Output.O1)
+        watchdog = SafetyWatchdog(ctrl, timeout=0.05)
+        events = []
+        watchdog.on_trip(events.append)
+        watchdog.arm()
+        running = asyncio.get_running_loop().create_task(motor.run_at(2500, time=5.0))
+        await asyncio.sleep(0.2)
+        tripped, latched = watchdog.is_tripped(), ctrl._safety_latched
+        outputs = dict(ctrl.outputs)
+        with pytest.raises(Exception):
+            await ctrl.set_output_value(Output.O1, 50)
+        await ctrl.set_output_value(Output.O1, 0)
+        watchdog.arm()
+        await ctrl.set_output_value(Output.O1, 50)
+        watchdog.disarm()
+        # the timed run waiting on the timer wheel is woken, not left hanging
+        return tripped, latched, outputs, running.done(), [e.reason for e in events]
+
+    assert run(scenario) == (True, True, {Output.O1: 0, Output.O2: 0}, True, ["deadline"])
+
+
+def test_degraded_link_trips_the_watchdog(run):
+    async def scenario(ctrl):
+        monitor = LinkHealthMonitor(ctrl, probe_interval=0.01, latency=0.01, smoothing=1.0)
+        degraded = []
+        monitor.on_degraded(degraded.append)
+        watchdog = SafetyWatchdog(ctrl, timeout=10.0, monitor=monitor)
+        watchdog.arm()
+        await ctrl.set_output_value(Output.O2, 80)
+        ctrl.latency = 0.02
+        await monitor.check()
+        await asyncio.sleep(0.1)
+        watchdog.disarm()
+        return watchdog.last_event.reason, ctrl.outputs[Output.O2], len(degraded)
+
+    assert run(scenario) == (LATENCY, 0, 1)
+
+
+class _FakeFtdi:
+    """answers every frame with an empty response (no error)"""
+
+    def __init__(self) -> None:
+        self.frames = []
+
+    def write_data(self, msg):
+        self.frames.append(bytes(msg))
+        return len(msg)
+
+    def read_data_bytes(self, length, attempts):
+        resp = bytearray(length)
+        if length == 28:
+            for i in range(4):
+                resp[8 + 4 * i] = i
+        return resp
+
+
+def test_usb_output_frames_are_refused_while_latched():
+    async def scenario():
+        ftdi = _FakeFtdi()
+        ctrl = BTSmartController_USB(BTSmartFTDI(ftdi))
+        await ctrl.set_output_value(Output.O1, 30)
+        ctrl._set_safety_latch(True)
+        ctrl._emergency_stop(asyncio.get_running_loop(), 1.0)
+        sent = len(ftdi.frames)
+        with pytest.raises(Exception):
+            await ctrl.set_output_value(Output.O1, 30)
+        with pytest.raises(Exception):
+            ctrl.dev._set_output(Output.O1.value, 30, ctrl._check_output)
+        return sent == len(ftdi.frames), ctrl._output_values
+
+    assert asyncio.run(scenario()) == (True, {Output.O1: 0, Output.O2: 0})
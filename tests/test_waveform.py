@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+from btsmart import Dimmer, MotorXS, Output
+from btsmart.waveform import EASE_IN_OUT, LINEAR, PWM, Ramp, SampleTable, Sine
+
+
+def test_ramp_levels():
+    ramp = Ramp(0, 100, 2.0)
+    assert [ramp.level(t) for t in (-1.0, 0.0, 0.5, 1.0, 2.0, 3.0)] == [0, 0, 25, 50, 100, 100]
+    eased = Ramp(0, 100, 2.0, EASE_IN_OUT)
+    assert eased.level(0.2) < ramp.level(0.2) and eased.level(1.0) == pytest.approx(50)
+
+
+def test_periodic_levels():
+    sine = Sine(50, 20, 4.0)
+    assert [round(sine.level(t)) for t in (0.0, 1.0, 2.0, 3.0)] == [50, 70, 50, 30]
+    pwm = PWM(80, 1.0, duty=0.25)
+    assert [pwm.level(t) for t in (0.0, 0.2, 0.3, 1.1, 1.5)] == [80, 80, 0, 80, 0]
+
+
+def test_sample_table():
+    table = SampleTable([0, 10, 30], 1.0)
+    assert table.duration == 2.0
+    assert [table.level(t) for t in (0.0, 0.5, 1.5, 5.0)] == [0, 5, 20, 30]
+    held = SampleTable([0, 10], 1.0, loop=True, interpolate=False)
+    assert held.duration is None and [held.level(t) for t in (0.5, 1.5, 2.5)] == [0, 10, 0]
+
+
+def test_invalid_waveforms():
+    with pytest.raises(Exception):
+        Sine(0, 10, 0.0)
+    with pytest.raises(Exception):
+        PWM(100, 1.0, duty=1.5)
+    with pytest.raises(Exception):
+        SampleTable([], 1.0)
+
+
+def test_play_skips_unchanged_levels(run):
+    async def scenario(ctrl):
+        dimmer = Dimmer()
+        dimmer.attach(ctrl, Output.O1)
+        await dimmer.play(PWM(60, 0.2, duration=0.3))
+        return [value for output, value in ctrl.writes], dimmer.lastValue
+
+    writes, last = run(scenario)
+    assert writes == [60, 0, 60]
+    assert last == 60
+
+
+def test_fade_is_bounded_by_the_update_rate(run):
+    async def scenario(ctrl):
+        dimmer = Dimmer()
+        dimmer.attach(ctrl, Output.O1)
+        await dimmer.fade(100, 0.3, LINEAR)
+        return [value for output, value in ctrl.writes]
+
+    writes = run(scenario)
+    assert writes[-1] == 100
+    assert writes == sorted(writes)
+    assert len(writes) <= 0.3 * 20.0 + 2
+
+
+def test_new_action_stops_the_waveform(run):
+    async def scenario(ctrl):
+        dimmer = Dimmer()
+        dimmer.attach(ctrl, Output.O1)
+        await dimmer.play(Sine(50, 40, 0.2), wait=False)
+        await asyncio.sleep(0.1)
+        await dimmer.set_level(10)
+        count = len(ctrl.writes)
+        await asyncio.sleep(0.2)
+        return count == len(ctrl.writes), ctrl.outputs[Output.O1]
+
+    assert run(scenario) == (True, 10)
+
+
+def test_blink_keeps_the_written_level(run):
+    async def scenario(ctrl):
+        dimmer = Dimmer()
+        dimmer.attach(ctrl, Output.O1)
+        await dimmer.blink(70, 0.05, wait=False)
+        during = dimmer.lastValue
+        await asyncio.sleep(0.1)
+        return during, dimmer.lastValue, ctrl.outputs[Output.O1]
+
+    assert run(scenario) == (70, 0, 0)
+
+
+def test_blink_does_not_override_a_takeover(run):
+    async def scenario(ctrl):
+        dimmer = Dimmer()
+        dimmer.attach(ctrl, Output.O1)
+        blink = asyncio.get_running_loop().create_task(dimmer.blink(100, 0.1))
+        await asyncio.sleep(0.02)
+        await dimmer.fade(50, 0.05)
+        await blink
+        return ctrl.outputs[Output.O1], dimmer.lastValue
+
+    assert run(scenario) == (50, 50)
+
+
+def test_soft_start_is_not_stopped_after_a_takeover(run):
+    async def scenario(ctrl):
+        motor = MotorXS()
+        motor.attach(ctrl, Output.O2)
+        running = asyncio.get_running_loop().create_task(motor.run_at(5000, time=0.2, ramp=0.1))
+        await asyncio.sleep(0.05)
+        await motor.run_at(2500)
+        await running
+        return ctrl.outputs[Output.O2]
+
+    assert run(scenario) == 50